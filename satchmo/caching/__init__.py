@@ -3,9 +3,21 @@
 from django.conf import settings
 
 from django.core.cache import cache
+from django.db import connections, transaction
 from django.utils.encoding import smart_str
+import asyncio
+import contextvars
+import functools
 import pickle
 import logging
+import threading
+import time
+import uuid
+import zlib
+from satchmo.caching.breaker import CircuitBreaker
+from satchmo.caching.hotkeys import HotKeyDetector
+from satchmo.caching.lru import LRUCache
+from satchmo.caching.stats import CacheStats
 from satchmo.utils import is_string_like, is_list_or_tuple
 
 
@@ -13,17 +25,45 @@ import hashlib
 
 log = logging.getLogger(__name__)
 
-CACHED_KEYS = {}
-CACHE_CALLS = 0
-CACHE_HITS = 0
 KEY_DELIM = "::"
+GENERATION_DELIM = "@"
 TIMEOUT = 300
+LOCK_TIMEOUT = 30
+LOCK_POLL = 0.05
+# memcached refuses items over 1MB
+MAX_VALUE_SIZE = 1024 * 1024
+
+# The in-process first tier.  It tracks every key this process has set or
+# seen, bounded by CACHE_L1_SIZE, and serves values only for namespaces which
+# have been given an L1 timeout.
+LOCAL_CACHE = LRUCache(getattr(settings, "CACHE_L1_SIZE", 1000))
+
+# Generation counters read from the shared cache, kept for
+# CACHE_GENERATION_TIMEOUT seconds (0 disables).
+GENERATIONS = LRUCache(getattr(settings, "CACHE_L1_SIZE", 1000))
+
+# Flushed to the backend through BREAKER.
+STATS = CacheStats(backend=lambda method, *args: _call_backend(method, *args))
+
+# Samples the keys read, see hotkeys.py.
+HOTKEYS = HotKeyDetector()
+
+# Bypasses the backend while it is not responding, see breaker.py.
+BREAKER = CircuitBreaker(probe=lambda: cache.get("::breaker::probe"))
+
+# Counters as last read from the backend, used while it is bypassed.
+_COUNTERS = {}
+
+# The values read or set during the current request, a dict of key ->
+# CacheWrapper while RequestCacheMiddleware is handling a request.
+REQUEST_CACHE = contextvars.ContextVar("satchmo_request_cache", default=None)
 
 
 class CacheWrapper(object):
-    def __init__(self, val, inprocess=False):
+    def __init__(self, val, inprocess=False, refresh_at=None):
         self.val = val
         self.inprocess = inprocess
+        self.refresh_at = refresh_at
 
     def __str__(self):
         return str(self.val)
@@ -39,6 +79,28 @@ class CacheWrapper(object):
 
     wrap = classmethod(wrap)
 
+    def is_stale(self):
+        """True once the soft timeout of the value has passed."""
+        refresh_at = getattr(self, "refresh_at", None)
+        return refresh_at is not None and refresh_at <= time.time()
+
+
+class PackedValue(object):
+    """A pickled CacheWrapper as sent to the backend, zlib compressed if it
+    was at least CACHE_COMPRESS_MIN_SIZE bytes."""
+
+    __slots__ = ("data", "compressed")
+
+    def __init__(self, data, compressed=False):
+        self.data = data
+        self.compressed = compressed
+
+    def unpack(self):
+        data = self.data
+        if self.compressed:
+            data = zlib.decompress(data)
+        return pickle.loads(data)
+
 
 class MethodNotFinishedError(Exception):
     def __init__(self, f):
@@ -51,42 +113,44 @@ class NotCachedError(Exception):
 
 
 class CacheNotRespondingError(Exception):
+    """Raised for a call to the cache backend while BREAKER is open, or when
+    the backend raises an error."""
+
     pass
 
 
 def cache_delete(*keys, **kwargs):
+    """Delete a key, and optionally its children, from the cache.  Called
+    without keys it deletes every key.
+
+    Inside a transaction the key is deleted straight away and again once the
+    transaction commits, so that a value cached from the old data by another
+    process in the meantime does not survive the commit.
+    """
     removed = []
-    global CACHED_KEYS
     log.debug("cache_delete")
     children = kwargs.pop("children", False)
 
     if keys or kwargs:
         key = cache_key(*keys, **kwargs)
+        _delete_on_commit(key, children)
+        if not BREAKER.closed:
+            BYPASSED_DELETES.add(key, children)
 
-        if key in CACHED_KEYS:
-            del CACHED_KEYS[key]
-            removed.append(key)
-
-        cache.delete(key)
-
+        _backend("delete", backend_key(key))
         if children:
-            key = key + KEY_DELIM
-            children = [x for x in list(CACHED_KEYS.keys()) if x.startswith(key)]
-            for k in children:
-                del CACHED_KEYS[k]
-                cache.delete(k)
-                removed.append(k)
+            bump_generation(key)
+        removed = _delete_local(key, children)
     else:
         key = "All Keys"
-        deleteneeded = _cache_flush_all()
-
-        removed = list(CACHED_KEYS.keys())
+        _cache_flush_all()
 
-        if deleteneeded:
-            for k in CACHED_KEYS:
-                cache.delete(k)
-
-        CACHED_KEYS = {}
+        removed = LOCAL_CACHE.keys()
+        LOCAL_CACHE.clear()
+        GENERATIONS.clear()
+        memo = REQUEST_CACHE.get()
+        if memo is not None:
+            memo.clear()
 
     if removed:
         log.debug("Cache delete: %s", removed)
@@ -95,18 +159,83 @@ def cache_delete(*keys, **kwargs):
     return removed
 
 
+def _delete_local(key, children):
+    """Remove `key` from this process, returning the keys removed from the
+    local tier."""
+    removed = []
+    if LOCAL_CACHE.delete(key):
+        removed.append(key)
+    _forget(key)
+    STATS.incr(key_namespace(key), "deletes")
+
+    if children:
+        # Children in every process are orphaned by moving the key on to its
+        # next generation, only the local tier needs to be searched.
+        key = key + KEY_DELIM
+        for k in [x for x in LOCAL_CACHE.keys() if x.startswith(key)]:
+            LOCAL_CACHE.delete(k)
+            removed.append(k)
+        memo = REQUEST_CACHE.get()
+        if memo is not None:
+            for k in [x for x in memo if x.startswith(key)]:
+                del memo[k]
+    return removed
+
+
+class PendingDeletes(object):
+    """The keys to delete again when a transaction commits, or once the
+    backend recovers.  Each key is only deleted once however often it was
+    deleted in the meantime."""
+
+    def __init__(self):
+        self.keys = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, children):
+        with self._lock:
+            self.keys[key] = self.keys.get(key, False) or children
+
+    def __call__(self):
+        with self._lock:
+            keys, self.keys = self.keys, {}
+        for key, children in keys.items():
+            cache_delete(key, children=children)
+
+
+# The keys deleted while BREAKER was open, deleted again once it recovers.
+BYPASSED_DELETES = PendingDeletes()
+BREAKER.on_recover = BYPASSED_DELETES
+
+
+def _delete_on_commit(key, children):
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return
+
+    # A rolled back savepoint drops its on_commit callbacks, so check that
+    # ours is still registered.
+    pending = getattr(connection, "satchmo_cache_deletes", None)
+    if pending is None or not any(
+        entry[1] is pending for entry in connection.run_on_commit
+    ):
+        pending = PendingDeletes()
+        connection.satchmo_cache_deletes = pending
+        transaction.on_commit(pending)
+
+    pending.add(key, children)
+
+
 def cache_delete_function(func):
     return cache_delete(["func", func.__name__, func.__module__], children=True)
 
 
 def _cache_flush_all():
-    if is_memcached_backend():
-        cache._cache.flush_all()
-        return False
-    return True
+    """Empty the whole backend.  The local tier only tracks the keys this
+    process has seen recently, so deleting those would leave the rest."""
+    _backend("clear")
 
 
-def cache_function(length=TIMEOUT):
+def cache_function(length=TIMEOUT, soft_length=None, wait=5):
     """
     A variant of the snippet posted by Jeff Wheeler at
     http://www.djangosnippets.org/snippets/109/
@@ -118,39 +247,101 @@ def cache_function(length=TIMEOUT):
     The decorator itself takes a length argument, which is the number of
     seconds the cache will keep the result around.
 
-    It will put a temp value in the cache while the function is
-    processing. This should not matter in most cases, but if the app is using
-    threads, you won't be able to get the previous value, and will need to
-    wait until the function finishes. If this is not desired behavior, you can
-    remove the first two lines after the ``else``.
+    On a miss, only one caller at a time runs the function.  It takes a short
+    lock in the shared cache while doing so, and other callers wait up to
+    `wait` seconds for the result before giving up and running it themselves.
+
+    If `soft_length` is given, the value is refreshed in a background thread
+    once it is `soft_length` seconds old, and the previous value is returned
+    until the refresh has finished.  It should be less than `length`.
+
+    Coroutine functions are cached with the async API, and refreshed in a
+    background task rather than a thread.
     """
 
     def decorator(func):
-        def inner_func(*args, **kwargs):
-            try:
-                value = cache_get("func", func.__name__, func.__module__, args, kwargs)
-            except NotCachedError as e:
-                # This will set a temporary value while ``func`` is being
-                # processed. When using threads, this is vital, as otherwise
-                # the function can be called several times before it finishes
-                # and is put into the cache.
-                funcwrapper = CacheWrapper(
-                    ".".join([func.__module__, func.__name__]), inprocess=True
-                )
-                cache_set(e.key, value=funcwrapper, length=length, skiplog=True)
-                value = func(*args, **kwargs)
-                cache_set(e.key, value=value, length=length)
+        if asyncio.iscoroutinefunction(func):
+            return _acache_function(func, length, soft_length, wait)
 
-            except MethodNotFinishedError as e:
-                value = func(*args, **kwargs)
-
-            return value
+        def inner_func(*args, **kwargs):
+            key = cache_key("func", func.__name__, func.__module__, args, kwargs)
+
+            wrapper = _get_wrapper(key)
+            if wrapper is not None and not wrapper.inprocess:
+                if wrapper.is_stale() and _acquire_lock(key):
+                    log.debug("refreshing stale cache: %s", key)
+                    refresh = threading.Thread(
+                        target=_refresh_function,
+                        args=(key, func, args, kwargs, length, soft_length),
+                    )
+                    refresh.daemon = True
+                    refresh.start()
+                return wrapper.val
+
+            if _acquire_lock(key):
+                try:
+                    return _call_function(key, func, args, kwargs, length, soft_length)
+                finally:
+                    _release_lock(key)
+
+            # Someone else is running the function, wait for their result.
+            deadline = time.time() + wait
+            while time.time() < deadline:
+                time.sleep(LOCK_POLL)
+                wrapper = _get_wrapper(key)
+                if wrapper is not None and not wrapper.inprocess:
+                    return wrapper.val
+                if not _is_locked(key):
+                    break
+
+            log.debug("gave up waiting for cache: %s", key)
+            return _call_function(key, func, args, kwargs, length, soft_length)
 
         return inner_func
 
     return decorator
 
 
+def _call_function(key, func, args, kwargs, length, soft_length):
+    """Run `func` and cache its result under `key`."""
+    value = func(*args, **kwargs)
+    if soft_length is None:
+        refresh_at = None
+    else:
+        refresh_at = time.time() + soft_length
+    cache_set(key, value=CacheWrapper(value, refresh_at=refresh_at), length=length)
+    return value
+
+
+def _refresh_function(key, func, args, kwargs, length, soft_length):
+    """Thread target refreshing a stale cached function value."""
+    try:
+        _call_function(key, func, args, kwargs, length, soft_length)
+    except Exception:
+        log.exception("Could not refresh cache: %s", key)
+    finally:
+        _release_lock(key)
+        connections.close_all()
+
+
+def _lock_key(key):
+    return KEY_DELIM.join(["", "lock", key.lstrip(KEY_DELIM)])
+
+
+def _acquire_lock(key, length=LOCK_TIMEOUT):
+    """Atomically take the lock for computing `key`, returning True if this
+    caller got it."""
+    return _backend("add", _lock_key(key), True, length, fallback=True)
+
+
+def _is_locked(key):
+    return _backend("get", _lock_key(key)) is not None
+
+
+def _release_lock(key):
+    _backend("delete", _lock_key(key))
+
+
 def cache_get(*keys, **kwargs):
     if "default" in kwargs:
         default_value = kwargs.pop("default")
@@ -160,33 +351,76 @@ def cache_get(*keys, **kwargs):
 
     key = cache_key(keys, **kwargs)
 
-    global CACHE_CALLS, CACHE_HITS
-    CACHE_CALLS += 1
-
-    obj = cache.get(key)
-    if obj and isinstance(obj, CacheWrapper):
-        CACHE_HITS += 1
-        CACHED_KEYS[key] = True
-        log.debug("got cached [%i/%i]: %s", CACHE_CALLS, CACHE_HITS, key)
+    obj = _get_wrapper(key)
+    if obj is not None:
         if obj.inprocess:
             raise MethodNotFinishedError(obj.val)
 
         return obj.val
     else:
-        try:
-            del CACHED_KEYS[key]
-        except KeyError:
-            pass
-
         if use_default:
             return default_value
 
         raise NotCachedError(key)
 
 
+def _get_wrapper(key):
+    """Get the CacheWrapper for `key` from the local tier or the backend,
+    returning None on a miss."""
+    obj = _local_wrapper(key)
+    if obj is not None:
+        return obj
+    return _remote_wrapper(key)
+
+
+def _remote_wrapper(key):
+    """Get the CacheWrapper for `key` from the backend."""
+    start = time.time()
+    obj = _backend("get", backend_key(key))
+    STATS.timing(key_namespace(key), "get", time.time() - start)
+    return _found_wrapper(key, obj)
+
+
+def _local_wrapper(key):
+    """Get the CacheWrapper for `key` from the request memo or the local
+    tier, returning None if neither has it."""
+    namespace = key_namespace(key)
+    HOTKEYS.record(namespace, key)
+
+    memo = REQUEST_CACHE.get()
+    if memo is not None and key in memo:
+        STATS.incr(namespace, "request_hits")
+        return memo[key]
+
+    obj = LOCAL_CACHE.get(key, None)
+    if obj is not None:
+        STATS.incr(namespace, "local_hits")
+        log.debug("got local cached: %s", key)
+        _remember(key, obj)
+        return obj
+    return None
+
+
+def _found_wrapper(key, obj):
+    """Handle `obj` as read from the backend for `key`, returning its
+    CacheWrapper or None on a miss."""
+    namespace = key_namespace(key)
+    obj = _unpack(key, obj)
+    if isinstance(obj, CacheWrapper):
+        if not obj.inprocess:
+            LOCAL_CACHE.set(key, obj, local_timeout(key))
+            _remember(key, obj)
+        STATS.incr(namespace, "hits")
+        log.debug("got cached: %s", key)
+        return obj
+
+    STATS.incr(namespace, "misses")
+    LOCAL_CACHE.delete(key)
+    return None
+
+
 def cache_set(*keys, **kwargs):
     """Set an object into the cache."""
-    global CACHED_KEYS
     obj = kwargs.pop("value")
     length = kwargs.pop("length", TIMEOUT)
     skiplog = kwargs.pop("skiplog", False)
@@ -195,8 +429,434 @@ def cache_set(*keys, **kwargs):
     val = CacheWrapper.wrap(obj)
     if not skiplog:
         log.debug("setting cache: %s", key)
-    cache.set(key, val, length)
-    CACHED_KEYS[key] = True
+    namespace = key_namespace(key)
+    packed = _pack(key, val)
+    if packed is None:
+        cache_delete(key)
+        return
+
+    start = time.time()
+    _backend("set", backend_key(key), packed, length)
+    STATS.timing(namespace, "set", time.time() - start)
+    _set_local(key, val, length)
+
+
+def _set_local(key, val, length):
+    """Record that `val` was set for `key`, in the stats and this process."""
+    STATS.incr(key_namespace(key), "sets")
+    if val.inprocess:
+        local_length = 0
+        _forget(key)
+    else:
+        local_length = min(local_timeout(key), length)
+        _remember(key, val)
+    LOCAL_CACHE.set(key, val, local_length)
+
+
+def cache_get_many(keys):
+    """Get many objects from the cache in one call to the backend.
+
+    Each entry of `keys` is turned into a key by `cache_key`.  Returns a
+    tuple of a dict of key -> value for the hits, and a list of the keys
+    which missed.
+    """
+    keys = [cache_key(k) for k in keys]
+    memo = REQUEST_CACHE.get() or {}
+    hits = {}
+    remote = []
+    for key in keys:
+        HOTKEYS.record(key_namespace(key), key)
+        if key in memo:
+            STATS.incr(key_namespace(key), "request_hits")
+            hits[key] = memo[key].val
+            continue
+
+        obj = LOCAL_CACHE.get(key, None)
+        if obj is not None and not obj.inprocess:
+            STATS.incr(key_namespace(key), "local_hits")
+            hits[key] = obj.val
+            _remember(key, obj)
+        else:
+            remote.append(key)
+
+    if remote:
+        bkeys = backend_keys(remote)
+        start = time.time()
+        found = _backend("get_many", list(bkeys.values()), fallback={})
+        elapsed = time.time() - start
+        for namespace in set([key_namespace(key) for key in remote]):
+            STATS.timing(namespace, "get", elapsed)
+
+        for key in remote:
+            obj = _unpack(key, found.get(bkeys[key]))
+            if isinstance(obj, CacheWrapper) and not obj.inprocess:
+                LOCAL_CACHE.set(key, obj, local_timeout(key))
+                STATS.incr(key_namespace(key), "hits")
+                hits[key] = obj.val
+                _remember(key, obj)
+            else:
+                STATS.incr(key_namespace(key), "misses")
+                LOCAL_CACHE.delete(key)
+
+    misses = [key for key in keys if key not in hits]
+    log.debug("got %i cached, %i missed", len(hits), len(misses))
+    return hits, misses
+
+
+def cache_set_many(values, length=TIMEOUT, lengths=None):
+    """Set many objects into the cache.
+
+    `values` is a dict of key -> value, where each key is turned into a key
+    by `cache_key`.  `lengths` optionally gives a length for some of those
+    keys, the rest use `length`.  Keys sharing a length are set in one call
+    to the backend.
+    """
+    if lengths is None:
+        lengths = {}
+
+    by_length = {}
+    oversize = []
+    for keys, obj in values.items():
+        key = cache_key(keys)
+        val = CacheWrapper.wrap(obj)
+        packed = _pack(key, val)
+        if packed is None:
+            oversize.append(key)
+        else:
+            by_length.setdefault(lengths.get(keys, length), {})[key] = (val, packed)
+
+    for key in oversize:
+        cache_delete(key)
+
+    for key_length, wrapped in by_length.items():
+        bkeys = backend_keys(list(wrapped.keys()))
+        start = time.time()
+        _backend(
+            "set_many",
+            dict((bkeys[key], packed) for key, (val, packed) in wrapped.items()),
+            key_length,
+        )
+        elapsed = time.time() - start
+        for namespace in set([key_namespace(key) for key in wrapped]):
+            STATS.timing(namespace, "set", elapsed)
+
+        for key, (val, packed) in wrapped.items():
+            STATS.incr(key_namespace(key), "sets")
+            LOCAL_CACHE.set(key, val, min(local_timeout(key), key_length))
+            _remember(key, val)
+        log.debug("setting cache: %s", list(wrapped.keys()))
+
+
+async def acache_get(*keys, **kwargs):
+    """The async version of `cache_get`.  Values in the request memo or the
+    local tier are returned without touching the backend."""
+    if "default" in kwargs:
+        default_value = kwargs.pop("default")
+        use_default = True
+    else:
+        use_default = False
+
+    key = cache_key(keys, **kwargs)
+
+    obj = await _aget_wrapper(key)
+    if obj is not None:
+        if obj.inprocess:
+            raise MethodNotFinishedError(obj.val)
+
+        return obj.val
+    else:
+        if use_default:
+            return default_value
+
+        raise NotCachedError(key)
+
+
+async def _aget_wrapper(key):
+    obj = _local_wrapper(key)
+    if obj is not None:
+        return obj
+    if not _native_async():
+        return await _run_sync(_remote_wrapper, key)
+
+    start = time.time()
+    obj = await _abackend("get", await abackend_key(key))
+    STATS.timing(key_namespace(key), "get", time.time() - start)
+    return _found_wrapper(key, obj)
+
+
+async def acache_set(*keys, **kwargs):
+    """The async version of `cache_set`."""
+    if not _native_async():
+        return await _run_sync(functools.partial(cache_set, *keys, **kwargs))
+
+    obj = kwargs.pop("value")
+    length = kwargs.pop("length", TIMEOUT)
+    skiplog = kwargs.pop("skiplog", False)
+
+    key = cache_key(keys, **kwargs)
+    val = CacheWrapper.wrap(obj)
+    if not skiplog:
+        log.debug("setting cache: %s", key)
+    packed = _pack(key, val)
+    if packed is None:
+        await acache_delete(key)
+        return
+
+    start = time.time()
+    await _abackend("set", await abackend_key(key), packed, length)
+    STATS.timing(key_namespace(key), "set", time.time() - start)
+    _set_local(key, val, length)
+
+
+async def acache_delete(*keys, **kwargs):
+    """The async version of `cache_delete`.  Deleting every key is left to
+    `cache_delete`, run in the default executor, as is every delete if the
+    backend has no async methods."""
+    if not (keys or kwargs):
+        return await _run_sync(cache_delete)
+
+    children = kwargs.pop("children", False)
+    key = cache_key(*keys, **kwargs)
+    # with the caller's connection, which the executor threads do not share
+    _delete_on_commit(key, children)
+    if not _native_async():
+        return await _run_sync(functools.partial(cache_delete, key, children=children))
+
+    if not BREAKER.closed:
+        BYPASSED_DELETES.add(key, children)
+
+    await _abackend("delete", await abackend_key(key))
+    if children:
+        await abump_generation(key)
+    removed = _delete_local(key, children)
+
+    if removed:
+        log.debug("Cache delete: %s", removed)
+    else:
+        log.debug("No cached objects to delete for %s", key)
+    return removed
+
+
+async def abackend_key(key):
+    """The async version of `backend_key`."""
+    gen_keys = generation_keys(key)
+    gens, missing = _local_generations(gen_keys)
+    if missing:
+        _found_generations(
+            gens, missing, await _abackend("get_many", missing, fallback={})
+        )
+    return _stamp_generations(key, [gens[k] for k in gen_keys])
+
+
+async def abump_generation(key):
+    """The async version of `bump_generation`."""
+    gen_key = _generation_key(key)
+    GENERATIONS.delete(gen_key)
+    _forget(gen_key)
+    try:
+        return await _abackend("incr", gen_key)
+    except ValueError:
+        seed = _counter_seed()
+        if await _abackend("add", gen_key, seed, None):
+            return seed
+        return await _abackend("incr", gen_key)
+
+
+def _acache_function(func, length, soft_length, wait):
+    """`cache_function` for coroutine functions."""
+
+    async def inner_func(*args, **kwargs):
+        key = cache_key("func", func.__name__, func.__module__, args, kwargs)
+
+        wrapper = await _aget_wrapper(key)
+        if wrapper is not None and not wrapper.inprocess:
+            if wrapper.is_stale() and await _aacquire_lock(key):
+                log.debug("refreshing stale cache: %s", key)
+                asyncio.ensure_future(
+                    _arefresh_function(key, func, args, kwargs, length, soft_length)
+                )
+            return wrapper.val
+
+        if await _aacquire_lock(key):
+            try:
+                return await _acall_function(
+                    key, func, args, kwargs, length, soft_length
+                )
+            finally:
+                await _abackend("delete", _lock_key(key))
+
+        # Someone else is running the function, wait for their result.
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            await asyncio.sleep(LOCK_POLL)
+            wrapper = await _aget_wrapper(key)
+            if wrapper is not None and not wrapper.inprocess:
+                return wrapper.val
+            if await _abackend("get", _lock_key(key)) is None:
+                break
+
+        log.debug("gave up waiting for cache: %s", key)
+        return await _acall_function(key, func, args, kwargs, length, soft_length)
+
+    return inner_func
+
+
+async def _acall_function(key, func, args, kwargs, length, soft_length):
+    value = await func(*args, **kwargs)
+    if soft_length is None:
+        refresh_at = None
+    else:
+        refresh_at = time.time() + soft_length
+    await acache_set(
+        key, value=CacheWrapper(value, refresh_at=refresh_at), length=length
+    )
+    return value
+
+
+async def _arefresh_function(key, func, args, kwargs, length, soft_length):
+    try:
+        await _acall_function(key, func, args, kwargs, length, soft_length)
+    except Exception:
+        log.exception("Could not refresh cache: %s", key)
+    finally:
+        await _abackend("delete", _lock_key(key))
+
+
+async def _aacquire_lock(key, length=LOCK_TIMEOUT):
+    return await _abackend("add", _lock_key(key), True, length, fallback=True)
+
+
+def _backend(method, *args, **kwargs):
+    """Call `method` of the cache backend through BREAKER, returning
+    `fallback` instead if the backend is bypassed or raises an error."""
+    fallback = kwargs.pop("fallback", None)
+    try:
+        return _call_backend(method, *args)
+    except CacheNotRespondingError:
+        return fallback
+
+
+def _call_backend(method, *args):
+    if not BREAKER.allow():
+        raise CacheNotRespondingError(method)
+
+    start = time.time()
+    try:
+        result = getattr(cache, method)(*args)
+    except ValueError:
+        # incr of a missing key
+        BREAKER.record(time.time() - start)
+        raise
+    except Exception as e:
+        BREAKER.record(time.time() - start, error=True)
+        log.warning("cache backend %s failed: %s", method, e)
+        raise CacheNotRespondingError(method) from e
+
+    BREAKER.record(time.time() - start)
+    return result
+
+
+async def _abackend(method, *args, **kwargs):
+    """The async version of `_backend`, using the async version of `method`
+    where the backend has one (Django 4.0 and later), otherwise running it in
+    the default executor."""
+    fallback = kwargs.pop("fallback", None)
+    amethod = getattr(cache, "a" + method, None)
+    if amethod is None:
+        return await _run_sync(
+            functools.partial(_backend, method, *args, fallback=fallback)
+        )
+
+    if not BREAKER.allow():
+        return fallback
+
+    start = time.time()
+    try:
+        result = await amethod(*args)
+    except ValueError:
+        BREAKER.record(time.time() - start)
+        raise
+    except Exception as e:
+        BREAKER.record(time.time() - start, error=True)
+        log.warning("cache backend %s failed: %s", method, e)
+        return fallback
+
+    BREAKER.record(time.time() - start)
+    return result
+
+
+def _native_async():
+    """True if the backend has async methods (Django 4.0 and later).
+    Otherwise each async call runs its sync version in the default executor,
+    in one go rather than a backend call at a time."""
+    return hasattr(cache, "aget")
+
+
+async def _run_sync(func, *args):
+    """Run `func` in the default executor, seeing the same request memo."""
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        None, functools.partial(context.run, func, *args)
+    )
+
+
+def _remember(key, val):
+    """Keep `val` for the rest of the current request, if there is one."""
+    memo = REQUEST_CACHE.get()
+    if memo is not None:
+        memo[key] = val
+
+
+def _forget(key):
+    memo = REQUEST_CACHE.get()
+    if memo is not None:
+        memo.pop(key, None)
+
+
+def _pack(key, val):
+    """Pickle the CacheWrapper `val`, compressing it if it is large.
+
+    Returns a PackedValue, or None if the value is over CACHE_MAX_VALUE_SIZE
+    and so should not be cached.
+    """
+    namespace = key_namespace(key)
+    data = pickle.dumps(val, pickle.HIGHEST_PROTOCOL)
+    raw_size = len(data)
+    compressed = False
+
+    threshold = getattr(settings, "CACHE_COMPRESS_MIN_SIZE", 0)
+    if threshold and raw_size >= threshold:
+        smaller = zlib.compress(data)
+        if len(smaller) < raw_size:
+            data = smaller
+            compressed = True
+
+    limit = getattr(settings, "CACHE_MAX_VALUE_SIZE", MAX_VALUE_SIZE)
+    if limit and len(data) > limit:
+        log.warning(
+            "not caching %s, its %i bytes are over the %i byte limit",
+            key,
+            len(data),
+            limit,
+        )
+        STATS.incr(namespace, "oversize")
+        return None
+
+    STATS.incr(namespace, "bytes", len(data))
+    STATS.incr(namespace, "raw_bytes", raw_size)
+    return PackedValue(data, compressed)
+
+
+def _unpack(key, obj):
+    """Turn a value read from the backend back into a CacheWrapper."""
+    if isinstance(obj, PackedValue):
+        try:
+            return obj.unpack()
+        except Exception as e:
+            log.warning("could not unpack cached %s: %s", key, e)
+            return None
+    return obj
 
 
 def _hash_or_string(key):
@@ -211,8 +871,11 @@ def _hash_or_string(key):
 
 
 def cache_contains(*keys, **kwargs):
+    """True if the key is in the local tier of this process.  The backend
+    is not asked, so a key set by another process, or evicted from the local
+    tier, is not reported."""
     key = cache_key(keys, **kwargs)
-    return key in CACHED_KEYS
+    return key in LOCAL_CACHE
 
 
 def cache_key(*keys, **pairs):
@@ -242,6 +905,198 @@ def cache_key(*keys, **pairs):
     return key.replace(" ", ".")
 
 
+def generation_keys(key):
+    """Return the keys holding the generation of each ancestor of `key`.
+
+    "::a::b::c" has the ancestors "::a" and "::a::b", stored under
+    "::generation::a" and "::generation::a::b".
+    """
+    parts = key.lstrip(KEY_DELIM).split(KEY_DELIM)
+    return [
+        KEY_DELIM.join(["", "generation"] + parts[:i]) for i in range(1, len(parts))
+    ]
+
+
+def get_generations(key):
+    """Look up the current generation of each ancestor of `key` in one call
+    to the backend, 0 if it has never been invalidated."""
+    gen_keys = generation_keys(key)
+    gens = _load_generations(gen_keys)
+    return [gens[k] for k in gen_keys]
+
+
+def _load_generations(gen_keys):
+    """Return a dict of generation key -> generation."""
+    gens, missing = _local_generations(gen_keys)
+    if missing:
+        _found_generations(
+            gens, missing, _backend("get_many", missing, fallback={})
+        )
+    return gens
+
+
+def _local_generations(gen_keys):
+    """Return a dict of the generations already read in this request or held
+    in this process, and a list of the generation keys which need to be read
+    from the backend."""
+    memo = REQUEST_CACHE.get() or {}
+    gens = {}
+    missing = []
+    for k in gen_keys:
+        if k in memo:
+            gens[k] = memo[k].val
+            continue
+        gen = GENERATIONS.get(k, None)
+        if gen is None:
+            missing.append(k)
+        else:
+            gens[k] = gen
+    return gens, missing
+
+
+def _found_generations(gens, missing, found):
+    timeout = getattr(settings, "CACHE_GENERATION_TIMEOUT", 0)
+    for k in missing:
+        gens[k] = found.get(k, 0)
+        _remember(k, CacheWrapper(gens[k]))
+        if timeout:
+            GENERATIONS.set(k, gens[k], timeout)
+
+
+def _generation_key(key):
+    return KEY_DELIM.join(["", "generation", key.lstrip(KEY_DELIM)])
+
+
+def bump_generation(key):
+    """Atomically move `key` on to its next generation, invalidating every
+    child of `key` in every process."""
+    gen_key = _generation_key(key)
+    GENERATIONS.delete(gen_key)
+    return cache_incr(gen_key)
+
+
+def cache_counter(key):
+    """Return the integer counter held under the backend key `key`, 0 if it
+    has never been incremented.  It is read at most once per request while
+    the request memo is on."""
+    memo = REQUEST_CACHE.get()
+    if memo is not None and key in memo:
+        return memo[key].val
+
+    try:
+        value = _call_backend("get", key, 0)
+    except CacheNotRespondingError:
+        # keep to the last value seen rather than starting again from 0
+        value = _COUNTERS.get(key, 0)
+    else:
+        _COUNTERS[key] = value
+    _remember(key, CacheWrapper(value))
+    return value
+
+
+def cache_incr(key):
+    """Atomically increment the counter under the backend key `key`, which
+    never expires, returning its new value.
+
+    A counter missing from the backend, as it was never set or has been
+    evicted, starts from the current time in microseconds rather than from 1,
+    so that it does not go back to a value it has had before.
+    """
+    _forget(key)
+    try:
+        return _backend("incr", key)
+    except ValueError:
+        seed = _counter_seed()
+        if _backend("add", key, seed, None):
+            return seed
+        return _backend("incr", key)
+
+
+def _counter_seed():
+    return int(time.time() * 1000000)
+
+
+def cache_token(key):
+    """Return the token held under the backend key `key`, publishing a new
+    one if it is missing.  Unlike a counter a token never repeats, so a value
+    read before the backend lost the key is never current again.  It is read
+    at most once per request while the request memo is on, and is None if
+    the backend is bypassed before it has ever been read."""
+    memo = REQUEST_CACHE.get()
+    if memo is not None and key in memo:
+        return memo[key].val
+
+    try:
+        value = _call_backend("get", key)
+        if value is None:
+            value = uuid.uuid4().hex
+            if not _call_backend("add", key, value, None):
+                # published by another process in the meantime
+                value = _call_backend("get", key) or value
+    except CacheNotRespondingError:
+        value = _COUNTERS.get(key)
+    else:
+        _COUNTERS[key] = value
+    _remember(key, CacheWrapper(value))
+    return value
+
+
+def new_cache_token(key):
+    """Publish a new token under the backend key `key`, which never expires,
+    returning it."""
+    value = uuid.uuid4().hex
+    _forget(key)
+    _backend("set", key, value, None)
+    return value
+
+
+def backend_key(key):
+    """Return the key actually used in the backend for `key`, which includes
+    the generations of its ancestors once any of them has been invalidated."""
+    return _stamp_generations(key, get_generations(key))
+
+
+def backend_keys(keys):
+    """Return a dict of key -> backend key, looking up the generations for
+    all of `keys` in one call to the backend."""
+    all_gen_keys = dict((key, generation_keys(key)) for key in keys)
+    gens = _load_generations(
+        list(set([k for gen_keys in all_gen_keys.values() for k in gen_keys]))
+    )
+    return dict(
+        (key, _stamp_generations(key, [gens[k] for k in gen_keys]))
+        for key, gen_keys in all_gen_keys.items()
+    )
+
+
+def _stamp_generations(key, gens):
+    if any(gens):
+        key = key + GENERATION_DELIM + ".".join([str(gen) for gen in gens])
+    return key
+
+
+def key_namespace(key):
+    """Return the first segment of a key made by `cache_key`, eg. "setting"
+    for "::setting::SHOP::NAME"."""
+    return key.lstrip(KEY_DELIM).split(KEY_DELIM, 1)[0]
+
+
+def local_timeout(key):
+    """How long `key` may be served from the in-process tier.
+
+    Looks up the key's namespace in the CACHE_L1_NAMESPACES setting, falling
+    back to CACHE_L1_TIMEOUT.  A timeout of 0 means always go to the backend.
+    """
+    namespaces = getattr(settings, "CACHE_L1_NAMESPACES", {})
+    timeout = namespaces.get(
+        key_namespace(key), getattr(settings, "CACHE_L1_TIMEOUT", 0)
+    )
+    if not BREAKER.closed:
+        # keep what this process has looked up while the backend is bypassed
+        timeout = max(timeout, getattr(settings, "CACHE_BREAKER_L1_TIMEOUT", 60))
+    return timeout
+
+
 def md5_hash(obj):
     pickled = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
     return hashlib.md5(pickled).hexdigest()
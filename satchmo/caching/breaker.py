@@ -0,0 +1,135 @@
+"""A circuit breaker around the cache backend.
+
+Every call to the backend is timed.  Once CACHE_BREAKER_FAILURES calls in a
+row have raised an error or taken longer than CACHE_BREAKER_LATENCY
+milliseconds, the breaker opens and the backend is not called at all for
+CACHE_BREAKER_COOL_OFF seconds, so that a stalled memcached costs a lookup in
+the database rather than a socket timeout.  After that one caller probes the
+backend: if the probe is quick the breaker closes again, otherwise it stays
+open for another cool off.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker(object):
+    """The state of the backend as seen by this process.
+
+    `probe` is a cheap call to the backend, made before letting calls through
+    again.  `on_recover` is called without arguments whenever the breaker
+    closes again after having been open.
+    """
+
+    def __init__(self, probe=None, on_recover=None):
+        self.probe = probe
+        self.on_recover = on_recover
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self.errors = 0
+        self.bypassed = 0
+
+    @property
+    def closed(self):
+        return self.state == CLOSED
+
+    def allow(self):
+        """Return True if the backend may be called now."""
+        if self.state == CLOSED:
+            return True
+
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            cool_off = getattr(settings, "CACHE_BREAKER_COOL_OFF", 30)
+            if self.state == HALF_OPEN or time.time() - self.opened_at < cool_off:
+                self.bypassed += 1
+                return False
+            self.state = HALF_OPEN
+
+        if self.probe is None:
+            # this call is the probe
+            return True
+        return self._probe()
+
+    def _probe(self):
+        log.info("Probing the cache backend")
+        start = time.time()
+        try:
+            self.probe()
+        except Exception as e:
+            log.warning("cache backend probe failed: %s", e)
+            self.record(time.time() - start, error=True)
+        else:
+            self.record(time.time() - start)
+        return self.closed
+
+    def record(self, seconds, error=False):
+        """Record a call to the backend which took `seconds`."""
+        limit = getattr(settings, "CACHE_BREAKER_FAILURES", 5)
+        latency = getattr(settings, "CACHE_BREAKER_LATENCY", 250)
+        failed = error or (latency and seconds * 1000 > latency)
+
+        recovered = False
+        with self._lock:
+            if error:
+                self.errors += 1
+            if failed:
+                self.failures += 1
+                if self.state == HALF_OPEN or (
+                    self.state == CLOSED and limit and self.failures >= limit
+                ):
+                    self._trip()
+            else:
+                self.failures = 0
+                recovered = self.state != CLOSED
+                self.state = CLOSED
+                self.opened_at = None
+
+        if recovered:
+            log.warning("The cache backend has recovered")
+            if self.on_recover is not None:
+                self.on_recover()
+
+    def _trip(self):
+        log.warning(
+            "The cache backend is not responding, bypassing it after %i failures",
+            self.failures,
+        )
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.trips += 1
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self.trips = 0
+            self.errors = 0
+            self.bypassed = 0
+
+    def status(self):
+        """Return the state of the breaker as a dict."""
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opened_at": self.opened_at,
+                "trips": self.trips,
+                "errors": self.errors,
+                "bypassed": self.bypassed,
+            }
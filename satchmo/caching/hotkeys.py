@@ -0,0 +1,218 @@
+"""Sampling detection of hot cache keys and of key cardinality.
+
+A fraction CACHE_HOTKEY_SAMPLE of cache reads is sampled.  Each sampled key
+is counted in a count-min sketch, and the CACHE_HOTKEY_TOP most read keys are
+kept with their estimated counts.  While sampling is on, the number of
+distinct keys read in each namespace is estimated from every read with a
+HyperLogLog, which shows up namespaces whose keys are never read twice.
+
+Every CACHE_HOTKEY_INTERVAL seconds the counts are logged, each key as its
+namespace and a hash, and a new window is started, the finished one being
+kept for the stats page.
+"""
+
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from satchmo.caching.stats import stats_namespace
+
+log = logging.getLogger(__name__)
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hashes(key):
+    """Return two independent 64 bit hashes of the string `key`."""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+
+
+class CountMinSketch(object):
+    """Approximate counts of many keys in `width` x `depth` counters.
+    Estimates are never too low, and too high by at most about
+    2 / `width` of all counts."""
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for i in range(depth)]
+
+    def _cells(self, hashes):
+        h1, h2 = hashes
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, hashes):
+        """Count the key with `hashes`, returning its estimated count."""
+        estimate = None
+        for row, cell in zip(self.rows, self._cells(hashes)):
+            row[cell] += 1
+            if estimate is None or row[cell] < estimate:
+                estimate = row[cell]
+        return estimate
+
+
+class HyperLogLog(object):
+    """An estimate of the number of distinct keys added, within about
+    1.04 / sqrt(2 ** `precision`), in 2 ** `precision` bytes."""
+
+    def __init__(self, precision=10):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, h):
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & _MASK64
+        rank = 64 - self.precision + 1
+        if rest:
+            rank = min(rank, 64 - rest.bit_length() + 1)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum([2.0 ** -r for r in self.registers])
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate for small counts
+            return int(round(m * math.log(float(m) / zeros)))
+        return int(round(estimate))
+
+
+class Window(object):
+    """The sampled reads since `started`."""
+
+    def __init__(self, top):
+        self.started = time.time()
+        self.top = top
+        self.sampled = 0
+        self.sketch = CountMinSketch()
+        self.hot = {}
+        self.namespaces = {}
+        # guards namespaces, which is updated on every read
+        self._lock = threading.Lock()
+
+    def add_distinct(self, namespace, hashes):
+        with self._lock:
+            hll = self.namespaces.get(namespace)
+            if hll is None:
+                hll = self.namespaces[namespace] = HyperLogLog()
+            hll.add(hashes[0])
+
+    def add_sampled(self, key, hashes):
+        self.sampled += 1
+        count = self.sketch.add(hashes)
+
+        if key in self.hot or len(self.hot) < self.top:
+            self.hot[key] = count
+        else:
+            coldest = min(self.hot, key=self.hot.get)
+            if count > self.hot[coldest]:
+                del self.hot[coldest]
+                self.hot[key] = count
+
+    def report(self, rate):
+        """Return the window as a dict, scaling sampled counts up by `rate`."""
+        hot = sorted(self.hot.items(), key=lambda item: -item[1])
+        with self._lock:
+            namespaces = dict(
+                (namespace, hll.count()) for namespace, hll in self.namespaces.items()
+            )
+        return {
+            "started": self.started,
+            "seconds": int(time.time() - self.started),
+            "sample_rate": rate,
+            "sampled": self.sampled,
+            "keys": [[key, int(count / rate)] for key, count in hot],
+            "namespaces": namespaces,
+        }
+
+
+class HotKeyDetector(object):
+    """Thread safe sampling of the keys read in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.window = None
+        self.previous = None
+
+    def record(self, namespace, key):
+        rate = getattr(settings, "CACHE_HOTKEY_SAMPLE", 0)
+        if not rate:
+            return
+
+        window = self.window
+        if window is None:
+            with self._lock:
+                if self.window is None:
+                    self.window = Window(getattr(settings, "CACHE_HOTKEY_TOP", 20))
+                window = self.window
+
+        namespace = stats_namespace(namespace)
+        hashes = _hashes(key)
+        window.add_distinct(namespace, hashes)
+        if random.random() >= rate:
+            return
+
+        finished = None
+        with self._lock:
+            window.add_sampled(key, hashes)
+            interval = getattr(settings, "CACHE_HOTKEY_INTERVAL", 300)
+            if self.window is window and time.time() - window.started >= interval:
+                finished = self.previous = window.report(rate)
+                self.window = None
+
+        if finished is not None:
+            _log_report(finished)
+
+    def report(self):
+        """Return the current window and the previous one as dicts, None
+        where there is no window."""
+        rate = getattr(settings, "CACHE_HOTKEY_SAMPLE", 0)
+        with self._lock:
+            current = None
+            if self.window is not None and rate:
+                current = self.window.report(rate)
+            return {"current": current, "previous": self.previous}
+
+    def clear(self):
+        with self._lock:
+            self.window = None
+            self.previous = None
+
+
+def _key_label(key):
+    """Return the namespace of `key` and a hash of the rest, the keys
+    themselves may hold customer data so are never logged."""
+    namespace = stats_namespace(key.lstrip(":").split("::", 1)[0])
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=6).hexdigest()
+    return "%s#%s" % (namespace, digest)
+
+
+def _log_report(report):
+    log.info(
+        "Hot cache keys over %is, sampled %i reads: %s",
+        report["seconds"],
+        report["sampled"],
+        ", ".join(
+            ["%s ~%i" % (_key_label(key), count) for key, count in report["keys"]]
+        ),
+    )
+    log.info(
+        "Distinct cache keys read per namespace: %s",
+        ", ".join(
+            [
+                "%s ~%i" % (namespace, count)
+                for namespace, count in sorted(
+                    report["namespaces"].items(), key=lambda item: -item[1]
+                )
+            ]
+        ),
+    )
@@ -0,0 +1,75 @@
+"""A small, thread safe, in-process LRU cache with per-entry expiry.
+
+Used as the first tier in front of the Django cache backend.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """A bounded mapping of key -> value, evicting the least recently used
+    entry once `maxsize` is reached.
+
+    Every entry carries its own expiry time.  An entry set with a timeout of
+    0 is still tracked (so it shows up in `keys()`), but is never returned by
+    `get()`.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def delete(self, key):
+        """Remove `key`, returning True if it was tracked."""
+        with self._lock:
+            try:
+                del self._data[key]
+                return True
+            except KeyError:
+                return False
+
+    def get(self, key, default=_MISSING):
+        """Return the live value for `key`, or `default` if it is missing or
+        expired.  Raises KeyError if no default is given."""
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                pass
+            else:
+                if expires > time.time():
+                    self._data.move_to_end(key)
+                    return value
+
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def set(self, key, value, timeout):
+        """Store `value` under `key` for `timeout` seconds."""
+        with self._lock:
+            self._data[key] = (time.time() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > max(self.maxsize, 0):
+                self._data.popitem(last=False)
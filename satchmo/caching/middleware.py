@@ -0,0 +1,21 @@
+from satchmo.caching import REQUEST_CACHE
+
+
+class RequestCacheMiddleware(object):
+    """Remembers every value read from or set in satchmo.caching for the
+    length of a request, so repeated lookups of the same key only go to the
+    cache backend once.
+
+    The values are held in a context variable, so concurrent requests in
+    threads or asyncio tasks each see their own.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = REQUEST_CACHE.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            REQUEST_CACHE.reset(token)
@@ -34,6 +34,41 @@ class CachedObjectMixin(object):
         return caching.is_cached(self.cache_key(*args, **kwargs))
 
 
+def cache_queryset(
+    queryset, keys, length=caching.TIMEOUT, select_related=(), prefetch_related=()
+):
+    """Return the objects of `queryset` as a list, caching only their
+    primary keys under `keys`.
+
+    On a hit the objects are loaded by primary key with one `in_bulk` query,
+    in the order originally returned.  Objects deleted since are left out.
+    `select_related` and `prefetch_related` are applied to `queryset` on a
+    miss and to that query on a hit.
+    """
+    key = caching.cache_key(keys)
+    try:
+        pks = caching.cache_get(key)
+    except caching.NotCachedError:
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        objects = list(queryset)
+        caching.cache_set(key, value=[obj.pk for obj in objects], length=length)
+        return objects
+
+    if not pks:
+        return []
+
+    qs = queryset.model._default_manager.all()
+    if select_related:
+        qs = qs.select_related(*select_related)
+    if prefetch_related:
+        qs = qs.prefetch_related(*prefetch_related)
+    found = qs.in_bulk(pks)
+    return [found[pk] for pk in pks if pk in found]
+
+
 def find_by_id(cls, groupkey, objectid, raises=False):
     """A helper function to look up an object by id"""
     ob = None
@@ -0,0 +1,211 @@
+"""Per-namespace cache statistics.
+
+Each process counts in memory, and every CACHE_STATS_INTERVAL seconds adds
+its counts to totals held in the cache backend, so that the totals cover
+every worker.  Only the namespaces in NAMESPACES, CACHE_STATS_NAMESPACES
+and CACHE_L1_NAMESPACES are counted separately, the rest together as
+"other", so that keys starting with a value do not each add counters
+which are never removed.  That is done in a background thread, so that no cache call
+waits on it, and counts which could not be added are kept for the next
+time.
+"""
+
+from collections import defaultdict
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+log = logging.getLogger(__name__)
+
+COUNTERS = (
+    "hits",
+    "local_hits",
+    "request_hits",
+    "misses",
+    "sets",
+    "deletes",
+    "oversize",
+    # size of the values set, as sent to the backend and before compression
+    "bytes",
+    "raw_bytes",
+)
+# upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS = (1, 5, 10, 50, 100, 500)
+TIMED = ("get", "set")
+NAMESPACES_KEY = "::stats"
+NAMESPACES = frozenset(
+    [
+        "Category_active_products",
+        "Category_get_all_children",
+        "Category_get_mainImage",
+        "CCV",
+        "Config",
+        "Currency",
+        "LongSetting",
+        "Product_get_mainImage",
+        "Setting",
+        "Upsell",
+        "bestsellers",
+        "category_tree",
+        "func",
+        "product_count",
+        "setting",
+    ]
+)
+OTHER = "other"
+
+
+def stats_namespace(namespace):
+    """Return the name `namespace` is counted under."""
+    if (
+        namespace in NAMESPACES
+        or namespace in getattr(settings, "CACHE_STATS_NAMESPACES", ())
+        or namespace in getattr(settings, "CACHE_L1_NAMESPACES", {})
+    ):
+        return namespace
+    return OTHER
+
+
+def _bucket_names(op):
+    names = ["%s_%sms" % (op, ms) for ms in BUCKETS]
+    names.append("%s_slower" % op)
+    names.append("%s_total_ms" % op)
+    return names
+
+
+FIELDS = list(COUNTERS)
+for _op in TIMED:
+    FIELDS.extend(_bucket_names(_op))
+
+
+def _call_cache(method, *args):
+    return getattr(cache, method)(*args)
+
+
+class CacheStats(object):
+    """Thread safe counters, keyed by namespace, for one process.
+
+    The shared totals are read and written with `backend(method, *args)`,
+    which calls `method` of the cache backend and raises an error if it
+    cannot.
+    """
+
+    def __init__(self, backend=_call_cache):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._totals = defaultdict(lambda: defaultdict(int))
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._flushed = time.time()
+        self._flusher = None
+
+    def incr(self, namespace, name, delta=1):
+        namespace = stats_namespace(namespace)
+        with self._lock:
+            self._totals[namespace][name] += delta
+            self._pending[namespace][name] += delta
+        self._maybe_flush()
+
+    def timing(self, namespace, op, seconds):
+        """Record that `op` took `seconds` for a key in `namespace`."""
+        ms = seconds * 1000
+        for bound in BUCKETS:
+            if ms <= bound:
+                bucket = "%s_%sms" % (op, bound)
+                break
+        else:
+            bucket = "%s_slower" % op
+
+        namespace = stats_namespace(namespace)
+        with self._lock:
+            for name, delta in ((bucket, 1), ("%s_total_ms" % op, int(ms))):
+                self._totals[namespace][name] += delta
+                self._pending[namespace][name] += delta
+        self._maybe_flush()
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+            self._pending.clear()
+
+    def local(self):
+        """Return the counts of this process as a dict of dicts."""
+        with self._lock:
+            return _as_dict(self._totals)
+
+    def _maybe_flush(self):
+        interval = getattr(settings, "CACHE_STATS_INTERVAL", 60)
+        if time.time() - self._flushed < interval:
+            return
+
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flushed = time.time()
+            self._flusher = threading.Thread(target=self.flush)
+            self._flusher.daemon = True
+        self._flusher.start()
+
+    def flush(self):
+        """Add the counts made since the last flush to the shared totals.
+        Counts not added, as the backend failed, are kept to be added by the
+        next flush."""
+        with self._lock:
+            pending = _as_dict(self._pending)
+            self._pending.clear()
+            self._flushed = time.time()
+
+        if not pending:
+            return
+
+        try:
+            namespaces = set(self._backend("get", NAMESPACES_KEY) or [])
+            if not namespaces.issuperset(pending):
+                self._backend(
+                    "set", NAMESPACES_KEY, sorted(namespaces.union(pending)), None
+                )
+
+            for namespace in list(pending):
+                counts = pending[namespace]
+                for name in list(counts):
+                    if counts[name]:
+                        self._incr(_shared_key(namespace, name), counts[name])
+                    del counts[name]
+                del pending[namespace]
+        except Exception as e:
+            log.warning("Could not save cache stats: %s", e)
+            with self._lock:
+                for namespace, counts in pending.items():
+                    for name, delta in counts.items():
+                        self._pending[namespace][name] += delta
+
+    def _incr(self, key, delta):
+        try:
+            self._backend("incr", key, delta)
+        except ValueError:
+            if not self._backend("add", key, delta, None):
+                self._backend("incr", key, delta)
+
+    def shared(self):
+        """Return the counts of every process, as last flushed."""
+        try:
+            namespaces = self._backend("get", NAMESPACES_KEY) or []
+            keys = [_shared_key(ns, name) for ns in namespaces for name in FIELDS]
+            values = self._backend("get_many", keys)
+        except Exception as e:
+            log.warning("Could not read cache stats: %s", e)
+            return {}
+        return dict(
+            (ns, dict((name, values.get(_shared_key(ns, name), 0)) for name in FIELDS))
+            for ns in namespaces
+        )
+
+
+def _as_dict(counts):
+    return dict((ns, dict(values)) for ns, values in counts.items())
+
+
+def _shared_key(namespace, name):
+    return "::".join([NAMESPACES_KEY, namespace, name])
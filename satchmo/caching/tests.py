@@ -1,13 +1,29 @@
 # -*- coding: UTF-8 -*-
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.http import Http404
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
 from satchmo import caching
+from satchmo.caching.hotkeys import CountMinSketch, HyperLogLog
+from satchmo.caching.lru import LRUCache
+from satchmo.caching.middleware import RequestCacheMiddleware
+from satchmo.caching.models import cache_queryset
+from satchmo.caching.stats import CacheStats
+from satchmo.contact.factories import UserFactory
+from unittest import mock
+import asyncio
 import random
-from django.test import TestCase
+import threading
 import re
 import time
 
 CACHE_HIT = 0
 
+# the namespaces of the keys used below, counted separately by the stats
+TEST_NAMESPACES = ["async", "cold", "hot", "memo", "size", "statstest"]
+
 
 def cachetest(a, b, c):
     global CACHE_HIT
@@ -46,6 +62,54 @@ class DecoratorTest(TestCase):
         self.assertNotEqual(orig, caching)
 
 
+COUNTED_CALLS = []
+
+
+def counted(a):
+    COUNTED_CALLS.append(a)
+    return len(COUNTED_CALLS)
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        del COUNTED_CALLS[:]
+
+    def tearDown(self):
+        caching.cache_delete()
+        cache.clear()
+
+    def testWaitsForOtherCaller(self):
+        func = caching.cache_function(60, wait=2)(counted)
+        key = caching.cache_key("func", "counted", __name__, (1,), {})
+        self.assertTrue(caching._acquire_lock(key))
+
+        def finish():
+            caching.cache_set(key, value="theirs")
+            caching._release_lock(key)
+
+        threading.Timer(0.1, finish).start()
+        self.assertEqual(func(1), "theirs")
+        self.assertEqual(COUNTED_CALLS, [])
+
+    def testGivesUpWaiting(self):
+        func = caching.cache_function(60, wait=0.1)(counted)
+        key = caching.cache_key("func", "counted", __name__, (2,), {})
+        caching._acquire_lock(key)
+        self.assertEqual(func(2), 1)
+        self.assertEqual(COUNTED_CALLS, [2])
+
+    def testStaleWhileRevalidate(self):
+        func = caching.cache_function(60, soft_length=0)(counted)
+        self.assertEqual(func(3), 1)
+        # stale, so the old value is served while it is refreshed
+        self.assertEqual(func(3), 1)
+        for x in range(0, 40):
+            if len(COUNTED_CALLS) == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual(COUNTED_CALLS, [3, 3])
+
+
 class CachingTest(TestCase):
     def testCacheGetFail(self):
         try:
@@ -150,3 +214,625 @@ class TestKeyMaker(TestCase):
     def testPairedDualKey(self):
         v = caching.cache_key("test", 3, more="yes")
         self.assertEqual(v, caching.CACHE_PREFIX + "::test::3::more::yes")
+
+
+class TestLRUCache(TestCase):
+    def testEvictsLeastRecentlyUsed(self):
+        lru = LRUCache(2)
+        lru.set("a", 1, 10)
+        lru.set("b", 2, 10)
+        lru.get("a")
+        lru.set("c", 3, 10)
+        self.assertEqual(sorted(lru.keys()), ["a", "c"])
+        self.assertEqual(lru.get("b", None), None)
+
+    def testExpiry(self):
+        lru = LRUCache(2)
+        lru.set("a", 1, 0)
+        self.assertTrue("a" in lru)
+        self.assertRaises(KeyError, lru.get, "a")
+
+
+class TestLocalTier(TestCase):
+    def tearDown(self):
+        caching.cache_delete()
+
+    @override_settings(CACHE_L1_NAMESPACES={"local": 60})
+    def testServedLocally(self):
+        caching.cache_set("local", "x", value="one")
+        cache.delete(caching.backend_key(caching.cache_key("local", "x")))
+        self.assertEqual(caching.cache_get("local", "x"), "one")
+
+    def testDisabledByDefault(self):
+        caching.cache_set("local", "x", value="one")
+        cache.delete(caching.backend_key(caching.cache_key("local", "x")))
+        self.assertRaises(caching.NotCachedError, caching.cache_get, "local", "x")
+
+    @override_settings(CACHE_L1_NAMESPACES={"local": 60})
+    def testDeleteClearsLocal(self):
+        caching.cache_set("local", "x", value="one")
+        caching.cache_delete("local", children=True)
+        self.assertRaises(caching.NotCachedError, caching.cache_get, "local", "x")
+
+    def testDeleteAllEvicted(self):
+        caching.cache_set("local", "x", value="one")
+        # forget the key locally, as if it had been evicted
+        caching.LOCAL_CACHE.clear()
+        self.assertFalse(caching.cache_contains("local", "x"))
+
+        caching.cache_delete()
+        self.assertRaises(caching.NotCachedError, caching.cache_get, "local", "x")
+
+
+class TestGenerations(TestCase):
+    def tearDown(self):
+        caching.cache_delete()
+        cache.clear()
+
+    def testDeleteChildrenSetElsewhere(self):
+        caching.cache_set("gen", "x", value=True)
+        caching.cache_set("gen", "x", "y", value=True)
+        # forget the keys locally, as if another process had set them
+        caching.LOCAL_CACHE.clear()
+
+        caching.cache_delete("gen", children=True)
+        self.assertFalse(caching.cache_get("gen", "x", default=False))
+        self.assertFalse(caching.cache_get("gen", "x", "y", default=False))
+
+    def testSiblingsUntouched(self):
+        caching.cache_set("gen", "x", "y", value=True)
+        caching.cache_set("gen", "z", "y", value=True)
+        caching.cache_delete("gen", "x", children=True)
+        self.assertFalse(caching.cache_get("gen", "x", "y", default=False))
+        self.assertTrue(caching.cache_get("gen", "z", "y", default=False))
+
+    def testBackendKey(self):
+        key = caching.cache_key("gen", "x", "y")
+        self.assertEqual(caching.backend_key(key), key)
+        gen = caching.bump_generation(caching.cache_key("gen", "x"))
+        self.assertEqual(caching.backend_key(key), key + "@0.%i" % gen)
+        self.assertEqual(
+            caching.bump_generation(caching.cache_key("gen", "x")), gen + 1
+        )
+
+    def testEvictedGeneration(self):
+        first = caching.bump_generation("::gen")
+        caching.cache_set("gen", "x", value=True)
+        caching.LOCAL_CACHE.clear()
+
+        cache.delete("::generation::gen")
+        self.assertTrue(caching.bump_generation("::gen") > first)
+        self.assertFalse(caching.cache_get("gen", "x", default=False))
+
+
+@override_settings(CACHE_STATS_NAMESPACES=TEST_NAMESPACES)
+class TestCacheStats(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def testCounts(self):
+        stats = CacheStats()
+        stats.incr("setting", "hits")
+        stats.incr("setting", "hits")
+        stats.timing("setting", "get", 0.003)
+        stats.timing("setting", "get", 2)
+        counts = stats.local()["setting"]
+        self.assertEqual(counts["hits"], 2)
+        self.assertEqual(counts["get_5ms"], 1)
+        self.assertEqual(counts["get_slower"], 1)
+        self.assertEqual(counts["get_total_ms"], 2003)
+
+    def testSharedBetweenProcesses(self):
+        one = CacheStats()
+        two = CacheStats()
+        one.incr("Config", "misses")
+        two.incr("Config", "misses", 2)
+        one.flush()
+        two.flush()
+        self.assertEqual(one.shared()["Config"]["misses"], 3)
+
+    def testOtherNamespaces(self):
+        stats = CacheStats()
+        stats.incr("setting", "hits")
+        stats.incr("4111111111111111", "hits")
+        stats.incr("5500000000000004", "hits")
+        self.assertEqual(sorted(stats.local()), ["other", "setting"])
+        self.assertEqual(stats.local()["other"]["hits"], 2)
+
+    def testKeptWhenBackendFails(self):
+        def failing(method, *args):
+            raise caching.CacheNotRespondingError(method)
+
+        stats = CacheStats(backend=failing)
+        stats.incr("Config", "misses", 2)
+        stats.flush()
+        stats._backend = caching._call_backend
+        stats.flush()
+        self.assertEqual(stats.shared()["Config"]["misses"], 2)
+
+    @override_settings(CACHE_STATS_INTERVAL=0)
+    def testFlushedInBackground(self):
+        threads = []
+        stats = CacheStats()
+        with mock.patch.object(
+            stats, "flush", lambda: threads.append(threading.current_thread())
+        ):
+            stats.incr("Config", "misses")
+            stats._flusher.join()
+        self.assertEqual(threads, [stats._flusher])
+
+    def testStatsJson(self):
+        user = UserFactory(is_staff=True)
+        self.client.force_login(user)
+        caching.cache_get("statstest", default=None)
+
+        response = self.client.get(reverse("caching_stats_json"))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data["namespaces"]["statstest"]["misses"] >= 1)
+        self.assertTrue("statstest" in data["process"])
+
+    def testBreakerState(self):
+        user = UserFactory(is_staff=True)
+        self.client.force_login(user)
+        response = self.client.get(reverse("caching_stats_json"))
+        self.assertEqual(response.json()["breaker"]["state"], "closed")
+
+
+def failing_get(*args, **kwargs):
+    raise IOError("not responding")
+
+
+@override_settings(CACHE_BREAKER_FAILURES=2, CACHE_BREAKER_COOL_OFF=60)
+class TestCircuitBreaker(TestCase):
+    def tearDown(self):
+        caching.BREAKER.reset()
+        caching.cache_delete()
+        cache.clear()
+
+    def testTripsAndRecovers(self):
+        with mock.patch.object(cache, "get", side_effect=failing_get) as get:
+            self.assertEqual(caching.cache_get("breaker", default="db"), "db")
+            self.assertEqual(caching.cache_get("breaker", default="db"), "db")
+            self.assertEqual(caching.BREAKER.state, "open")
+
+            # bypassed
+            self.assertEqual(caching.cache_get("breaker", default="db"), "db")
+            self.assertEqual(get.call_count, 2)
+
+            with self.settings(CACHE_BREAKER_COOL_OFF=0):
+                # the probe fails too
+                caching.cache_get("breaker", default="db")
+                self.assertEqual(caching.BREAKER.state, "open")
+                self.assertEqual(get.call_count, 3)
+
+        with self.settings(CACHE_BREAKER_COOL_OFF=0):
+            caching.cache_set("breaker", value="cached")
+        self.assertEqual(caching.BREAKER.state, "closed")
+        self.assertEqual(caching.cache_get("breaker"), "cached")
+        self.assertEqual(caching.BREAKER.status()["trips"], 2)
+
+    @override_settings(CACHE_BREAKER_LATENCY=10)
+    def testTripsWhenSlow(self):
+        caching.BREAKER.record(0.5)
+        caching.BREAKER.record(0.001)
+        caching.BREAKER.record(0.5)
+        self.assertEqual(caching.BREAKER.state, "closed")
+        caching.BREAKER.record(0.5)
+        self.assertEqual(caching.BREAKER.state, "open")
+
+    def testDegraded(self):
+        caching.cache_set("breaker", value="stale")
+        caching.BREAKER.record(0, error=True)
+        caching.BREAKER.record(0, error=True)
+
+        # deletes and sets stay in this process until the backend recovers
+        caching.cache_delete("breaker")
+        caching.cache_set("breaker", "other", value="local")
+        self.assertEqual(caching.cache_get("breaker", "other"), "local")
+        self.assertEqual(cache.get("::breaker::other"), None)
+
+        with self.settings(CACHE_BREAKER_COOL_OFF=0):
+            self.assertEqual(caching.cache_get("breaker", default=None), None)
+        self.assertEqual(caching.BREAKER.state, "closed")
+
+    def testDegradedAsync(self):
+        caching.cache_set("breaker", value="stale")
+        caching.BREAKER.record(0, error=True)
+        caching.BREAKER.record(0, error=True)
+
+        with mock.patch.object(caching, "_native_async", return_value=True):
+            asyncio.run(caching.acache_delete("breaker"))
+        self.assertEqual(caching.BYPASSED_DELETES.keys, {"::breaker": False})
+
+        with self.settings(CACHE_BREAKER_COOL_OFF=0):
+            self.assertEqual(caching.cache_get("breaker", default=None), None)
+        self.assertEqual(caching.BREAKER.state, "closed")
+
+    def testPendingDeletesThreads(self):
+        pending = caching.PendingDeletes()
+
+        def add(start):
+            for i in range(start, start + 500):
+                pending.add("::pending::%i" % i, False)
+
+        threads = [threading.Thread(target=add, args=(i * 500,)) for i in range(4)]
+        with mock.patch.object(caching, "cache_delete") as delete:
+            for t in threads:
+                t.start()
+            while any(t.is_alive() for t in threads):
+                pending()
+            for t in threads:
+                t.join()
+            pending()
+        deleted = [c[0][0] for c in delete.call_args_list]
+        self.assertEqual(len(deleted), 2000)
+        self.assertEqual(len(set(deleted)), 2000)
+
+
+@override_settings(CACHE_STATS_NAMESPACES=TEST_NAMESPACES)
+class TestHotKeys(TestCase):
+    def tearDown(self):
+        caching.HOTKEYS.clear()
+        caching.cache_delete()
+        cache.clear()
+
+    def testHyperLogLog(self):
+        hll = HyperLogLog()
+        for i in range(20000):
+            hll.add(random.getrandbits(64))
+        self.assertTrue(18000 < hll.count() < 22000, hll.count())
+
+        small = HyperLogLog()
+        for i in range(3):
+            small.add(random.getrandbits(64))
+        self.assertEqual(small.count(), 3)
+
+    def testCountMinSketch(self):
+        sketch = CountMinSketch(width=16)
+        for i in range(100):
+            sketch.add((i, i * 7))
+        self.assertTrue(sketch.add((5, 35)) >= 2)
+
+    def testDisabledByDefault(self):
+        caching.cache_get("hot", default=None)
+        self.assertEqual(caching.HOTKEYS.report()["current"], None)
+
+    @override_settings(CACHE_HOTKEY_SAMPLE=1, CACHE_HOTKEY_TOP=3)
+    def testReport(self):
+        for i in range(50):
+            caching.cache_get("hot", default=None)
+        for i in range(30):
+            caching.cache_get("cold", i, default=None)
+        caching.cache_get_many([("cold", 1), ("cold", 2)])
+
+        report = caching.HOTKEYS.report()["current"]
+        self.assertEqual(report["keys"][0], ["::hot", 50])
+        self.assertEqual(len(report["keys"]), 3)
+        self.assertEqual(report["namespaces"]["hot"], 1)
+        # an estimate
+        self.assertTrue(27 <= report["namespaces"]["cold"] <= 33)
+
+    @override_settings(CACHE_HOTKEY_SAMPLE=1, CACHE_HOTKEY_INTERVAL=0)
+    def testRotated(self):
+        with self.assertLogs("satchmo.caching.hotkeys", "INFO") as logs:
+            caching.cache_get("hot", "4111111111111111", default=None)
+        report = caching.HOTKEYS.report()
+        self.assertEqual(report["current"], None)
+        self.assertEqual(report["previous"]["keys"], [["::hot::4111111111111111", 1]])
+        self.assertNotIn("4111111111111111", logs.output[0])
+        self.assertIn("hot#", logs.output[0])
+
+    @override_settings(CACHE_HOTKEY_SAMPLE=1)
+    def testDistinctThreads(self):
+        def read(start):
+            for i in range(start, start + 2000):
+                caching.HOTKEYS.record("cold", "::cold::%i" % i)
+
+        threads = [threading.Thread(target=read, args=(i * 2000,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        count = caching.HOTKEYS.report()["current"]["namespaces"]["cold"]
+        self.assertTrue(7200 < count < 8800, count)
+
+
+class TestBulk(TestCase):
+    def tearDown(self):
+        caching.cache_delete()
+        cache.clear()
+
+    def testGetMany(self):
+        caching.cache_set("bulk", 1, value="one")
+        caching.cache_set("bulk", 2, value=None)
+        hits, misses = caching.cache_get_many([("bulk", 1), ("bulk", 2), ("bulk", 3)])
+        self.assertEqual(
+            hits,
+            {caching.cache_key("bulk", 1): "one", caching.cache_key("bulk", 2): None},
+        )
+        self.assertEqual(misses, [caching.cache_key("bulk", 3)])
+
+    def testSetMany(self):
+        caching.cache_set_many(
+            {("bulk", 1): "one", ("bulk", 2): "two"}, lengths={("bulk", 2): 1}
+        )
+        self.assertEqual(caching.cache_get("bulk", 1), "one")
+        self.assertEqual(caching.cache_get("bulk", 2), "two")
+        time.sleep(2)
+        self.assertEqual(caching.cache_get("bulk", 1), "one")
+        self.assertRaises(caching.NotCachedError, caching.cache_get, "bulk", 2)
+
+    def testGetManyAfterChildrenDeleted(self):
+        caching.cache_set_many({("bulk", "x", 1): True, ("bulk", "y", 1): True})
+        caching.cache_delete("bulk", "x", children=True)
+        caching.LOCAL_CACHE.clear()
+        hits, misses = caching.cache_get_many([("bulk", "x", 1), ("bulk", "y", 1)])
+        self.assertEqual(list(hits.keys()), [caching.cache_key("bulk", "y", 1)])
+
+
+@override_settings(CACHE_STATS_NAMESPACES=TEST_NAMESPACES)
+class TestValueSize(TestCase):
+    def setUp(self):
+        caching.STATS.clear()
+
+    def tearDown(self):
+        caching.cache_delete()
+        caching.STATS.clear()
+        cache.clear()
+
+    def _stored(self, *keys):
+        caching.LOCAL_CACHE.clear()
+        return cache.get(caching.backend_key(caching.cache_key(keys)))
+
+    @override_settings(CACHE_COMPRESS_MIN_SIZE=1000)
+    def testCompressed(self):
+        caching.cache_set("size", "big", value="x" * 5000)
+        caching.cache_set("size", "small", value="x")
+        self.assertTrue(self._stored("size", "big").compressed)
+        self.assertFalse(self._stored("size", "small").compressed)
+        self.assertEqual(caching.cache_get("size", "big"), "x" * 5000)
+
+        counts = caching.STATS.local()["size"]
+        self.assertTrue(counts["bytes"] < counts["raw_bytes"])
+        self.assertTrue(counts["raw_bytes"] > 5000)
+
+    def testNotCompressedByDefault(self):
+        caching.cache_set("size", "big", value="x" * 5000)
+        self.assertFalse(self._stored("size", "big").compressed)
+
+    @override_settings(CACHE_MAX_VALUE_SIZE=1000)
+    def testOversize(self):
+        caching.cache_set("size", "big", value="small")
+        caching.cache_set("size", "big", value="x" * 5000)
+        self.assertRaises(caching.NotCachedError, caching.cache_get, "size", "big")
+
+        caching.cache_set_many({("size", "a"): "x" * 5000, ("size", "b"): "x"})
+        hits, misses = caching.cache_get_many([("size", "a"), ("size", "b")])
+        self.assertEqual(misses, [caching.cache_key("size", "a")])
+        self.assertEqual(caching.STATS.local()["size"]["oversize"], 2)
+
+
+class TestCacheQueryset(TestCase):
+    def tearDown(self):
+        caching.cache_delete()
+        cache.clear()
+
+    def testRehydrated(self):
+        users = [UserFactory(), UserFactory(), UserFactory()]
+        queryset = User.objects.order_by("-id")
+        self.assertEqual(cache_queryset(queryset, ("users",)), users[::-1])
+        self.assertEqual(caching.cache_get("users"), [u.pk for u in users[::-1]])
+
+        users[1].delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                cache_queryset(queryset, ("users",)), [users[2], users[0]]
+            )
+
+    def testRelatedOnBothPaths(self):
+        queryset = Permission.objects.filter(codename__startswith="add_")[:5]
+        for hit in (False, True):
+            with self.assertNumQueries(1):
+                permissions = cache_queryset(
+                    queryset, ("permissions",), select_related=("content_type",)
+                )
+                [p.content_type.model for p in permissions]
+            self.assertEqual(len(permissions), 5)
+
+    def testEmpty(self):
+        cache_queryset(User.objects.none(), ("users",))
+        with self.assertNumQueries(0):
+            self.assertEqual(cache_queryset(User.objects.all(), ("users",)), [])
+
+
+@override_settings(CACHE_STATS_NAMESPACES=TEST_NAMESPACES)
+class TestRequestCache(TestCase):
+    def setUp(self):
+        caching.STATS.clear()
+
+    def tearDown(self):
+        caching.cache_delete()
+        caching.STATS.clear()
+        cache.clear()
+
+    def _request(self, view):
+        return RequestCacheMiddleware(lambda request: view())(None)
+
+    def testMemoized(self):
+        caching.cache_set("memo", "x", value=1)
+
+        def view():
+            first = caching.cache_get("memo", "x")
+            cache.delete(caching.backend_key(caching.cache_key("memo", "x")))
+            return first, caching.cache_get("memo", "x")
+
+        self.assertEqual(self._request(view), (1, 1))
+        self.assertEqual(caching.STATS.local()["memo"]["request_hits"], 1)
+        # the memo is gone once the request is over
+        self.assertRaises(caching.NotCachedError, caching.cache_get, "memo", "x")
+
+    def testKeptConsistent(self):
+        def view():
+            caching.cache_set("memo", "x", value=1)
+            caching.cache_set("memo", "x", "y", value=2)
+            first = caching.cache_get("memo", "x", default=None)
+            caching.cache_set("memo", "x", value=3)
+            second = caching.cache_get("memo", "x", default=None)
+            caching.cache_delete("memo", "x", children=True)
+            return (
+                first,
+                second,
+                caching.cache_get("memo", "x", default=None),
+                caching.cache_get("memo", "x", "y", default=None),
+            )
+
+        self.assertEqual(self._request(view), (1, 3, None, None))
+
+    def testGenerationsMemoized(self):
+        caching.cache_delete("memo", children=True)
+
+        def view():
+            with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get:
+                caching.cache_set("memo", "x", value=1)
+                caching.cache_get("memo", "x")
+                caching.cache_get("memo", "y", default=None)
+                return get.call_count
+
+        self.assertEqual(self._request(view), 1)
+
+    def testThreadsSeparate(self):
+        seen = []
+
+        def view():
+            caching.cache_set("memo", "x", value=1)
+            cache.clear()
+            thread = threading.Thread(
+                target=lambda: seen.append(caching.cache_get("memo", "x", default=None))
+            )
+            thread.start()
+            thread.join()
+            return caching.cache_get("memo", "x")
+
+        self.assertEqual(self._request(view), 1)
+        self.assertEqual(seen, [None])
+
+
+class TestDeleteOnCommit(TransactionTestCase):
+    def tearDown(self):
+        caching.cache_delete()
+        cache.clear()
+
+    def testDeletedAgainOnCommit(self):
+        with transaction.atomic():
+            caching.cache_delete("commit", "x")
+            caching.cache_delete("commit", "x")
+            caching.cache_delete("commit", children=True)
+            # repopulated before the commit, as another process could
+            caching.cache_set("commit", "x", value="old")
+            caching.cache_set("commit", "y", value="old")
+            self.assertEqual(len(connection.run_on_commit), 1)
+            self.assertEqual(
+                connection.satchmo_cache_deletes.keys,
+                {"::commit::x": False, "::commit": True},
+            )
+
+        self.assertRaises(caching.NotCachedError, caching.cache_get, "commit", "x")
+        self.assertRaises(caching.NotCachedError, caching.cache_get, "commit", "y")
+
+    def testAsyncDeletedAgainOnCommit(self):
+        for native in (False, True):
+            with mock.patch.object(caching, "_native_async", return_value=native):
+                with transaction.atomic():
+                    asyncio.run(caching.acache_delete("commit", "x"))
+                    caching.cache_set("commit", "x", value="old")
+                    self.assertEqual(
+                        connection.satchmo_cache_deletes.keys, {"::commit::x": False}
+                    )
+
+                self.assertRaises(
+                    caching.NotCachedError, caching.cache_get, "commit", "x"
+                )
+
+    def testRolledBackSavepoint(self):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    caching.cache_delete("commit", "x")
+                    raise ValueError
+            except ValueError:
+                pass
+            caching.cache_delete("commit", "x")
+            caching.cache_set("commit", "x", value="old")
+
+        self.assertRaises(caching.NotCachedError, caching.cache_get, "commit", "x")
+
+
+ASYNC_CALLS = []
+
+
+@caching.cache_function(length=60)
+async def acounted(x):
+    ASYNC_CALLS.append(x)
+    await asyncio.sleep(0.1)
+    return x * 2
+
+
+@override_settings(CACHE_STATS_NAMESPACES=TEST_NAMESPACES)
+class TestAsync(TestCase):
+    def setUp(self):
+        caching.STATS.clear()
+        del ASYNC_CALLS[:]
+
+    def tearDown(self):
+        caching.cache_delete()
+        caching.STATS.clear()
+        cache.clear()
+
+    def testGetSetDelete(self):
+        async def run():
+            await caching.acache_set("async", "x", value=1)
+            await caching.acache_set("async", "x", "y", value=2)
+            first = await caching.acache_get("async", "x")
+            await caching.acache_delete("async", "x", children=True)
+            return first, await caching.acache_get("async", "x", "y", default=None)
+
+        self.assertEqual(asyncio.run(run()), (1, None))
+        self.assertRaises(caching.NotCachedError, caching.cache_get, "async", "x")
+
+        counts = caching.STATS.local()["async"]
+        self.assertEqual(counts["sets"], 2)
+        self.assertEqual(counts["hits"], 1)
+
+    def testOneExecutorCallEach(self):
+        if caching._native_async():
+            self.skipTest("the backend has async methods")
+
+        async def run():
+            await caching.acache_set("async", "x", "y", value=1)
+            caching.LOCAL_CACHE.clear()
+            first = await caching.acache_get("async", "x", "y")
+            await caching.acache_delete("async", "x", children=True)
+            return first
+
+        with mock.patch.object(
+            caching, "_run_sync", wraps=caching._run_sync
+        ) as run_sync:
+            self.assertEqual(asyncio.run(run()), 1)
+        self.assertEqual(run_sync.call_count, 3)
+
+    def testSharedWithSync(self):
+        caching.cache_set("async", "x", value=1)
+        caching.cache_delete("async", children=True)
+        caching.cache_set("async", "x", value=2)
+        caching.LOCAL_CACHE.clear()
+        self.assertEqual(asyncio.run(caching.acache_get("async", "x")), 2)
+
+    def testCacheFunction(self):
+        async def run():
+            return await asyncio.gather(acounted(2), acounted(2), acounted(3))
+
+        self.assertEqual(asyncio.run(run()), [4, 4, 6])
+        self.assertEqual(sorted(ASYNC_CALLS), [2, 3])
+        self.assertEqual(asyncio.run(acounted(2)), 4)
+        self.assertEqual(sorted(ASYNC_CALLS), [2, 3])
@@ -3,10 +3,11 @@ URLConf for Caching app
 """
 
 from django.urls import path
-from satchmo.caching.views import stats_page, view_page, delete_page
+from satchmo.caching.views import stats_page, stats_json, view_page, delete_page
 
 urlpatterns = [
     path("", stats_page, {}, "caching_stats"),
+    path("stats.json", stats_json, {}, "caching_stats_json"),
     path("view/", view_page, {}, "caching_view"),
     path("delete/", delete_page, {}, "caching_delete"),
 ]
@@ -1,7 +1,7 @@
 from django import forms
 from django.conf import settings
 from django.contrib.auth.decorators import user_passes_test
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 from django.utils.translation import ugettext_lazy as _
 from satchmo.caching.models import caching
@@ -24,7 +24,7 @@ class CacheDeleteForm(forms.Form):
             caching.cache_delete()
             result = "Deleted all keys"
         elif data["tag"]:
-            caching.cache_delete(data["tag"], children=data["children"])
+            caching.cache_delete(data["tag"], children=data["children"] == "Y")
             if data["children"] == "Y":
                 result = "Deleted %s and children" % data["tag"]
             else:
@@ -36,34 +36,92 @@ class CacheDeleteForm(forms.Form):
         return result
 
 
+def _summary(counts):
+    """Add calls, hit rate and average value size to per-namespace counts."""
+    hits = (
+        counts.get("hits", 0)
+        + counts.get("local_hits", 0)
+        + counts.get("request_hits", 0)
+    )
+    calls = hits + counts.get("misses", 0)
+    if calls:
+        rate = float(hits) / calls * 100
+    else:
+        rate = 0
+
+    sets = counts.get("sets", 0)
+    if sets:
+        size = counts.get("bytes", 0) // sets
+    else:
+        size = 0
+
+    summary = dict(counts)
+    summary["calls"] = calls
+    summary["hit_rate"] = round(rate, 1)
+    summary["average_size"] = size
+    return summary
+
+
+def _namespace_stats():
+    caching.STATS.flush()
+    return dict(
+        (namespace, _summary(counts))
+        for namespace, counts in caching.STATS.shared().items()
+    )
+
+
 def stats_page(request):
-    calls = caching.CACHE_CALLS
-    hits = caching.CACHE_HITS
+    namespaces = _namespace_stats()
+    calls = sum([ns["calls"] for ns in namespaces.values()])
+    hits = calls - sum([ns.get("misses", 0) for ns in namespaces.values()])
 
     if calls and hits:
-        rate = float(caching.CACHE_HITS) / caching.CACHE_CALLS * 100
+        rate = float(hits) / calls * 100
     else:
         rate = 0
 
     ctx = {
-        "cache_count": len(caching.CACHED_KEYS),
-        "cache_time": settings.CACHE_TIMEOUT,
-        "cache_backend": settings.CACHE_BACKEND,
-        "cache_calls": caching.CACHE_CALLS,
-        "cache_hits": caching.CACHE_HITS,
+        "cache_count": len(caching.LOCAL_CACHE),
+        "cache_time": getattr(settings, "CACHE_TIMEOUT", caching.TIMEOUT),
+        "cache_backend": settings.CACHES["default"]["BACKEND"],
+        "cache_calls": calls,
+        "cache_hits": hits,
         "hit_rate": "%02.1f" % rate,
+        "namespaces": sorted(namespaces.items()),
+        "breaker": caching.BREAKER.status(),
     }
 
     return render(request, "caching/stats.html", ctx)
 
 
 stats_page = user_passes_test(
-    lambda u: u.is_authenticated() and u.is_staff, login_url="/accounts/login/"
+    lambda u: u.is_authenticated and u.is_staff, login_url="/accounts/login/"
 )(stats_page)
 
 
+def stats_json(request):
+    """Cache statistics per namespace, totalled over every process, plus the
+    counts, circuit breaker state and hot keys for the process serving the
+    request."""
+    ctx = {
+        "namespaces": _namespace_stats(),
+        "process": dict(
+            (namespace, _summary(counts))
+            for namespace, counts in caching.STATS.local().items()
+        ),
+        "breaker": caching.BREAKER.status(),
+        "hot_keys": caching.HOTKEYS.report(),
+    }
+    return JsonResponse(ctx)
+
+
+stats_json = user_passes_test(
+    lambda u: u.is_authenticated and u.is_staff, login_url="/accounts/login/"
+)(stats_json)
+
+
 def view_page(request):
-    keys = sorted(list(caching.CACHED_KEYS.keys()))
+    keys = sorted(caching.LOCAL_CACHE.keys())
 
     ctx = {"cached_keys": keys}
 
@@ -71,7 +129,7 @@ def view_page(request):
 
 
 view_page = user_passes_test(
-    lambda u: u.is_authenticated() and u.is_staff, login_url="/accounts/login/"
+    lambda u: u.is_authenticated and u.is_staff, login_url="/accounts/login/"
 )(view_page)
 
 
@@ -95,5 +153,5 @@ def delete_page(request):
 
 
 delete_page = user_passes_test(
-    lambda u: u.is_authenticated() and u.is_staff, login_url="/accounts/login/"
+    lambda u: u.is_authenticated and u.is_staff, login_url="/accounts/login/"
 )(delete_page)
@@ -1,5 +1,6 @@
 from django import forms
 
+from satchmo.configuration.models import find_settings
 from satchmo.configuration.values import ConfigurationGroup
 
 import logging
@@ -21,13 +22,25 @@ class SettingsEditor(forms.Form):
                     flattened.append(s)
             else:
                 flattened.append(setting)
+
+        # Load the current settings a group at a time
+        bygroup = {}
+        for setting in flattened:
+            bygroup.setdefault(setting.group.key, []).append(setting.key)
+        current = {}
+        for groupkey, keys in bygroup.items():
+            for key, found in find_settings(groupkey, keys).items():
+                current[(groupkey, key)] = found
+
         for setting in flattened:
             # Add the field to the customized field list
             kw = {
                 "label": setting.description,
                 "help_text": setting.help_text,
                 # Provide current setting values for initializing the form
-                "initial": setting.editor_value,
+                "initial": setting.editor_value_for(
+                    current.get((setting.group.key, setting.key))
+                ),
             }
             field = setting.make_field(**kw)
 
@@ -1,10 +1,17 @@
+from collections import OrderedDict
+
+from django.db import transaction
 from django.utils.translation import ugettext
 
-from satchmo.configuration import values
-from satchmo.configuration.models import SettingNotSet
-from satchmo.utils import is_string_like
+from satchmo import caching
+from satchmo.configuration import profiler, signals, values
+from satchmo.configuration.models import SettingNotSet, find_settings
+from satchmo.configuration.snapshot import settings_changed
+from satchmo.utils import is_string_like, load_module
 
 import logging
+import threading
+import time
 
 log = logging.getLogger(__name__)
 
@@ -18,10 +25,18 @@ class ConfigurationSettings(object):
         def __init__(self):
             self.settings = values.SortedDotDict()
             self.prereg = {}
+            # config module -> (group key, optional), not imported yet
+            self.pending_modules = OrderedDict()
+            self.loaded_modules = []
+            # held while importing, so that other threads wait for the
+            # values a module adds rather than miss them
+            self._modules_lock = threading.RLock()
+            self._importing = set()
 
         def __getitem__(self, key):
             """Get an element either by ConfigurationGroup object or by its key"""
             key = self._resolve_key(key)
+            self._load_group(key)
             return self.settings.get(key)
 
         def __getattr__(self, key):
@@ -41,6 +56,7 @@ class ConfigurationSettings(object):
         def __contains__(self, key):
             try:
                 key = self._resolve_key(key)
+                self._load_group(key)
                 return key in self.settings
             except:
                 return False
@@ -63,6 +79,7 @@ class ConfigurationSettings(object):
                 if isinstance(group, values.ConfigurationGroup):
                     group = group.key
 
+                self._load_group(group)
                 cg = self.settings.get(group, None)
                 if not cg:
                     raise SettingNotSet("%s config group does not exist" % group)
@@ -73,12 +90,14 @@ class ConfigurationSettings(object):
 
         def groups(self):
             """Return ordered list"""
+            self.load_modules()
             return list(self.settings.values())
 
         def has_config(self, group, key):
             if isinstance(group, values.ConfigurationGroup):
                 group = group.key
 
+            self._load_group(group)
             cfg = self.settings.get(group, None)
             if cfg and key in cfg:
                 return True
@@ -115,6 +134,128 @@ class ConfigurationSettings(object):
 
             return value
 
+        def register_module(self, group, module, optional=False):
+            """Import the config module `module` only once the group `group`,
+            to which it adds values or choices, is first used."""
+            with self._modules_lock:
+                if module not in self.pending_modules and not any(
+                    loaded[0] == module for loaded in self.loaded_modules
+                ):
+                    self.pending_modules[module] = (group, optional)
+
+        def _load_group(self, group):
+            # a module stays pending until it is imported
+            if self.pending_modules:
+                with self._modules_lock:
+                    self.load_modules(group)
+                    if group not in self.settings:
+                        # it may be the group of a module which is not loaded yet
+                        self.load_modules()
+
+        def load_modules(self, group=None):
+            """Import the pending config modules of `group`, or all of them.
+            A module is only taken off the pending list once it has been
+            imported, or has failed with an ImportError."""
+            with self._modules_lock:
+                modules = [
+                    module
+                    for module, (groupkey, optional) in self.pending_modules.items()
+                    if group is None or groupkey == group
+                ]
+                for module in modules:
+                    if module in self._importing or module not in self.pending_modules:
+                        # being imported further up, or by a module before it
+                        continue
+                    self._load_module(module, self.pending_modules[module][1])
+
+        def _load_module(self, module, optional):
+            start = time.time()
+            error = None
+            self._importing.add(module)
+            try:
+                load_module(module)
+            except ImportError as e:
+                error = str(e)
+                if optional:
+                    log.debug("Could not load configuration module %s", module)
+                else:
+                    log.warning("Could not load configuration module %s", module)
+            finally:
+                self._importing.discard(module)
+            del self.pending_modules[module]
+
+            elapsed = time.time() - start
+            self.loaded_modules.append((module, elapsed, error))
+            log.debug(
+                "Loaded configuration module %s in %.1fms", module, elapsed * 1000
+            )
+
+        def update_values(self, new_values):
+            """Update many values at once.
+
+            `new_values` is a dict of (group key, key) -> new value.  Only the
+            values which differ from the current ones are written, in one
+            transaction with bulk queries.  The cache is invalidated once, and
+            `configuration_values_changed` is sent once with all the changes,
+            followed by `configuration_value_changed` for each of them.
+
+            Returns the list of changed Values.
+            """
+            bygroup = {}
+            for (groupkey, key), value in new_values.items():
+                bygroup.setdefault(groupkey, {})[key] = value
+
+            changes = []
+            created = {}
+            updated = {}
+            deleted = {}
+            for groupkey, group_values in bygroup.items():
+                current = find_settings(groupkey, list(group_values.keys()))
+                for key, value in group_values.items():
+                    cfg = self.get_config(groupkey, key)
+                    setting = current.get(key)
+                    old_value = cfg.to_python(cfg._value(setting))
+                    new_value = cfg.to_python(value)
+                    if old_value == new_value:
+                        continue
+
+                    db_value = cfg.get_db_prep_save(value)
+                    if cfg.use_default and cfg.default == new_value:
+                        if setting:
+                            deleted.setdefault(type(setting), []).append(setting.pk)
+                    elif setting:
+                        setting.value = db_value
+                        updated.setdefault(type(setting), []).append(setting)
+                    else:
+                        setting = cfg.make_setting(db_value)
+                        created.setdefault(type(setting), []).append(setting)
+                    changes.append((cfg, old_value, new_value))
+
+            if not changes:
+                return []
+
+            with transaction.atomic():
+                for model, settings in created.items():
+                    model.objects.bulk_create(settings)
+                for model, settings in updated.items():
+                    model.objects.bulk_update(settings, ["value"])
+                for model, pks in deleted.items():
+                    model.objects.filter(pk__in=pks).delete()
+
+                caching.cache_delete("setting", children=True)
+                settings_changed()
+
+            log.info(
+                "Updated settings %s",
+                ", ".join(["%s.%s" % (cfg.group.key, cfg.key) for cfg, o, n in changes]),
+            )
+            signals.configuration_values_changed.send(self, changes=changes)
+            for cfg, old_value, new_value in changes:
+                signals.configuration_value_changed.send(
+                    cfg, old_value=old_value, new_value=new_value, setting=cfg
+                )
+            return [cfg for cfg, old_value, new_value in changes]
+
     __instance = None
 
     def __init__(self):
@@ -209,10 +350,25 @@ def config_register_list(*args):
         config_register(value)
 
 
+def config_register_module(group, module, optional=False):
+    """Register a config module, to be imported when `group` is first used.
+
+    Parameters:
+        - group - the key of the group the module adds values or choices to
+        - module - the dotted name of the module
+        - optional - if True, failing to import it is only logged at debug
+    """
+    ConfigurationSettings().register_module(group, module, optional=optional)
+
+
 def config_value(group, key, default=_NOTSET):
     """Get a value from the configuration system"""
     try:
-        return config_get(group, key).value
+        cfg = config_get(group, key)
+        profile = profiler.PROFILE.get()
+        if profile is not None:
+            profile.read(cfg, cfg.has_setting())
+        return cfg.value
     except SettingNotSet:
         if default != _NOTSET:
             return default
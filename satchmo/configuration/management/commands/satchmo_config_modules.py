@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from satchmo.configuration.functions import ConfigurationSettings
+
+
+class Command(BaseCommand):
+    help = (
+        "Lists the shipping, payment and fulfilment config modules loaded at "
+        "startup, with how long each took, and those not loaded yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--load",
+            action="store_true",
+            help="Load the pending modules too, timing each of them.",
+        )
+
+    def handle(self, *args, **options):
+        mgr = ConfigurationSettings()
+        if options["load"]:
+            mgr.load_modules()
+
+        total = 0
+        for module, elapsed, error in mgr.loaded_modules:
+            total += elapsed
+            if error:
+                self.stdout.write(
+                    "%8.1fms  %s (failed: %s)" % (elapsed * 1000, module, error)
+                )
+            else:
+                self.stdout.write("%8.1fms  %s" % (elapsed * 1000, module))
+        self.stdout.write(
+            "Loaded %i modules in %.1fms" % (len(mgr.loaded_modules), total * 1000)
+        )
+
+        for module in mgr.pending_modules:
+            self.stdout.write("  pending  %s" % module)
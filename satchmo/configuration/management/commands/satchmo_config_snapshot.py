@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from satchmo.configuration import snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes every configuration setting to a file, which workers load at "
+        "startup when CONFIGURATION_SNAPSHOT_FILE points at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The file to write.")
+
+    def handle(self, *args, **options):
+        count = snapshot.write_file(options["path"])
+        self.stdout.write("Wrote %i settings to %s" % (count, options["path"]))
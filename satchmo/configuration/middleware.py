@@ -0,0 +1,28 @@
+from satchmo.configuration import profiler
+
+
+class ConfigProfileMiddleware(object):
+    """Profiles the configuration reads of each request when
+    CONFIGURATION_PROFILE is set.  See satchmo.configuration.profiler."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiler.is_enabled():
+            return self.get_response(request)
+
+        profile = profiler.ConfigProfile()
+        token = profiler.PROFILE.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.PROFILE.reset(token)
+
+        match = getattr(request, "resolver_match", None)
+        if match is not None and match.view_name:
+            view = match.view_name
+        else:
+            view = profiler.UNRESOLVED
+        profiler.record(view, profile)
+        return response
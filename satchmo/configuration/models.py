@@ -1,16 +1,24 @@
 from django.apps import apps
 from django.db import models
 
-from satchmo.caching import cache_key, cache_get, cache_set, NotCachedError
+from satchmo.caching import (
+    cache_key,
+    cache_get,
+    cache_get_many,
+    cache_set,
+    cache_set_many,
+    NotCachedError,
+)
 from satchmo.caching.models import CachedObjectMixin
 
 from .exceptions import SettingNotSet
+from .snapshot import settings_changed
 
 import logging
 
 log = logging.getLogger(__name__)
 
-__all__ = ["Setting", "LongSetting", "find_setting"]
+__all__ = ["Setting", "LongSetting", "find_setting", "find_settings"]
 
 
 def find_setting(group, key):
@@ -44,6 +52,32 @@ def find_setting(group, key):
     return setting
 
 
+def find_settings(group, keys):
+    """Get the settings or longsettings for many keys of a group at once.
+
+    Returns a dict of key -> setting, with None for keys which have no
+    setting.  The cache is read in one call, and any misses are loaded with
+    one query per table and cached together.
+    """
+    cachekeys = dict((cache_key("setting", group, key), key) for key in keys)
+    hits, misses = cache_get_many(list(cachekeys.keys()))
+    found = dict((cachekeys[ck], setting) for ck, setting in hits.items())
+
+    if misses and apps.ready:
+        missing = [cachekeys[ck] for ck in misses]
+        loaded = dict((key, None) for key in missing)
+        for model in (LongSetting, Setting):
+            for setting in model.objects.filter(group__exact=group, key__in=missing):
+                loaded[setting.key] = setting
+
+        cache_set_many(
+            dict((cache_key("setting", group, key), s) for key, s in loaded.items())
+        )
+        found.update(loaded)
+
+    return found
+
+
 class Setting(models.Model, CachedObjectMixin):
     group = models.CharField(max_length=100, blank=False, null=False)
     key = models.CharField(max_length=100, blank=False, null=False)
@@ -59,10 +93,9 @@ class Setting(models.Model, CachedObjectMixin):
         )
 
     def save(self, *args, **kwargs):
-
         super(Setting, self).save(*args, **kwargs)
-
-        self.cache_set()
+        self.cache_delete()
+        settings_changed()
 
     def __bool__(self):
         return self.id is not None
@@ -73,6 +106,7 @@ class Setting(models.Model, CachedObjectMixin):
     def delete(self):
         self.cache_delete()
         super(Setting, self).delete()
+        settings_changed()
 
 
 class LongSetting(models.Model, CachedObjectMixin):
@@ -91,7 +125,8 @@ class LongSetting(models.Model, CachedObjectMixin):
 
     def save(self, *args, **kwargs):
         super(LongSetting, self).save(*args, **kwargs)
-        self.cache_set()
+        self.cache_delete()
+        settings_changed()
 
     def cache_key(self, *args, **kwargs):
         # note same cache pattern as Setting.  This is so we can look up in one check.
@@ -102,3 +137,4 @@ class LongSetting(models.Model, CachedObjectMixin):
     def delete(self):
         self.cache_delete()
         super(LongSetting, self).delete()
+        settings_changed()
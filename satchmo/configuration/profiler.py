@@ -0,0 +1,119 @@
+"""Opt-in profiling of configuration reads.
+
+With CONFIGURATION_PROFILE set, ConfigProfileMiddleware counts every
+`config_value` read made while handling a request: how often each group and
+key was read, how many of those reads came from a saved setting rather than
+the default, and the time spent in `to_python`.  Each request's counts are
+written to the debug log and added to per-view totals for this process,
+which staff can read at the "satchmo_config_profile" URL.
+"""
+
+from collections import defaultdict
+import contextvars
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+# The ConfigProfile of the request being handled, if profiling.
+PROFILE = contextvars.ContextVar("satchmo_config_profile", default=None)
+
+# Requests which did not resolve to a view are totalled together, as are
+# the views seen once MAX_VIEWS views have totals.
+UNRESOLVED = "<unresolved>"
+OTHER_VIEWS = "<other>"
+MAX_VIEWS = 500
+
+_VIEWS = {}
+_LOCK = threading.Lock()
+
+
+def _read_counts():
+    return {"reads": 0, "db": 0, "default": 0, "to_python_ms": 0.0}
+
+
+class ConfigProfile(object):
+    """The configuration reads of one request, keyed by "GROUP.KEY"."""
+
+    def __init__(self):
+        self.reads = defaultdict(_read_counts)
+
+    def read(self, cfg, from_db):
+        counts = self.reads["%s.%s" % (cfg.group.key, cfg.key)]
+        counts["reads"] += 1
+        if from_db:
+            counts["db"] += 1
+        else:
+            counts["default"] += 1
+
+    def converted(self, cfg, seconds):
+        counts = self.reads["%s.%s" % (cfg.group.key, cfg.key)]
+        counts["to_python_ms"] += seconds * 1000
+
+    def summary(self):
+        """Return the keys as a list of (key, counts), most read first."""
+        return sorted(self.reads.items(), key=lambda item: -item[1]["reads"])
+
+
+def is_enabled():
+    return getattr(settings, "CONFIGURATION_PROFILE", False)
+
+
+def to_python(cfg, value):
+    """Call `cfg.to_python(value)`, timing it if profiling."""
+    profile = PROFILE.get()
+    if profile is None:
+        return cfg.to_python(value)
+
+    start = time.time()
+    try:
+        return cfg.to_python(value)
+    finally:
+        profile.converted(cfg, time.time() - start)
+
+
+def record(view, profile):
+    """Log the reads of one request to `view`, and add them to its totals."""
+    summary = profile.summary()
+    log.debug(
+        "%s read %i configuration values %i times: %s",
+        view,
+        len(summary),
+        sum([counts["reads"] for key, counts in summary]),
+        ", ".join(["%s x%i" % (key, counts["reads"]) for key, counts in summary]),
+    )
+
+    with _LOCK:
+        if view not in _VIEWS and len(_VIEWS) >= MAX_VIEWS:
+            view = OTHER_VIEWS
+        totals = _VIEWS.setdefault(view, {"requests": 0, "reads": {}})
+        totals["requests"] += 1
+        for key, counts in summary:
+            key_totals = totals["reads"].setdefault(key, _read_counts())
+            for name, value in counts.items():
+                key_totals[name] += value
+
+
+def view_totals():
+    """Return a copy of the per-view totals."""
+    with _LOCK:
+        return dict(
+            (
+                view,
+                {
+                    "requests": totals["requests"],
+                    "reads": dict(
+                        (key, dict(counts)) for key, counts in totals["reads"].items()
+                    ),
+                },
+            )
+            for view, totals in _VIEWS.items()
+        )
+
+
+def clear():
+    with _LOCK:
+        _VIEWS.clear()
@@ -1,3 +1,7 @@
 import django.dispatch
 
 configuration_value_changed = django.dispatch.Signal()
+
+# Sent once by ConfigurationSettings.update_values, with `changes`, a list of
+# (Value, old value, new value).
+configuration_values_changed = django.dispatch.Signal()
@@ -0,0 +1,252 @@
+"""An in-process snapshot of every configuration setting.
+
+All Setting and LongSetting rows are loaded in two queries and kept with the
+version they were loaded at.  The version is a random token in the shared
+cache, replaced whenever a setting is saved or deleted, so a process reloads
+its snapshot once another one has changed a setting.  A token never repeats,
+so should the cache lose it a new one is published and every process
+reloads.  As a backstop a snapshot is also reloaded once it is
+CONFIGURATION_SNAPSHOT_MAX_AGE seconds old.  Values are converted with
+`to_python` once per snapshot.
+
+If CONFIGURATION_SNAPSHOT_FILE is set, the settings are instead read once
+from that file, as written by the satchmo_config_snapshot command, and the
+database is never used for them.
+"""
+
+import copy
+import datetime
+import json
+import logging
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings as django_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from satchmo import caching
+from satchmo.configuration import profiler
+
+log = logging.getLogger(__name__)
+
+VERSION_KEY = "::configuration::version"
+FILE_FORMAT = 1
+MAX_AGE = 300
+
+_SNAPSHOT = None
+_FILE_SNAPSHOT = None
+_LOCK = threading.Lock()
+# set once loading has failed, so that is only logged once until it works
+_LOAD_FAILED = False
+
+
+class StoredSetting(object):
+    """A setting as read from a snapshot file."""
+
+    __slots__ = ("group", "key", "value")
+
+    def __init__(self, group, key, value):
+        self.group = group
+        self.key = key
+        self.value = value
+
+
+class Snapshot(object):
+    """The settings as loaded at `version`, a dict of (group, key) ->
+    Setting or LongSetting."""
+
+    def __init__(self, version, settings):
+        self.version = version
+        self.settings = settings
+        self.loaded = time.time()
+        self._values = {}
+
+    def is_current(self, version):
+        if self.version != version:
+            return False
+        max_age = getattr(django_settings, "CONFIGURATION_SNAPSHOT_MAX_AGE", MAX_AGE)
+        return not max_age or time.time() - self.loaded < max_age
+
+    def value(self, cfg):
+        """Return the Python value of the registered Value `cfg`."""
+        k = (cfg.group.key, cfg.key)
+        try:
+            owner, val = self._values[k]
+        except KeyError:
+            owner = None
+
+        if owner is not cfg:
+            val = profiler.to_python(cfg, cfg._value(self.settings.get(k)))
+            self._values[k] = (cfg, val)
+
+        if isinstance(val, (dict, list, set)):
+            val = copy.copy(val)
+        return val
+
+
+def current_snapshot():
+    """Return the snapshot for the current version of the settings, or None
+    if settings must be looked up one by one.
+
+    That is the case before the app registry is ready, if the tables cannot
+    be read, and for the rest of a transaction which has changed a setting,
+    as those changes are not visible to other connections.
+
+    A snapshot file is always used once it is configured, even before the
+    app registry is ready.
+    """
+    global _SNAPSHOT, _LOAD_FAILED
+
+    path = getattr(django_settings, "CONFIGURATION_SNAPSHOT_FILE", None)
+    if path:
+        return file_snapshot(path)
+
+    if not apps.ready:
+        return None
+
+    connection = transaction.get_connection()
+    if getattr(connection, "satchmo_config_changed", False):
+        if connection.in_atomic_block:
+            return None
+        connection.satchmo_config_changed = False
+
+    version = caching.cache_token(VERSION_KEY)
+    snapshot = _SNAPSHOT
+    if snapshot is None or not snapshot.is_current(version):
+        try:
+            snapshot = _load(version)
+        except Exception as e:
+            if not _LOAD_FAILED:
+                log.warning(
+                    "Could not load the configuration snapshot, OK if you are in syncdb: %s",
+                    e,
+                )
+                _LOAD_FAILED = True
+            return None
+        with _LOCK:
+            _SNAPSHOT = snapshot
+            _LOAD_FAILED = False
+    return snapshot
+
+
+def _load(version):
+    from satchmo.configuration.models import LongSetting, Setting
+
+    settings = {}
+    # a Setting overrides a LongSetting, as in find_setting
+    for model in (LongSetting, Setting):
+        for setting in model.objects.all():
+            settings[(setting.group, setting.key)] = setting
+    log.debug("Loaded %i settings at version %s", len(settings), version)
+    return Snapshot(version, settings)
+
+
+def file_snapshot(path):
+    """Return the snapshot read from the file at `path`, reading it only
+    once per process."""
+    global _FILE_SNAPSHOT
+
+    snapshot = _FILE_SNAPSHOT
+    if snapshot is None or snapshot.path != path:
+        snapshot = read_file(path)
+        with _LOCK:
+            _FILE_SNAPSHOT = snapshot
+    return snapshot
+
+
+def read_file(path):
+    with open(path) as f:
+        data = json.load(f)
+
+    if data.get("format") != FILE_FORMAT:
+        raise ImproperlyConfigured(
+            "%s is not a configuration snapshot file of format %s"
+            % (path, FILE_FORMAT)
+        )
+
+    settings = dict(
+        ((group, key), StoredSetting(group, key, value))
+        for group, key, value in data["settings"]
+    )
+    log.debug(
+        "Loaded %i settings at version %s from %s",
+        len(settings),
+        data["version"],
+        path,
+    )
+    snapshot = Snapshot(data["version"], settings)
+    snapshot.path = path
+    return snapshot
+
+
+def write_file(path):
+    """Write the effective value of every setting to the file at `path`,
+    returning the number of settings written.
+
+    Those saved in the database are written as they are, and the defaults of
+    every other registered value as they would be saved, so that the file
+    pins the defaults of the code it was written with.  A default which
+    would not read back as itself is left out, and so comes from the code.
+    """
+    from satchmo.configuration.functions import ConfigurationSettings
+
+    version = caching.cache_token(VERSION_KEY)
+    snapshot = _load(version)
+    values = dict(((s.group, s.key), s.value) for s in snapshot.settings.values())
+    for group in ConfigurationSettings().groups():
+        # not iterated, which would sort the values by value
+        for key, cfg in group.items():
+            k = (group.key, key)
+            if k not in values and cfg.use_default:
+                value = _default_db_value(cfg)
+                if value is not None:
+                    values[k] = value
+
+    data = {
+        "format": FILE_FORMAT,
+        "version": version,
+        "created": datetime.datetime.now().isoformat(),
+        "settings": sorted(
+            [group, key, value] for (group, key), value in values.items()
+        ),
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=1)
+    return len(data["settings"])
+
+
+def _default_db_value(cfg):
+    """Return the default of `cfg` as it would be saved, or None if it would
+    not read back as the default."""
+    try:
+        value = cfg.get_db_prep_save(cfg.default)
+        if isinstance(value, str) and cfg.to_python(value) == cfg.to_python(
+            cfg.default
+        ):
+            return value
+    except Exception as e:
+        log.debug("Not writing the default of %s.%s: %s", cfg.group.key, cfg.key, e)
+    return None
+
+
+def settings_changed():
+    """Move every process on to a new snapshot.  Inside a transaction this
+    connection stops using snapshots until the transaction is over, and the
+    version is moved on again when it commits."""
+    global _SNAPSHOT
+
+    with _LOCK:
+        _SNAPSHOT = None
+    _new_version()
+
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        connection.satchmo_config_changed = True
+        if not any(entry[1] is _new_version for entry in connection.run_on_commit):
+            transaction.on_commit(_new_version)
+
+
+def _new_version():
+    caching.new_cache_token(VERSION_KEY)
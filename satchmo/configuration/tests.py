@@ -1,6 +1,22 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import transaction
+from django.http import HttpResponseNotFound
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
 
 from satchmo import caching
+from satchmo.configuration import profiler, signals, snapshot
 
 from satchmo.configuration.functions import (
     config_add_choice,
@@ -9,12 +25,15 @@ from satchmo.configuration.functions import (
     config_get_group,
     config_register,
     config_register_list,
+    config_register_module,
     config_value,
     config_collect_values,
     config_choice_values,
     ConfigurationSettings,
 )
-from satchmo.configuration.models import LongSetting
+from satchmo.configuration.middleware import ConfigProfileMiddleware
+from satchmo.configuration.models import LongSetting, Setting, find_settings
+from satchmo.contact.factories import UserFactory
 from satchmo.configuration.values import (
     SHOP_GROUP,
     SettingNotSet,
@@ -70,6 +89,46 @@ class ConfigurationTestSettings(TestCase):
         c = config_get("test2", "s2")
         self.assertEqual(c.value, 10)
 
+    def testUpdateValues(self):
+        received = []
+
+        def listener(sender, changes, **kwargs):
+            received.append([(cfg.key, old, new) for cfg, old, new in changes])
+
+        signals.configuration_values_changed.connect(listener)
+        try:
+            changed = ConfigurationSettings().update_values(
+                {("test2", "s1"): "test", ("test2", "s2"): 10, ("test2", "s3"): 5}
+            )
+        finally:
+            signals.configuration_values_changed.disconnect(listener)
+
+        self.assertEqual(sorted([cfg.key for cfg in changed]), ["s1", "s3"])
+        self.assertEqual(sorted(received[0]), [("s1", "", "test"), ("s3", 10, 5)])
+        self.assertEqual(len(received), 1)
+        self.assertEqual(config_value("test2", "s1"), "test")
+        self.assertEqual(config_value("test2", "s3"), 5)
+
+        changed = ConfigurationSettings().update_values(
+            {("test2", "s1"): "test", ("test2", "s3"): 10}
+        )
+        self.assertEqual([cfg.key for cfg in changed], ["s3"])
+        self.assertFalse(Setting.objects.filter(group="test2", key="s3").exists())
+        self.assertEqual(config_value("test2", "s3"), 10)
+
+    def testFindSettings(self):
+        config_get("test2", "s1").update("test")
+        caching.cache_delete()
+
+        found = find_settings("test2", ["s1", "s2"])
+        self.assertEqual(found["s1"].value, "test")
+        self.assertEqual(found["s2"], None)
+
+        # now served from the cache
+        with self.assertNumQueries(0):
+            found = find_settings("test2", ["s1", "s2"])
+        self.assertEqual(found["s1"].value, "test")
+
     def testSetAndReset(self):
         """Test setting one value and then updating"""
         c = config_get("test2", "s1")
@@ -544,3 +603,253 @@ class LongSettingTest(TestCase):
             self.fail("Should be deletec")
         except LongSetting.DoesNotExist:
             pass
+
+
+class ConfigSnapshotTest(TransactionTestCase):
+    def setUp(self):
+        caching.cache_delete()
+        g = ConfigurationGroup("snap", "snap")
+        config_register(StringValue(g, "s1"))
+        config_register(IntegerValue(g, "s2", default=10))
+        config_register(MultipleStringValue(g, "m", default=["a"]))
+
+    def tearDown(self):
+        caching.cache_delete()
+        cache.clear()
+
+    def testValuesFromSnapshot(self):
+        config_get("snap", "s1").update("first")
+        self.assertEqual(config_value("snap", "s1"), "first")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(config_value("snap", "s1"), "first")
+            self.assertEqual(config_value("snap", "s2"), 10)
+            config_value("snap", "m").append("b")
+            self.assertEqual(config_value("snap", "m"), ["a"])
+
+    def testChangedElsewhere(self):
+        config_get("snap", "s1").update("first")
+        self.assertEqual(config_value("snap", "s1"), "first")
+
+        Setting.objects.filter(group="snap", key="s1").update(value="second")
+        self.assertEqual(config_value("snap", "s1"), "first")
+        snapshot._new_version()
+        self.assertEqual(config_value("snap", "s1"), "second")
+
+    def testVersionLost(self):
+        config_get("snap", "s1").update("first")
+        self.assertEqual(config_value("snap", "s1"), "first")
+
+        # a counter would start again and reach the version already loaded
+        cache.clear()
+        Setting.objects.filter(group="snap", key="s1").update(value="second")
+        snapshot._new_version()
+        self.assertEqual(config_value("snap", "s1"), "second")
+
+        cache.clear()
+        Setting.objects.filter(group="snap", key="s1").update(value="third")
+        self.assertEqual(config_value("snap", "s1"), "third")
+
+    def testMaxAge(self):
+        config_get("snap", "s1").update("first")
+        self.assertEqual(config_value("snap", "s1"), "first")
+
+        Setting.objects.filter(group="snap", key="s1").update(value="second")
+        with self.settings(CONFIGURATION_SNAPSHOT_MAX_AGE=60):
+            self.assertEqual(config_value("snap", "s1"), "first")
+            snapshot.current_snapshot().loaded -= 61
+            self.assertEqual(config_value("snap", "s1"), "second")
+
+    def testLoadFailureLoggedOnce(self):
+        with mock.patch.object(snapshot, "_load", side_effect=Exception("no table")):
+            with self.assertLogs("satchmo.configuration.snapshot") as logs:
+                snapshot._new_version()
+                self.assertEqual(snapshot.current_snapshot(), None)
+                self.assertEqual(snapshot.current_snapshot(), None)
+        self.assertEqual(len(logs.output), 1)
+
+        self.assertNotEqual(snapshot.current_snapshot(), None)
+        self.assertFalse(snapshot._LOAD_FAILED)
+
+    def testChangedInTransaction(self):
+        config_get("snap", "s1").update("first")
+        with transaction.atomic():
+            config_get("snap", "s1").update("second")
+            self.assertEqual(snapshot.current_snapshot(), None)
+            self.assertEqual(config_value("snap", "s1"), "second")
+        self.assertEqual(config_value("snap", "s1"), "second")
+        self.assertNotEqual(snapshot.current_snapshot(), None)
+
+
+class ConfigSnapshotFileTest(TestCase):
+    def setUp(self):
+        caching.cache_delete()
+        g = ConfigurationGroup("snapfile", "snapfile")
+        config_register(StringValue(g, "s1"))
+        config_register(IntegerValue(g, "s2", default=10))
+        config_register(LongStringValue(g, "l1"))
+        self.path = os.path.join(tempfile.mkdtemp(), "configuration.json")
+
+    def tearDown(self):
+        snapshot._FILE_SNAPSHOT = None
+        shutil.rmtree(os.path.dirname(self.path))
+        caching.cache_delete()
+
+    def testLoadedFromFile(self):
+        config_get("snapfile", "s1").update("saved")
+        config_get("snapfile", "l1").update("long")
+        out = StringIO()
+        call_command("satchmo_config_snapshot", self.path, stdout=out)
+        self.assertIn("Wrote ", out.getvalue())
+
+        Setting.objects.all().delete()
+        LongSetting.objects.all().delete()
+        with self.settings(CONFIGURATION_SNAPSHOT_FILE=self.path):
+            with self.assertNumQueries(0):
+                self.assertEqual(config_value("snapfile", "s1"), "saved")
+                self.assertEqual(config_value("snapfile", "s2"), 10)
+                self.assertEqual(config_value("snapfile", "l1"), "long")
+
+    def testDefaultsWritten(self):
+        config_get("snapfile", "s1").update("saved")
+        snapshot.write_file(self.path)
+        with open(self.path) as f:
+            written = dict(
+                ((group, key), value) for group, key, value in json.load(f)["settings"]
+            )
+        self.assertEqual(written[("snapfile", "s1")], "saved")
+        self.assertEqual(written[("snapfile", "s2")], "10")
+        # no default, so not set
+        self.assertNotIn(("snapfile", "l1"), written)
+        self.assertEqual(written[("SHOP", "RANDOM_FEATURED")], "False")
+
+        # the file pins the default it was written with
+        config_register(IntegerValue(config_get_group("snapfile"), "s2", default=20))
+        try:
+            with self.settings(CONFIGURATION_SNAPSHOT_FILE=self.path):
+                self.assertEqual(config_value("snapfile", "s2"), 10)
+        finally:
+            config_register(
+                IntegerValue(config_get_group("snapfile"), "s2", default=10)
+            )
+
+    def testBadFormat(self):
+        with open(self.path, "w") as f:
+            f.write('{"format": 0}')
+        with self.settings(CONFIGURATION_SNAPSHOT_FILE=self.path):
+            self.assertRaises(ImproperlyConfigured, config_value, "snapfile", "s1")
+
+
+class ConfigModuleTest(TestCase):
+    def setUp(self):
+        self.module = "satchmo.configuration.tests_lazy_config"
+        self.mgr = ConfigurationSettings()
+
+    def tearDown(self):
+        self.mgr.pending_modules.pop(self.module, None)
+
+    def testLoadedWhenGroupUsed(self):
+        config_register_module("PAYMENT", self.module, optional=True)
+        self.assertIn(self.module, self.mgr.pending_modules)
+
+        config_value("PAYMENT", "LIVE")
+        self.assertNotIn(self.module, self.mgr.pending_modules)
+        loaded = [m for m in self.mgr.loaded_modules if m[0] == self.module]
+        self.assertEqual(len(loaded), 1)
+        # it does not exist, so it is reported as failed
+        self.assertTrue(loaded[0][2])
+
+    def testOtherThreadsWait(self):
+        group = ConfigurationGroup("lazy", "Lazy")
+        started = threading.Event()
+
+        def slow_import(module):
+            started.set()
+            time.sleep(0.1)
+            config_register(StringValue(group, "s1", default="lazy"))
+
+        self.module = "satchmo.configuration.tests_lazy_config_3"
+        config_register_module("lazy", self.module)
+        with mock.patch(
+            "satchmo.configuration.functions.load_module", side_effect=slow_import
+        ) as load:
+            thread = threading.Thread(target=self.mgr.has_config, args=("lazy", "s1"))
+            thread.start()
+            self.assertTrue(started.wait(5))
+            self.assertTrue(self.mgr.has_config("lazy", "s1"))
+            thread.join()
+        self.assertEqual(load.call_count, 1)
+        self.assertNotIn(self.module, self.mgr.pending_modules)
+
+    def testFailedImportStaysPending(self):
+        self.module = "satchmo.configuration.tests_lazy_config_4"
+        config_register_module("lazy", self.module)
+        with mock.patch(
+            "satchmo.configuration.functions.load_module", side_effect=RuntimeError
+        ):
+            self.assertRaises(RuntimeError, self.mgr.load_modules, "lazy")
+        self.assertIn(self.module, self.mgr.pending_modules)
+
+    def testReport(self):
+        config_value("PAYMENT", "LIVE")
+        self.module = "satchmo.configuration.tests_lazy_config_2"
+        config_register_module("NOT_USED_YET", self.module)
+        out = StringIO()
+        call_command("satchmo_config_modules", stdout=out)
+        self.assertIn("pending  %s" % self.module, out.getvalue())
+        self.assertIn("satchmo.payment.modules.dummy.config", out.getvalue())
+
+
+class ConfigProfileTest(TestCase):
+    def setUp(self):
+        g = ConfigurationGroup("profiled", "Profiled")
+        config_register(StringValue(g, "s1", default="default"))
+        config_register(IntegerValue(g, "i1", default=1))
+        config_get("profiled", "i1").update(2)
+        self.profile = profiler.ConfigProfile()
+        self.token = profiler.PROFILE.set(self.profile)
+
+    def tearDown(self):
+        profiler.PROFILE.reset(self.token)
+        profiler.clear()
+
+    def testCountsReads(self):
+        config_value("profiled", "s1")
+        config_value("profiled", "s1")
+        config_value("profiled", "i1")
+        self.assertEqual(self.profile.reads["profiled.s1"]["reads"], 2)
+        self.assertEqual(self.profile.reads["profiled.s1"]["default"], 2)
+        self.assertEqual(self.profile.reads["profiled.i1"]["db"], 1)
+        self.assertEqual(self.profile.summary()[0][0], "profiled.s1")
+
+    def testViewTotals(self):
+        config_value("profiled", "i1")
+        profiler.record("a_view", self.profile)
+        profiler.record("a_view", self.profile)
+
+        self.client.force_login(UserFactory(is_staff=True))
+        response = self.client.get(reverse("satchmo_config_profile"))
+        self.assertEqual(response.status_code, 200)
+        totals = response.json()["views"]["a_view"]
+        self.assertEqual(totals["requests"], 2)
+        self.assertEqual(totals["reads"]["profiled.i1"]["reads"], 2)
+
+    @override_settings(CONFIGURATION_PROFILE=True)
+    def testUnresolvedPaths(self):
+        middleware = ConfigProfileMiddleware(lambda request: HttpResponseNotFound())
+        middleware(RequestFactory().get("/no-such-page/1/"))
+        middleware(RequestFactory().get("/no-such-page/2/"))
+        totals = profiler.view_totals()
+        self.assertEqual(list(totals.keys()), [profiler.UNRESOLVED])
+        self.assertEqual(totals[profiler.UNRESOLVED]["requests"], 2)
+
+    def testMaxViews(self):
+        with mock.patch.object(profiler, "MAX_VIEWS", 2):
+            for view in ["a_view", "b_view", "c_view", "d_view", "a_view"]:
+                profiler.record(view, self.profile)
+        totals = profiler.view_totals()
+        self.assertEqual(
+            sorted(totals.keys()), [profiler.OTHER_VIEWS, "a_view", "b_view"]
+        )
+        self.assertEqual(totals["a_view"]["requests"], 2)
+        self.assertEqual(totals[profiler.OTHER_VIEWS]["requests"], 2)
@@ -1,7 +1,8 @@
 from django.urls import path
-from satchmo.configuration.views import site_settings, group_settings
+from satchmo.configuration.views import group_settings, profile_json, site_settings
 
 urlpatterns = [
     path("", site_settings, {}, "satchmo_site_settings"),
+    path("profile.json", profile_json, {}, "satchmo_config_profile"),
     path("<path:group>/", group_settings),
 ]
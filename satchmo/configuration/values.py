@@ -17,7 +17,9 @@ from django.core.exceptions import ImproperlyConfigured
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext, ugettext_lazy as _
 
+from satchmo.configuration import profiler
 from satchmo.configuration.exceptions import SettingNotSet
+from satchmo.configuration.snapshot import current_snapshot
 from satchmo.utils import load_module, is_string_like, is_list_or_tuple
 
 __all__ = [
@@ -320,9 +322,29 @@ class Value(object):
 
     setting = property(fget=_setting)
 
-    def _value(self):
+    def has_setting(self):
+        """True if a setting is saved for this value, so that its default is
+        not used."""
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            return bool(snapshot.settings.get((self.group.key, self.key)))
+
         try:
-            val = self.setting.value
+            return bool(self.setting)
+        except SettingNotSet:
+            return False
+
+    def _value(self, setting=NOTSET):
+        try:
+            if setting is NOTSET:
+                snapshot = current_snapshot()
+                if snapshot is None:
+                    setting = self.setting
+                else:
+                    setting = snapshot.settings.get((self.group.key, self.key))
+            if not setting:
+                raise SettingNotSet(self.key)
+            val = setting.value
 
         except SettingNotSet:
             if self.use_default:
@@ -396,8 +418,12 @@ class Value(object):
         return False
 
     def value(self):
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            return snapshot.value(self)
+
         val = self._value()
-        return self.to_python(val)
+        return profiler.to_python(self, val)
 
     value = property(fget=value)
 
@@ -407,6 +433,11 @@ class Value(object):
 
     editor_value = property(fget=editor_value)
 
+    def editor_value_for(self, setting):
+        """Return the editor value given the already loaded `setting`, which
+        may be None, as returned by `find_settings`."""
+        return self.to_editor(self._value(setting))
+
     # Subclasses should override the following methods where applicable
 
     def to_python(self, value):
@@ -1,9 +1,10 @@
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 
 from satchmo.configuration.forms import SettingsEditor
+from satchmo.configuration import profiler
 from satchmo.configuration.functions import ConfigurationSettings
 
 import logging
@@ -28,16 +29,17 @@ def group_settings(request, group, template="configuration/group_settings.html")
         form = SettingsEditor(data, settings=settings)
         if form.is_valid():
             form.full_clean()
-            for name, value in list(form.cleaned_data.items()):
-                group, key = name.split("__")
-                cfg = mgr.get_config(group, key)
-                if cfg.update(value):
-                    # Give user feedback as to which settings were changed
-                    messages.add_message(
-                        request,
-                        messages.SUCCESS,
-                        "Updated %s on %s" % (cfg.key, cfg.group.key),
-                    )
+            new_values = dict(
+                (tuple(name.split("__")), value)
+                for name, value in form.cleaned_data.items()
+            )
+            for cfg in mgr.update_values(new_values):
+                # Give user feedback as to which settings were changed
+                messages.add_message(
+                    request,
+                    messages.SUCCESS,
+                    "Updated %s on %s" % (cfg.key, cfg.group.key),
+                )
 
             return HttpResponseRedirect(request.path)
     else:
@@ -57,3 +59,13 @@ def site_settings(request):
     return group_settings(
         request, group=None, template="configuration/site_settings.html"
     )
+
+
+def profile_json(request):
+    """The configuration reads profiled in this process, per view."""
+    return JsonResponse(
+        {"enabled": profiler.is_enabled(), "views": profiler.view_totals()}
+    )
+
+
+profile_json = staff_member_required(profile_json)
@@ -3,12 +3,18 @@ import datetime
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
+from satchmo import caching
 from satchmo.l10n.models import Country
 
 
 class CurrencyManager(models.Manager):
     def get_primary(self):
-        return Currency.objects.get(primary=True)
+        try:
+            return caching.cache_get("Currency", "primary")
+        except caching.NotCachedError as nce:
+            currency = Currency.objects.get(primary=True)
+            caching.cache_set(nce.key, value=currency)
+            return currency
 
     def accepted(self):
         return Currency.objects.filter(primary=False, accepted=True)
@@ -51,7 +57,8 @@ class Currency(models.Model):
             if self.accepted is False:
                 self.accepted = True
 
-        return super(Currency, self).save(*args, **kwargs)
+        super(Currency, self).save(*args, **kwargs)
+        caching.cache_delete("Currency", "primary")
 
 
 class ExchangeRate(models.Model):
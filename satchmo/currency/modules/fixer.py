@@ -1,14 +1,16 @@
 import datetime
-import requests
 
 from django.conf import settings
 
 from satchmo.currency.models import Currency, ExchangeRate
+from satchmo.utils import LazyImport
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+requests = LazyImport("requests")
+
 
 class FixerExchangeRateClient(object):
     """Get the exchange rates from http://fixer.io"""
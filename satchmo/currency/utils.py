@@ -2,16 +2,18 @@ import math
 
 from decimal import Decimal, ROUND_HALF_EVEN
 from ipware.ip import get_real_ip
-from geoip2.errors import AddressNotFoundError
 
 from django.core.cache import caches
 from django.conf import settings
-from django.contrib.gis.geoip2 import GeoIP2
 from django.utils.translation import ugettext_lazy as _
 
 from satchmo.configuration.functions import config_value
+from satchmo.utils import LazyImport
 from .models import Currency, ExchangeRate
 
+GeoIP2 = LazyImport("django.contrib.gis.geoip2", "GeoIP2")
+geoip2_errors = LazyImport("geoip2.errors")
+
 
 def money_format(value, currency_code):
     """Convert Decimal to a money formatted unicode string.
@@ -98,7 +100,7 @@ def currency_for_request(request):
                     geoip = GeoIP2()
                     try:
                         country = geoip.country(ip)
-                    except AddressNotFoundError:
+                    except geoip2_errors.AddressNotFoundError:
                         pass
                     else:
                         try:
@@ -1,5 +1,4 @@
 import json
-import requests
 
 from django.core.exceptions import MultipleObjectsReturned
 from django.urls import reverse
@@ -9,12 +8,15 @@ from django.utils.translation import ugettext as _
 
 from satchmo.configuration.functions import config_value
 from satchmo.product.models import Product
+from satchmo.utils import LazyImport
 from satchmo.utils.urlhelper import external_url
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+requests = LazyImport("requests")
+
 
 def float_price(price):
     if price is None:
@@ -196,5 +198,5 @@ def send_order(order):
                             stock,
                         )
                         product.items_in_stock = stock
-                        product.save()
+                        product.save(refresh_prices=False)
             return True
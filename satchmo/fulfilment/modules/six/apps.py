@@ -8,4 +8,6 @@ class SixConfig(AppConfig):
     verbose_name = "Six Fulfilment"
 
     def ready(self):
-        from . import config
+        from satchmo.configuration.functions import config_register_module
+
+        config_register_module("FULFILMENT", "%s.config" % self.name)
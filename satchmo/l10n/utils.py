@@ -1,14 +1,16 @@
-from geoip2.errors import AddressNotFoundError
 from ipware.ip import get_real_ip
 
 from django.conf import settings
-from django.contrib.gis.geoip2 import GeoIP2
 
 from satchmo.contact.models import Contact
 from satchmo.shop.models import Config
+from satchmo.utils import LazyImport
 
 from .models import Country
 
+GeoIP2 = LazyImport("django.contrib.gis.geoip2", "GeoIP2")
+geoip2_errors = LazyImport("geoip2.errors")
+
 
 def country_for_request(request):
     """ Find the country for the request """
@@ -34,7 +36,7 @@ def country_for_request(request):
                     geoip = GeoIP2()
                     try:
                         country = geoip.country(ip)
-                    except AddressNotFoundError:
+                    except geoip2_errors.AddressNotFoundError:
                         pass
                     else:
                         try:
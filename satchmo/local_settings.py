@@ -59,6 +59,79 @@ CACHE_TIMEOUT = 60 * 5
 # modify the cache_prefix if you have multiple concurrent stores.
 CACHE_PREFIX = "STORE"
 
+# satchmo.caching keeps a small in-process cache in front of the backend.
+# CACHE_L1_SIZE is the maximum number of keys held per process.  Values are
+# only served from it for CACHE_L1_TIMEOUT seconds (0 disables), which can be
+# overridden per key namespace - the first part of the cache key.
+# CACHE_L1_SIZE = 1000
+# CACHE_L1_TIMEOUT = 0
+# CACHE_L1_NAMESPACES = {"setting": 30, "Config": 60}
+
+# Deleting a key with its children bumps a generation counter held in the
+# cache backend.  Those counters are read once per request, with
+# RequestCacheMiddleware, and processes may keep them for
+# CACHE_GENERATION_TIMEOUT seconds, saving a lookup per nested key at the cost
+# of seeing other processes' deletes that much later.
+# CACHE_GENERATION_TIMEOUT = 0
+
+# Each process adds its cache statistics to totals held in the cache backend
+# every CACHE_STATS_INTERVAL seconds.  Namespaces not known to
+# satchmo.caching.stats, CACHE_STATS_NAMESPACES or CACHE_L1_NAMESPACES are
+# counted together as "other".
+# CACHE_STATS_INTERVAL = 60
+# CACHE_STATS_NAMESPACES = []
+
+# Cached values of CACHE_COMPRESS_MIN_SIZE bytes or more are zlib compressed
+# (0 disables).  Values still over CACHE_MAX_VALUE_SIZE bytes are logged and
+# not cached; memcached refuses items over 1MB.
+# CACHE_COMPRESS_MIN_SIZE = 0
+# CACHE_MAX_VALUE_SIZE = 1024 * 1024
+
+# After CACHE_BREAKER_FAILURES backend calls in a row have failed or taken
+# over CACHE_BREAKER_LATENCY milliseconds, the backend is bypassed for
+# CACHE_BREAKER_COOL_OFF seconds (0 failures disables).  Meanwhile values are
+# kept in the in-process tier for at least CACHE_BREAKER_L1_TIMEOUT seconds.
+# CACHE_BREAKER_FAILURES = 5
+# CACHE_BREAKER_LATENCY = 250
+# CACHE_BREAKER_COOL_OFF = 30
+# CACHE_BREAKER_L1_TIMEOUT = 60
+
+# Sample this fraction of cache reads (0 disables) to find the most read keys
+# and estimate the distinct keys read per namespace.  The CACHE_HOTKEY_TOP
+# hottest keys are logged every CACHE_HOTKEY_INTERVAL seconds and shown in the
+# stats JSON.
+# CACHE_HOTKEY_SAMPLE = 0.01
+# CACHE_HOTKEY_TOP = 20
+# CACHE_HOTKEY_INTERVAL = 300
+
+# Read configuration settings from a file written by
+# "manage.py satchmo_config_snapshot <path>" instead of the database.  Changes
+# made in the settings editor are not seen until the file is rewritten and
+# the workers restarted.
+# CONFIGURATION_SNAPSHOT_FILE = "/var/lib/satchmo/configuration.json"
+
+# Each process reloads its configuration settings whenever they are changed,
+# and at least every CONFIGURATION_SNAPSHOT_MAX_AGE seconds (0 disables).
+# CONFIGURATION_SNAPSHOT_MAX_AGE = 300
+
+# Count the configuration reads of each request, with
+# "satchmo.configuration.middleware.ConfigProfileMiddleware" in
+# MIDDLEWARE_CLASSES.
+# Each request is logged at debug level, and the totals per view are shown
+# to staff at settings/profile.json.
+# CONFIGURATION_PROFILE = False
+
+# Saving a product or price queues the product instead of rebuilding its
+# price lookups at once.  The queue is worked through by
+# "manage.py satchmo_refresh_prices [--wait <seconds>]" or the hourly job.
+# PRODUCT_PRICES_QUEUED = False
+
+# "manage.py satchmo_import_profile" lists the slowest modules to import when
+# starting Django, and fails if importing takes longer than this many
+# milliseconds.  The shop tests only check start up time when this, or the
+# SATCHMO_STARTUP_BUDGET environment variable, is set.
+# SATCHMO_STARTUP_BUDGET = 1500
+
 
 # Language code for this installation. All choices can be found here:
 # http://www.i18nguy.com/unicode/language-identifiers.html
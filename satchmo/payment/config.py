@@ -3,6 +3,7 @@ from satchmo.configuration.functions import (
     config_choice_values,
     config_register,
     config_register_list,
+    config_register_module,
     config_value,
 )
 from satchmo.configuration.values import (
@@ -14,7 +15,6 @@ from satchmo.configuration.values import (
     StringValue,
 )
 from satchmo.shop.satchmo_settings import get_satchmo_setting
-from satchmo.utils import load_module
 from . import signals
 
 import logging
@@ -124,21 +124,16 @@ config_register_list(
 # --- Load default payment modules.  Ignore import errors. ---
 _default_modules = ("dummy", "autosuccess", "ingenico", "paypal", "worldpay")
 
+# Their configuration is only imported once the PAYMENT group, or the group of
+# a module, is used.
 for module in _default_modules:
-    try:
-        load_module("satchmo.payment.modules.%s.config" % module)
-    except ImportError as e:
-        log.warning("Could not load default payment module configuration: %s", module)
-        log.exception(e)
+    config_register_module("PAYMENT", "satchmo.payment.modules.%s.config" % module)
 
 # --- Load any extra payment modules. ---
 extra_payment = get_satchmo_setting("CUSTOM_PAYMENT_MODULES")
 
 for extra in extra_payment:
-    try:
-        load_module("%s.config" % extra)
-    except ImportError:
-        log.warn("Could not load payment module configuration: %s" % extra)
+    config_register_module("PAYMENT", "%s.config" % extra)
 
 
 # --- helper functions ---
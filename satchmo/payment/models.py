@@ -89,11 +89,13 @@ class CreditCardDetail(models.Model):
                 "CreditCardDetail expecting a credit card number to be stored before storing CCV"
             )
 
-        caching.cache_set(self.encrypted_cc, skiplog=True, length=60 * 60, value=ccv)
+        caching.cache_set(
+            "CCV", self.encrypted_cc, skiplog=True, length=60 * 60, value=ccv
+        )
 
     def getCCV(self):
         try:
-            ccv = caching.cache_get(self.encrypted_cc)
+            ccv = caching.cache_get("CCV", self.encrypted_cc)
         except caching.NotCachedError:
             ccv = ""
 
@@ -8,4 +8,6 @@ class DummyConfig(AppConfig):
     verbose_name = "Dummy Payment"
 
     def ready(self):
-        from . import config
+        from satchmo.configuration.functions import config_register_module
+
+        config_register_module("PAYMENT", "%s.config" % self.name)
@@ -9,9 +9,6 @@ import pprint
 
 from decimal import Decimal
 
-import paypalrestsdk
-from paypalrestsdk.notifications import WebhookEvent
-
 from django.contrib.sites.models import Site
 from django.core.mail import mail_admins
 from django.db import transaction
@@ -29,10 +26,13 @@ from satchmo.payment.views import payship
 from satchmo.payment.views.checkout import complete_order
 from satchmo.payment.config import payment_live
 from satchmo.shop.models import Cart
+from satchmo.utils import LazyImport
 from satchmo.utils.dynamic import lookup_url, lookup_template
 
 log = logging.getLogger(__name__)
 
+paypalrestsdk = LazyImport("paypalrestsdk")
+
 
 def configure_api():
     """ Configure PayPal api """
@@ -413,7 +413,7 @@ def webhook(request):
     cert_url = request.META["HTTP_PAYPAL_CERT_URL"]
     actual_signature = request.META["HTTP_PAYPAL_TRANSMISSION_SIG"]
     auth_algo = request.META["HTTP_PAYPAL_AUTH_ALGO"]
-    verified = WebhookEvent.verify(
+    verified = paypalrestsdk.notifications.WebhookEvent.verify(
         transmission_id,
         timestamp,
         webhook_id,
@@ -8,4 +8,6 @@ class WorldPayConfig(AppConfig):
     verbose_name = "WorldPay Payment"
 
     def ready(self):
-        from . import config
+        from satchmo.configuration.functions import config_register_module
+
+        config_register_module("PAYMENT", "%s.config" % self.name)
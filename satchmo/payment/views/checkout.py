@@ -91,7 +91,7 @@ def complete_order(order):
             product = item.product
             product.total_sold += item.quantity
             product.items_in_stock -= item.quantity
-            product.save()
+            product.save(refresh_prices=False)
 
             item.stock_updated = True
             item.save()
@@ -109,7 +109,7 @@ def restock_order(order):
             product = item.product
             product.total_sold -= item.quantity
             product.items_in_stock += item.quantity
-            product.save()
+            product.save(refresh_prices=False)
 
             item.stock_updated = False
             item.save()
@@ -8,4 +8,32 @@ class ProductConfig(AppConfig):
     verbose_name = "Product"
 
     def ready(self):
+        from django.db.models.signals import (
+            m2m_changed,
+            post_delete,
+            post_save,
+            pre_delete,
+        )
+
         from . import config
+        from .models import (
+            Category,
+            Product,
+            category_deleted,
+            category_loaded,
+            product_categories_changed,
+            product_deleted,
+            product_deleting,
+            subtype_changed,
+            subtype_models,
+        )
+
+        post_save.connect(category_loaded, sender=Category)
+        post_delete.connect(category_deleted, sender=Category)
+        m2m_changed.connect(product_categories_changed, sender=Product.category.through)
+        pre_delete.connect(product_deleting, sender=Product)
+        post_delete.connect(product_deleted, sender=Product)
+
+        for model in subtype_models().values():
+            post_save.connect(subtype_changed, sender=model)
+            post_delete.connect(subtype_changed, sender=model)
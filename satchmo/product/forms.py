@@ -346,7 +346,7 @@ class InventoryForm(forms.Form):
                     )
                     log.debug("Saving new qty=%i for %s" % (value, key))
                     prod.items_in_stock = value
-                    prod.save()
+                    prod.save(refresh_prices=False)
 
             elif opt == "price":
                 if "CustomProduct" in subtypes:
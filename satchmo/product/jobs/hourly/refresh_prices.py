@@ -0,0 +1,9 @@
+from django_extensions.management.jobs import HourlyJob
+from satchmo.product.models import ProductPriceRefresh
+
+
+class Job(HourlyJob):
+    help = "Rebuild the pricing lookups of products queued since the last run."
+
+    def execute(self):
+        ProductPriceRefresh.objects.drain()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from satchmo.product.models import CategoryProductCount
+
+
+class Command(BaseCommand):
+    help = "Counts the active products of every category again, repairing the stored counts."
+
+    def handle(self, *args, **options):
+        count = CategoryProductCount.objects.rebuild()
+        self.stdout.write("Counted the products of %i categories" % count)
@@ -1,41 +1,67 @@
-from django.core.management.base import BaseCommand
-from optparse import make_option
-from satchmo.product.models import Product, ProductPriceLookup
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+
+from satchmo.product.models import BATCH_SIZE, ProductPriceLookup
 
 
 class Command(BaseCommand):
     help = "Builds Satcho Product pricing lookup tables."
 
-    requires_model_validation = True
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help="Only rebuild products updated on or after this date, YYYY-MM-DD.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes building prices.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of products given to a process at a time.",
+        )
 
     def handle(self, **options):
-        from django.conf import settings
-
         verbosity = int(options.get("verbosity", 1))
 
-        total = 0
-        if verbosity > 0:
-            print("Starting product pricing")
-
-        if verbosity > 1:
-            print("Deleting old pricing")
-
-        for lookup in ProductPriceLookup.objects.all():
-            lookup.delete()
+        since = options["since"]
+        if since:
+            parsed = parse_datetime(since)
+            since = parsed.date() if parsed else parse_date(since)
+            if since is None:
+                raise CommandError("Could not parse --since %r" % options["since"])
 
-        products = Product.objects.active(variations=False)
         if verbosity > 0:
-            print(("Adding %i products" % products.count()))
+            self.stdout.write("Starting product pricing")
 
-        for product in products:
-            if verbosity > 1:
-                print(("Processing product: %s" % product.slug))
+        started = time.time()
+        done = {"products": 0, "prices": 0}
 
-            prices = ProductPriceLookup.objects.smart_create_for_product(product)
-            if verbosity > 1:
-                print(("Created %i prices" % len(prices)))
+        def progress(products, prices):
+            done["products"] += products
+            done["prices"] += prices
+            if verbosity > 0:
+                elapsed = max(time.time() - started, 0.001)
+                self.stdout.write(
+                    "Processed %i products, %i prices, %.1f products/s"
+                    % (done["products"], done["prices"], done["products"] / elapsed)
+                )
 
-            total += len(prices)
+        total = ProductPriceLookup.objects.rebuild(
+            since=since,
+            workers=max(options["workers"], 1),
+            chunk_size=max(options["chunk_size"], 1),
+            progress=progress,
+        )
 
         if verbosity > 0:
-            print(("Added %i total prices" % total))
+            self.stdout.write(
+                "Added %i total prices for %i products in %.2fs"
+                % (total, done["products"], time.time() - started)
+            )
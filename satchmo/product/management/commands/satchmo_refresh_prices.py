@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from satchmo.product.models import BATCH_SIZE, ProductPriceRefresh
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the price lookups of the products queued with PRODUCT_PRICES_QUEUED."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of products rebuilt together.",
+        )
+        parser.add_argument(
+            "--wait",
+            type=float,
+            default=0,
+            help="Keep running, checking the queue every this many seconds.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.time()
+            count = ProductPriceRefresh.objects.drain(max(options["batch_size"], 1))
+            if count or not options["wait"]:
+                self.stdout.write(
+                    "Refreshed prices of %i products in %.2fs"
+                    % (count, time.time() - start)
+                )
+            if not options["wait"]:
+                return
+            time.sleep(options["wait"])
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from satchmo.product.models import Product, update_subtypes
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Stores the subtypes of each product, for products which have not been looked up yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="all",
+            help="Look up every product again, not only those never looked up.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of products looked up per query.",
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.order_by("pk")
+        if not options["all"]:
+            products = products.filter(subtypes__isnull=True)
+        pks = list(products.values_list("pk", flat=True))
+
+        size = max(options["batch_size"], 1)
+        counts = {}
+        for ix in range(0, len(pks), size):
+            for subtypes in update_subtypes(pks[ix : ix + size]).values():
+                counts[subtypes] = counts.get(subtypes, 0) + 1
+
+        for subtypes, count in sorted(counts.items()):
+            self.stdout.write("%6i %s" % (count, subtypes or "(none)"))
+        self.stdout.write("Updated %i products" % len(pks))
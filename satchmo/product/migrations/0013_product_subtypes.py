@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0012_auto_20190424_1435'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='subtypes',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, verbose_name='Subtypes'),
+        ),
+    ]
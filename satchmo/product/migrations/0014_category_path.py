@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+def build_paths(apps, schema_editor):
+    Category = apps.get_model('product', 'Category')
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+    for pk in parents:
+        ids = []
+        parent = pk
+        while parent is not None and parent not in ids:
+            ids.append(parent)
+            parent = parents.get(parent)
+        path = ''.join(['%i/' % i for i in reversed(ids)])
+        Category.objects.filter(pk=pk).update(path=path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0013_product_subtypes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, verbose_name='Path'),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0014_category_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryProductCount',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='product.Category', verbose_name='Category')),
+                ('products', models.PositiveIntegerField(default=0, verbose_name='Products')),
+                ('variations', models.PositiveIntegerField(default=0, verbose_name='Variations')),
+                ('all_products', models.PositiveIntegerField(default=0, verbose_name='Products including children')),
+                ('all_variations', models.PositiveIntegerField(default=0, verbose_name='Variations including children')),
+            ],
+            options={
+                'verbose_name': 'Category Product Count',
+                'verbose_name_plural': 'Category Product Counts',
+            },
+        ),
+    ]
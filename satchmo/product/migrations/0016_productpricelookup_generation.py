@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0015_categoryproductcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productpricelookup',
+            name='generation',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0016_productpricelookup_generation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPriceRefresh',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='product.Product', verbose_name='Product')),
+                ('queued', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Queued')),
+            ],
+            options={
+                'verbose_name': 'Product Price Refresh',
+                'verbose_name_plural': 'Product Price Refreshes',
+            },
+        ),
+    ]
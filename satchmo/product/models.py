@@ -9,19 +9,23 @@ import hashlib
 import logging
 import os.path
 import random
+from collections import defaultdict
 from decimal import Decimal
 
 from django.conf import settings
-from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.urls import reverse
-from django.db import models
-from django.db.models import Q
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, connections, models, transaction
+from django.db.models import Exists, OuterRef, Q, Value
+from django.db.models.functions import Concat, Substr
 from django.db.models.fields.files import FileField
 from django.utils.safestring import mark_safe
 from django.utils.text import slugify
 from django.utils.translation import get_language, ugettext_lazy as _
 
+from satchmo import caching
+from satchmo.caching.models import cache_queryset
 from satchmo.configuration.functions import (
     SettingNotSet,
     config_value,
@@ -89,6 +93,35 @@ class CategoryManager(models.Manager):
             cats = list(zip(*fastsort))[2]
         return cats
 
+    def rebuild_paths(self):
+        """Set the path of every category from its parents, returning the
+        number of categories changed."""
+        rows = list(self.model._base_manager.values_list("pk", "parent_id", "path"))
+        parents = dict((pk, parent_id) for pk, parent_id, path in rows)
+
+        changed = []
+        for pk, parent_id, path in rows:
+            new_path = _category_path(pk, parents)
+            if new_path != path:
+                changed.append(self.model(pk=pk, path=new_path))
+        self.model._base_manager.bulk_update(changed, ["path"], batch_size=500)
+        return len(changed)
+
+
+def _path_ids(path):
+    """Return the category ids in `path`, from the root down."""
+    return [int(pk) for pk in path.split("/")[:-1]]
+
+
+def _category_path(pk, parents):
+    """Return the path of category `pk` from a dict of id -> parent id,
+    stopping at a loop."""
+    ids = []
+    while pk is not None and pk not in ids:
+        ids.append(pk)
+        pk = parents.get(pk)
+    return "".join(["%i/" % i for i in reversed(ids)])
+
 
 class Category(models.Model):
     """
@@ -124,6 +157,11 @@ class Category(models.Model):
         verbose_name=_("Related Categories"),
         related_name="related_categories",
     )
+    # The ids of the category and its parents from the root, eg. "1/5/12/",
+    # so that a subtree is every category whose path starts with its root's.
+    path = models.CharField(
+        _("Path"), max_length=255, db_index=True, blank=True, editable=False
+    )
     objects = CategoryManager()
 
     class Meta:
@@ -140,94 +178,131 @@ class Category(models.Model):
         return reverse("satchmo_category", kwargs={"slug": self.slug})
 
     def save(self, *args, **kwargs):
-        if self.id:
-            if self.parent and self.parent_id == self.id:
+        if self.id and self.parent_id:
+            if self.parent_id == self.id:
                 raise ValidationError(_("You must not save a category in itself!"))
 
-            for p in self._recurse_for_parents(self):
-                if self.id == p.id:
-                    raise ValidationError(_("You must not save a category in itself!"))
+            if ("/%i/" % self.id) in "/" + self.parent.tree_path():
+                raise ValidationError(_("You must not save a category in itself!"))
 
         if not self.slug:
             self.slug = slugify(self.name)
 
         super(Category, self).save(*args, **kwargs)
-        img_key = "Category_get_mainImage %s" % (self.id)
-        img_key = img_key.replace(" ", "-")
-        ap_key = "Category_active_products %s" % (self.id)
-        ap_key = ap_key.replace(" ", "-")
-        cache.delete_many([img_key, ap_key])
+        self._update_path()
+        caching.cache_delete("Category_get_mainImage", self.id)
+        caching.cache_delete("Category_active_products", children=True)
+        caching.cache_delete("Category_get_all_children", children=True)
+        caching.cache_delete("category_tree", children=True)
+
+    def tree_path(self):
+        """Return the path of this category, first building the paths of
+        every category if it has none, eg. after loading a fixture."""
+        if not self.path and self.pk:
+            Category.objects.rebuild_paths()
+            self.path = (
+                Category.objects.filter(pk=self.pk)
+                .values_list("path", flat=True)
+                .first()
+            ) or ""
+        return self.path
+
+    def _update_path(self):
+        """Set the path of this category from its parent's, moving the paths
+        of its subtree along with it."""
+        if self.parent_id:
+            new_path = self.parent.tree_path() + "%i/" % self.pk
+        else:
+            new_path = "%i/" % self.pk
+
+        old_path = (
+            Category.objects.filter(pk=self.pk).values_list("path", flat=True).first()
+        )
+        if old_path:
+            if old_path != new_path:
+                Category.objects.filter(path__startswith=old_path).update(
+                    path=Concat(Value(new_path), Substr("path", len(old_path) + 1))
+                )
+                # the products of this subtree have moved between parents
+                CategoryProductCount.objects.update_categories(
+                    _path_ids(old_path)[:-1] + _path_ids(new_path)[:-1]
+                )
+        else:
+            Category.objects.filter(pk=self.pk).update(path=new_path)
+        self.path = new_path
+
+    def _subtree(self):
+        """Return this category and all its children, in one query."""
+        return Category.objects.filter(path__startswith=self.tree_path())
 
     @property
     def main_image(self):
-        key = "Category_get_mainImage %s" % (self.id)
-        key = key.replace(" ", "-")
-        img = cache.get(key)
-        if img is None:
-            img = False
-            if self.images.count() > 0:
-                img = self.images.order_by("sort")[0]
-            else:
-                if self.parent_id and self.parent != self:
-                    img = self.parent.main_image
+        try:
+            return self._main_image
+        except AttributeError:
+            pass
 
-            if not img:
-                # This should be a "Image Not Found" placeholder image
-                try:
-                    img = CategoryImage.objects.filter(category__isnull=True).order_by(
-                        "sort"
-                    )[0]
-                except IndexError:
-                    log.warning("Default category image not found")
-            cache.set(key, img)
+        try:
+            img = caching.cache_get("Category_get_mainImage", self.id)
+        except caching.NotCachedError as nce:
+            img = self._find_main_image()
+            caching.cache_set(nce.key, value=img)
+        self._main_image = img
+        return img
+
+    def _find_main_image(self):
+        img = False
+        if self.images.count() > 0:
+            img = self.images.order_by("sort")[0]
+        else:
+            if self.parent_id and self.parent != self:
+                img = self.parent.main_image
+
+        if not img:
+            # This should be a "Image Not Found" placeholder image
+            try:
+                img = CategoryImage.objects.filter(category__isnull=True).order_by(
+                    "sort"
+                )[0]
+            except IndexError:
+                log.warning("Default category image not found")
         return img
 
     def active_products(self, variations=True, include_children=False, **kwargs):
-        key = "Category_active_products %s" % (self.id)
-        key = key.replace(" ", "-")
-        products = cache.get(key)
-        if products is None:
-            if variations and include_children:
-                cats = self.get_all_children(include_self=True)
-                products = Product.objects.select_related().filter(
-                    category__in=cats, active=True, **kwargs
-                )
-            elif variations and not include_children:
-                products = self.product_set.select_related().filter(
-                    active=True, **kwargs
-                )
-            elif not variations and include_children:
-                cats = self.get_all_children(include_self=True)
-                products = Product.objects.select_related().filter(
-                    category__in=cats,
-                    active=True,
-                    productvariation__parent__isnull=True,
-                    **kwargs
-                )
-            elif not variations and not include_children:
-                products = self.product_set.select_related().filter(
-                    active=True, productvariation__parent__isnull=True, **kwargs
-                )
-            cache.set(key, products)
-        return products
+        """Return a list of the active products in this category."""
+        if include_children:
+            products = Product.objects.filter(
+                category__path__startswith=self.tree_path(), active=True, **kwargs
+            ).distinct()
+        else:
+            products = self.product_set.filter(active=True, **kwargs)
+        if not variations:
+            products = products.filter(productvariation__parent__isnull=True)
+
+        key = caching.cache_key(
+            "Category_active_products",
+            self.id,
+            variations,
+            include_children,
+            **kwargs
+        )
+        return cache_queryset(products.select_related(), key)
 
     def active_products_include_children(self, variations=True, **kwargs):
         return self.active_products(variations, True, **kwargs)
 
     def _recurse_for_parents(self, cat_obj):
-        p_list = []
-        if cat_obj.parent_id:
-            p = cat_obj.parent
-            p_list.append(p)
-            if p != self:
-                more = self._recurse_for_parents(p)
-                p_list.extend(more)
-        if cat_obj == self and p_list:
-            p_list.reverse()
-        return p_list
+        return cat_obj.parents()
 
     def parents(self):
-        return self._recurse_for_parents(self)
+        """Return the parents of this category from the root down, in one
+        query."""
+        if not self.parent_id:
+            return []
+
+        ids = _path_ids(self.tree_path())[:-1]
+        found = Category.objects.in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found]
 
     def get_separator(self):
         return " - "
@@ -249,33 +324,6 @@ class Category(models.Model):
         url_list.append(self.get_absolute_url())
         return list(zip(name_list, url_list))
 
-    def _flatten(self, L):
-        """
-        Taken from a python newsgroup post
-        """
-        if not isinstance(L, list):
-            return [L]
-        if L == []:
-            return L
-        return self._flatten(L[0]) + self._flatten(L[1:])
-
-    def _recurse_for_children(self, node, only_active=False):
-        children = []
-        children.append(node)
-        for child in node.child.all():
-            if child != self:
-                # TODO: I think there is a problem here if the category has child categories, but they have no active children
-                if (
-                    (not only_active)
-                    or child.active_products().count() > 0
-                    or len(child.get_active_children()) > 0
-                ):
-                    children_list = self._recurse_for_children(
-                        child, only_active=only_active
-                    )
-                    children.append(children_list)
-        return children
-
     def get_active_children(self, include_self=False):
         """
         Gets a list of all of the children categories which have active products.
@@ -286,24 +334,244 @@ class Category(models.Model):
         """
         Gets a list of all of the children categories.
         """
-        key = "Category_get_all_children_%s_%s_%s" % (
-            self.id,
-            only_active,
-            include_self,
-        )
-        key = key.replace("_", "-")
-        flat_list = cache.get(key)
-        if flat_list is None:
-            children_list = self._recurse_for_children(self, only_active=only_active)
-            if include_self:
-                ix = 0
-            else:
-                ix = 1
-            flat_list = self._flatten(children_list[ix:])
-            cache.set(key, flat_list)
+        try:
+            return caching.cache_get(
+                "Category_get_all_children", self.id, only_active, include_self
+            )
+        except caching.NotCachedError as nce:
+            key = nce.key
+
+        subtree = list(self._subtree())
+        by_parent = {}
+        for cat in subtree:
+            by_parent.setdefault(cat.parent_id, []).append(cat)
+        if only_active:
+            counts = CategoryProductCount.objects.for_categories(subtree)
+            active = set(pk for pk, ct in counts.items() if ct.all_products)
+
+        flat_list = []
+        pending = [self]
+        while pending:
+            cat = pending.pop()
+            flat_list.append(cat)
+            children = sorted(
+                by_parent.get(cat.id, []), key=lambda c: (c.ordering, c.name)
+            )
+            if only_active:
+                children = [c for c in children if c.id in active]
+            pending.extend(reversed(children))
+
+        if not include_self:
+            flat_list = flat_list[1:]
+        caching.cache_set(key, value=flat_list)
         return flat_list
 
 
+def category_loaded(sender, instance, raw=False, **kwargs):
+    """Set the path of a category loaded from a fixture, which skips
+    `Category.save`.  Connected in ProductConfig.ready."""
+    if not raw:
+        return
+    if instance.parent_id:
+        parent_path = (
+            Category.objects.filter(pk=instance.parent_id)
+            .values_list("path", flat=True)
+            .first()
+        )
+    else:
+        parent_path = ""
+    if parent_path is None or (instance.parent_id and not parent_path):
+        # the parent is not loaded yet, it will build this path
+        return
+
+    instance.path = parent_path + "%i/" % instance.pk
+    Category.objects.filter(pk=instance.pk).update(path=instance.path)
+    if Category.objects.filter(parent_id=instance.pk).exists():
+        # children were loaded first
+        Category.objects.rebuild_paths()
+
+
+class CategoryProductCountManager(models.Manager):
+    def count(self, categories):
+        """Count the active products of `categories` from the products table,
+        returning a dict of category id -> unsaved CategoryProductCount.
+
+        The product links of every subtree are read in one query, and each
+        is counted for its own category and for those of its parents being
+        counted.
+        """
+        counts = dict(
+            (category.pk, self.model(category_id=category.pk))
+            for category in categories
+        )
+        if not counts:
+            return counts
+
+        # a subtree inside another is read with it
+        roots = []
+        for path in sorted([category.tree_path() for category in categories]):
+            if not any(path.startswith(root) for root in roots):
+                roots.append(path)
+        subtrees = Q()
+        for root in roots:
+            subtrees |= Q(category__path__startswith=root)
+
+        through = Product.category.through
+        links = (
+            through.objects.filter(subtrees, product__active=True)
+            .order_by()
+            .values_list("category__path", "product_id", "product__productvariation")
+            .distinct()
+        )
+
+        # a product may be in several categories of a subtree
+        all_products = defaultdict(set)
+        all_variations = defaultdict(set)
+        for path, product_id, variation in links:
+            ids = _path_ids(path)
+            if ids and ids[-1] in counts:
+                counts[ids[-1]].products += 1
+                if variation is not None:
+                    counts[ids[-1]].variations += 1
+            for pk in ids:
+                if pk in counts:
+                    all_products[pk].add(product_id)
+                    if variation is not None:
+                        all_variations[pk].add(product_id)
+
+        for pk, ct in counts.items():
+            ct.all_products = len(all_products[pk])
+            ct.all_variations = len(all_variations[pk])
+        return counts
+
+    def store(self, counts):
+        """Save the counts from `count`."""
+        existing = set(
+            self.filter(category_id__in=list(counts)).values_list(
+                "category_id", flat=True
+            )
+        )
+        self.bulk_update(
+            [ct for pk, ct in counts.items() if pk in existing],
+            ["products", "variations", "all_products", "all_variations"],
+            batch_size=500,
+        )
+        self.bulk_create(
+            [ct for pk, ct in counts.items() if pk not in existing], batch_size=500
+        )
+        caching.cache_delete("Category_get_all_children", children=True)
+
+    def for_categories(self, categories):
+        """Return a dict of category id -> CategoryProductCount for
+        `categories` in one query, counting any which have not been."""
+        found = self.in_bulk([category.pk for category in categories])
+        missing = [category for category in categories if category.pk not in found]
+        if missing:
+            counts = self.count(missing)
+            self.store(counts)
+            found.update(counts)
+        return found
+
+    def update_categories(self, category_ids):
+        """Count the products of `category_ids` again, and of all their
+        parents, whose subtrees include them."""
+        paths = Category.objects.filter(pk__in=category_ids).values_list(
+            "path", flat=True
+        )
+        ids = set()
+        for path in paths:
+            ids.update(_path_ids(path))
+        ids.update(category_ids)
+
+        categories = list(Category.objects.filter(pk__in=ids))
+        if categories:
+            self.store(self.count(categories))
+
+    def rebuild(self):
+        """Count the products of every category, returning the number of
+        categories."""
+        categories = list(Category.objects.all())
+        self.store(self.count(categories))
+        return len(categories)
+
+
+class CategoryProductCount(models.Model):
+    """The number of active products in a category, and in it and all its
+    children together, kept up to date as products change so that the
+    category tree need not count them."""
+
+    category = models.OneToOneField(
+        Category,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+        verbose_name=_("Category"),
+    )
+    products = models.PositiveIntegerField(_("Products"), default=0)
+    variations = models.PositiveIntegerField(_("Variations"), default=0)
+    all_products = models.PositiveIntegerField(
+        _("Products including children"), default=0
+    )
+    all_variations = models.PositiveIntegerField(
+        _("Variations including children"), default=0
+    )
+
+    objects = CategoryProductCountManager()
+
+    def total(self, variations=True, include_children=True):
+        """Return the number of products, optionally leaving out variations."""
+        if include_children:
+            ct, var = self.all_products, self.all_variations
+        else:
+            ct, var = self.products, self.variations
+        if not variations:
+            ct -= var
+        return ct
+
+    class Meta:
+        verbose_name = _("Category Product Count")
+        verbose_name_plural = _("Category Product Counts")
+
+
+def category_deleted(sender, instance, **kwargs):
+    """Count the products of the parents of a deleted category again.
+    Connected in ProductConfig.ready."""
+    if instance.parent_id:
+        CategoryProductCount.objects.update_categories([instance.parent_id])
+
+
+def product_categories_changed(
+    sender, instance, action, reverse, pk_set=None, **kwargs
+):
+    """Count the products of the categories a product was added to or
+    removed from.  Connected for `Product.category` in ProductConfig.ready."""
+    if action == "pre_clear" and not reverse:
+        instance._cleared_categories = list(
+            instance.category.values_list("pk", flat=True)
+        )
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if reverse:
+            category_ids = [instance.pk]
+        elif action == "post_clear":
+            category_ids = getattr(instance, "_cleared_categories", [])
+        else:
+            category_ids = list(pk_set or [])
+        if category_ids:
+            CategoryProductCount.objects.update_categories(category_ids)
+
+
+def product_deleting(sender, instance, **kwargs):
+    """Remember the categories of a product about to be deleted, for
+    `product_deleted`."""
+    instance._deleted_categories = list(instance.category.values_list("pk", flat=True))
+
+
+def product_deleted(sender, instance, **kwargs):
+    category_ids = getattr(instance, "_deleted_categories", [])
+    if category_ids:
+        CategoryProductCount.objects.update_categories(category_ids)
+
+
 class CategoryImage(models.Model):
     """
     A picture of an item.  Can have many pictures associated with an item.
@@ -602,6 +870,11 @@ class Product(models.Model):
     precautions = models.ForeignKey(
         "Precaution", on_delete=models.CASCADE, null=True, blank=True
     )
+    # The names of the subtypes this product has, comma separated, kept up to
+    # date by the subtype models.  Null if not looked up yet.
+    subtypes = models.CharField(
+        _("Subtypes"), max_length=255, null=True, blank=True, editable=False
+    )
     objects = ProductManager()
 
     class Meta:
@@ -634,7 +907,17 @@ class Product(models.Model):
             },
         )
 
-    def save(self, *args, **kwargs):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super(Product, cls).from_db(db, field_names, values)
+        # so that save can tell when the product is activated or deactivated
+        product._loaded_active = product.__dict__.get("active")
+        return product
+
+    def save(self, *args, refresh_prices=True, **kwargs):
+        """Save the product, refreshing its price lookups.  Pass
+        `refresh_prices=False` when only the stock counts have changed, which
+        are then copied to the lookups in place."""
         self.date_updated = datetime.datetime.now()
 
         if not self.date_added:
@@ -645,12 +928,32 @@ class Product(models.Model):
 
         if not self.sku:
             self.sku = self.slug
+
+        adding = self._state.adding
+        update_fields = kwargs.get("update_fields")
+        if adding:
+            if self.subtypes is None:
+                self.subtypes = ""
+        elif update_fields is None or "subtypes" in update_fields:
+            # a copy loaded before a subtype was added or removed would write
+            # back the old subtypes, so look them up again
+            found = find_subtypes([self.pk])
+            self.subtypes = found.get(self.pk, self.subtypes or "")
         super(Product, self).save(*args, **kwargs)
-        ProductPriceLookup.objects.smart_create_for_product(self)
+        if refresh_prices:
+            ProductPriceLookup.objects.refresh_for_product(self)
+        else:
+            ProductPriceLookup.objects.filter(productslug=self.slug).update(
+                items_in_stock=self.items_in_stock
+            )
+
+        if not adding and self.active != getattr(self, "_loaded_active", None):
+            CategoryProductCount.objects.update_categories(
+                list(self.category.values_list("pk", flat=True))
+            )
+        self._loaded_active = self.active
 
-        key = "Product_get_mainImage %s" % (self.id)
-        key = key.replace(" ", "-")
-        cache.delete(key)
+        caching.cache_delete("Product_get_mainImage", self.id)
 
     @property
     def main_category(self):
@@ -678,30 +981,37 @@ class Product(models.Model):
 
     @property
     def main_image(self):
-        key = "Product_get_mainImage %s" % (self.id)
-        key = key.replace(" ", "-")
-        img = cache.get(key)
-        if img is None:
-            img = False
-            if self.productimage_set.count() > 0:
-                img = self.productimage_set.order_by("sort")[0]
-            else:
-                # try to get a main image by looking at the parent if this has one
-                p = self.get_subtype_with_attr("parent", "product")
-                if p:
-                    img = p.parent.product.main_image
+        try:
+            return self._main_image
+        except AttributeError:
+            pass
 
-            if not img:
-                # This should be a "Image Not Found" placeholder image
-                try:
-                    img = ProductImage.objects.filter(product__isnull=True).order_by(
-                        "sort"
-                    )[0]
-                except IndexError:
-                    log.warning(
-                        "Default product image not found - try `manage.py migrate`"
-                    )
-            cache.set(key, img)
+        try:
+            img = caching.cache_get("Product_get_mainImage", self.id)
+        except caching.NotCachedError as nce:
+            img = self._find_main_image()
+            caching.cache_set(nce.key, value=img)
+        self._main_image = img
+        return img
+
+    def _find_main_image(self):
+        img = False
+        if self.productimage_set.count() > 0:
+            img = self.productimage_set.order_by("sort")[0]
+        else:
+            # try to get a main image by looking at the parent if this has one
+            p = self.get_subtype_with_attr("parent", "product")
+            if p:
+                img = p.parent.product.main_image
+
+        if not img:
+            # This should be a "Image Not Found" placeholder image
+            try:
+                img = ProductImage.objects.filter(product__isnull=True).order_by(
+                    "sort"
+                )[0]
+            except IndexError:
+                log.warning("Default product image not found - try `manage.py migrate`")
         return img
 
     @property
@@ -788,18 +1098,18 @@ class Product(models.Model):
         return True
 
     def get_subtypes(self):
+        """Return the names of the enabled subtypes this product has, read
+        from the stored `subtypes` without loading them."""
+        if self.subtypes is None and self.pk:
+            self.subtypes = update_subtypes([self.pk]).get(self.pk, "")
+        stored = (self.subtypes or "").split(",")
+
         types = []
         try:
             for key in config_value("PRODUCT", "PRODUCT_TYPES"):
                 app, subtype = key.split("::")
-                try:
-                    subclass = getattr(self, subtype.lower())
-                    gettype = getattr(subclass, "_get_subtype")
-                    subtype = gettype()
-                    if subtype not in types:
-                        types.append(subtype)
-                except models.ObjectDoesNotExist:
-                    pass
+                if subtype in stored and subtype not in types:
+                    types.append(subtype)
         except SettingNotSet:
             log.warning("Error getting subtypes, OK if in SyncDB")
 
@@ -807,6 +1117,22 @@ class Product(models.Model):
 
     get_subtypes.short_description = _("Product Subtypes")
 
+    def _subtype_objects(self, *attrs):
+        """Yield the subtypes of this product which have `attrs`.  Subtype
+        models are checked first, so that subtypes without them are not
+        loaded."""
+        models = subtype_models()
+        for subtype_name in self.get_subtypes():
+            model = models.get(subtype_name)
+            if model is not None and not all([hasattr(model, a) for a in attrs]):
+                continue
+            try:
+                yield getattr(self, subtype_name.lower())
+            except ObjectDoesNotExist:
+                log.warning(
+                    "%s has no %s, run satchmo_update_subtypes", self, subtype_name
+                )
+
     def get_subtype_with_attr(self, *args):
         """Get a subtype with the specified attributes.  Note that this can be chained
         so that you can ensure that the attribute then must have the specified attributes itself.
@@ -814,8 +1140,7 @@ class Product(models.Model):
         example:  get_subtype_with_attr('parent') = any parent
         example:  get_subtype_with_attr('parent', 'product') = any parent which has a product attribute
         """
-        for subtype_name in self.get_subtypes():
-            subtype = getattr(self, subtype_name.lower())
+        for subtype in self._subtype_objects(args[0]):
             if hasattr(subtype, args[0]):
                 if len(args) == 1:
                     return subtype
@@ -838,9 +1163,7 @@ class Product(models.Model):
 
         val = getattr(self, attr)
         if val is None:
-            for subtype_name in self.get_subtypes():
-                subtype = getattr(self, subtype_name.lower())
-
+            for subtype in self._subtype_objects():
                 if hasattr(subtype, "parent"):
                     subtype = subtype.parent.product
 
@@ -884,11 +1207,10 @@ class Product(models.Model):
         If this Product has any subtypes associated with it that are subscriptions, then
         consider it subscription based.
         """
-        for prod_type in self.get_subtypes():
-            subtype = getattr(self, prod_type.lower())
-            if hasattr(subtype, "is_subscription"):
-                return True
-        return False
+        models = subtype_models()
+        return any(
+            [hasattr(models.get(name), "is_subscription") for name in self.get_subtypes()]
+        )
 
     @property
     def is_shippable(self):
@@ -915,10 +1237,8 @@ class Product(models.Model):
         """
         subtypes = self.get_subtypes()
         logging.debug("subtypes = %s", subtypes)
-        for subtype_name in subtypes:
-            subtype = getattr(self, subtype_name.lower())
-            if hasattr(subtype, "add_template_context"):
-                context = subtype.add_template_context(context, *args, **kwargs)
+        for subtype in self._subtype_objects("add_template_context"):
+            context = subtype.add_template_context(context, *args, **kwargs)
         return context
 
     def cheapest_shipping(self):
@@ -982,6 +1302,79 @@ class Product(models.Model):
         return None
 
 
+_SUBTYPE_MODELS = None
+
+
+def subtype_models():
+    """Return a dict of subtype name -> model, for each model extending
+    Product one to one with a `_get_subtype` method, eg. ConfigurableProduct."""
+    global _SUBTYPE_MODELS
+
+    if _SUBTYPE_MODELS is None:
+        _SUBTYPE_MODELS = dict(
+            (rel.related_model.__name__, rel.related_model)
+            for rel in Product._meta.related_objects
+            if rel.one_to_one and hasattr(rel.related_model, "_get_subtype")
+        )
+    return _SUBTYPE_MODELS
+
+
+def find_subtypes(product_ids):
+    """Look up the subtypes of `product_ids` in one query, returning a dict
+    of product id -> comma separated subtype names."""
+    names = sorted(subtype_models())
+    annotations = dict(
+        (
+            "has_%s" % name.lower(),
+            Exists(
+                subtype_models()[name]._base_manager.filter(product=OuterRef("pk"))
+            ),
+        )
+        for name in names
+    )
+    rows = (
+        Product.objects.filter(pk__in=product_ids)
+        .order_by()
+        .annotate(**annotations)
+        .values_list("pk", *["has_%s" % name.lower() for name in names])
+    )
+    return dict(
+        (row[0], ",".join([name for name, found in zip(names, row[1:]) if found]))
+        for row in rows
+    )
+
+
+def update_subtypes(product_ids):
+    """Store the subtypes of `product_ids`, returning them as from
+    `find_subtypes`."""
+    found = find_subtypes(product_ids)
+    by_value = {}
+    for pk, subtypes in found.items():
+        by_value.setdefault(subtypes, []).append(pk)
+    for subtypes, pks in by_value.items():
+        Product.objects.filter(pk__in=pks).update(subtypes=subtypes)
+    return found
+
+
+def subtype_changed(sender, instance, **kwargs):
+    """Keep `Product.subtypes` up to date as a subtype is saved or deleted.
+    Connected for every subtype model in ProductConfig.ready."""
+    found = update_subtypes([instance.product_id])
+    field = sender._meta.get_field("product")
+    if field.is_cached(instance) and instance.product_id in found:
+        instance.product.subtypes = found[instance.product_id]
+
+    if sender is ProductVariation:
+        # the product has become, or is no longer, a variation
+        CategoryProductCount.objects.update_categories(
+            list(
+                Product.category.through.objects.filter(
+                    product_id=instance.product_id
+                ).values_list("category_id", flat=True)
+            )
+        )
+
+
 def get_all_options(obj, ids_only=False):
     """
     Returns all possible combinations of options for this products OptionGroups as a List of Lists.
@@ -1315,7 +1708,7 @@ class ConfigurableProduct(models.Model):
             self.create_subs = False
             super(ConfigurableProduct, self).save(*args, **kwargs)
 
-        ProductPriceLookup.objects.smart_create_for_product(self.product)
+        ProductPriceLookup.objects.refresh_for_product(self.product)
 
     def get_absolute_url(self):
         return self.product.get_absolute_url()
@@ -1747,7 +2140,7 @@ class ProductVariation(models.Model):
             self.name = ""
 
         super(ProductVariation, self).save(*args, **kwargs)
-        ProductPriceLookup.objects.smart_create_for_product(self.product)
+        ProductPriceLookup.objects.refresh_for_product(self.product)
 
     def _set_name(self, name):
         if not name:
@@ -1777,7 +2170,23 @@ class ProductVariation(models.Model):
     sku = property(fset=_set_sku, fget=_get_sku)
 
 
+BATCH_SIZE = 500
+
+
 class ProductPriceLookupManager(models.Manager):
+    def get_queryset(self):
+        # the rows of a rebuild are not seen until it is swapped in
+        return (
+            super(ProductPriceLookupManager, self).get_queryset().filter(generation=0)
+        )
+
+    def _generation(self, generation):
+        return (
+            super(ProductPriceLookupManager, self)
+            .get_queryset()
+            .filter(generation=generation)
+        )
+
     def by_product(self, product):
         return self.get(productslug=product.slug)
 
@@ -1785,84 +2194,281 @@ class ProductPriceLookupManager(models.Manager):
         for p in self.filter(expires__lt=datetime.date.today()):
             p.delete()
 
-    def create_for_product(self, product):
-        """Create a set of lookup objects for all priced quantities of the Product"""
-
-        self.delete_for_product(product)
-        pricelist = product.get_qty_price_list()
-
-        objs = []
-        for qty, price in pricelist:
-            obj = ProductPriceLookup(
+    def _lookups(self, product, pricelist, **kwargs):
+        return [
+            ProductPriceLookup(
                 productslug=product.slug,
                 active=product.active,
                 price=price,
                 quantity=qty,
                 discountable=product.is_discountable,
                 items_in_stock=product.items_in_stock,
+                **kwargs
             )
-            obj.save()
-            objs.append(obj)
-        return objs
+            for qty, price in pricelist
+        ]
 
-    def create_for_configurableproduct(self, configproduct):
-        """Create a set of lookup objects for all variations of this product"""
+    def _replace(self, products, lookups):
+        """Replace the lookups of `products` with `lookups`, in one delete and
+        one insert."""
+        with transaction.atomic():
+            self.filter(productslug__in=[product.slug for product in products]).delete()
+            self.bulk_create(lookups, batch_size=BATCH_SIZE)
+        return lookups
+
+    def lookups_for_product(self, product):
+        """Return unsaved lookup objects for all priced quantities of the
+        Product."""
+        return self._lookups(product, product.get_qty_price_list())
+
+    def lookups_for_variation(self, variation, parent):
+        return self._lookups(
+            variation.product,
+            variation.get_qty_price_list(),
+            parentid=parent.id,
+            key=variation.optionkey,
+        )
 
-        objs = self.create_for_product(configproduct)
+    def _configurable_lookups(self, configproduct):
+        products = [configproduct]
+        lookups = self.lookups_for_product(configproduct)
         for pv in configproduct.configurableproduct.productvariation_set.filter(
             product__active="1"
-        ):
-            objs.extend(self.create_for_variation(pv, configproduct))
+        ).select_related("product"):
+            products.append(pv.product)
+            lookups.extend(self.lookups_for_variation(pv, configproduct))
+        return products, lookups
+
+    def smart_lookups_for_product(self, product):
+        """Return the products whose lookups are replaced when `product` is
+        priced, and their unsaved lookups."""
+        subtypes = product.get_subtypes()
+        if "ConfigurableProduct" in subtypes:
+            return self._configurable_lookups(product)
+        elif "ProductVariation" in subtypes:
+            variation = product.productvariation
+            return (
+                [product],
+                self.lookups_for_variation(variation, variation.parent.product),
+            )
+        else:
+            return [product], self.lookups_for_product(product)
 
-        return objs
+    def create_for_product(self, product):
+        """Create a set of lookup objects for all priced quantities of the Product"""
+        return self._replace([product], self.lookups_for_product(product))
+
+    def create_for_configurableproduct(self, configproduct):
+        """Create a set of lookup objects for all variations of this product"""
+        return self._replace(*self._configurable_lookups(configproduct))
 
     def create_for_variation(self, variation, parent):
-        product = variation.product
+        return self._replace(
+            [variation.product], self.lookups_for_variation(variation, parent)
+        )
 
-        self.delete_for_product(product)
-        pricelist = variation.get_qty_price_list()
+    def delete_for_product(self, product):
+        self.filter(productslug=product.slug).delete()
 
-        objs = []
-        for qty, price in pricelist:
-            obj = ProductPriceLookup(
-                productslug=product.slug,
-                parentid=parent.id,
-                active=product.active,
-                price=price,
-                quantity=qty,
-                key=variation.optionkey,
-                discountable=product.is_discountable,
-                items_in_stock=product.items_in_stock,
-            )
-            obj.save()
-            objs.append(obj)
-        return objs
+    def smart_create_for_product(self, product):
+        return self._replace(*self.smart_lookups_for_product(product))
 
-    def delete_for_product(self, product):
-        for obj in self.filter(productslug=product.slug):
-            obj.delete()
+    def refresh_for_product(self, product):
+        """Rebuild the lookups of `product` now, or queue it to be rebuilt by
+        `ProductPriceRefresh.objects.drain` if PRODUCT_PRICES_QUEUED is set."""
+        if getattr(settings, "PRODUCT_PRICES_QUEUED", False):
+            ProductPriceRefresh.objects.queue([product.pk])
+            return []
+        return self.smart_create_for_product(product)
 
     def rebuild_all(self):
-        for lookup in self.all():
-            lookup.delete()
-
-        ct = 0
         log.debug("ProductPriceLookup rebuilding all pricing")
-        for p in Product.objects.active(variations=False):
-            prices = self.smart_create_for_product(p)
-            ct += len(prices)
+        ct = self.rebuild()
         log.info("ProductPriceLookup built %i prices", ct)
 
-    def smart_create_for_product(self, product):
-        subtypes = product.get_subtypes()
-        if "ConfigurableProduct" in subtypes:
-            return self.create_for_configurableproduct(product)
-        elif "ProductVariation" in subtypes:
-            return self.create_for_variation(
-                product.productvariation, product.productvariation.product
+    def rebuild(self, since=None, workers=1, chunk_size=BATCH_SIZE, progress=None):
+        """Build the lookups of all active products, or of all products
+        updated on or after the date `since`, returning the number built.
+
+        The lookups are written out of sight and swapped in at the end in one
+        transaction, so that prices are never missing meanwhile.  The
+        products are split by id into chunks of `chunk_size`, built by
+        `workers` processes.  `progress` is called with the number of
+        products and of lookups built after each chunk.
+        """
+        ids = list(_rebuild_products(since).order_by("pk").values_list("pk", flat=True))
+        chunks = [
+            (ids[ix], ids[min(ix + chunk_size, len(ids)) - 1])
+            for ix in range(0, len(ids), chunk_size)
+        ]
+        generation = self._generation_max() + 1
+
+        built = 0
+        try:
+            for products, lookups in _map_rebuild(generation, since, chunks, workers):
+                built += lookups
+                if progress is not None:
+                    progress(products, lookups)
+            self._swap(generation, since)
+        except BaseException:
+            self._generation(generation).delete()
+            raise
+        return built
+
+    def _generation_max(self):
+        found = (
+            super(ProductPriceLookupManager, self)
+            .get_queryset()
+            .aggregate(models.Max("generation"))
+        )
+        return found["generation__max"] or 0
+
+    def _swap(self, generation, since):
+        """Replace the lookups in use with those of `generation`."""
+        with transaction.atomic():
+            staged = self._generation(generation)
+            if since is None:
+                self.all().delete()
+            else:
+                slugs = set(staged.values_list("productslug", flat=True))
+                # including variations no longer built, eg. made inactive
+                slugs.update(
+                    Product.objects.filter(date_updated__gte=since).values_list(
+                        "slug", flat=True
+                    )
+                )
+                slugs = sorted(slugs)
+                for ix in range(0, len(slugs), BATCH_SIZE):
+                    self.filter(productslug__in=slugs[ix : ix + BATCH_SIZE]).delete()
+            staged.update(generation=0)
+
+            # older rebuilds which never finished
+            super(ProductPriceLookupManager, self).get_queryset().filter(
+                generation__gt=0, generation__lt=generation
+            ).delete()
+
+
+class ProductPriceRefreshManager(models.Manager):
+    def queue(self, product_ids):
+        """Mark `product_ids` as needing their price lookups rebuilt, in one
+        insert.  Products already queued keep their place."""
+        self.bulk_create(
+            [self.model(product_id=pk) for pk in set(product_ids)],
+            ignore_conflicts=True,
+        )
+
+    def drain(self, batch_size=BATCH_SIZE):
+        """Rebuild the lookups of the queued products, oldest first, with one
+        delete and insert per batch.  Returns the number of products."""
+        done = 0
+        while True:
+            ids = list(
+                self.order_by("queued").values_list("product_id", flat=True)[
+                    :batch_size
+                ]
             )
-        else:
-            return self.create_for_product(product)
+            if not ids:
+                return done
+
+            # taken off the queue first, so that saves meanwhile queue again
+            self.filter(product_id__in=ids).delete()
+            try:
+                products, lookups = [], []
+                for product in Product.objects.filter(pk__in=ids):
+                    found = ProductPriceLookup.objects.smart_lookups_for_product(
+                        product
+                    )
+                    products.extend(found[0])
+                    lookups.extend(found[1])
+                ProductPriceLookup.objects._replace(products, lookups)
+            except Exception:
+                self.queue(ids)
+                raise
+            done += len(ids)
+
+
+class ProductPriceRefresh(models.Model):
+    """A product whose price lookups are to be rebuilt, with
+    PRODUCT_PRICES_QUEUED set."""
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, verbose_name=_("Product")
+    )
+    queued = models.DateTimeField(_("Queued"), auto_now_add=True, db_index=True)
+
+    objects = ProductPriceRefreshManager()
+
+    class Meta:
+        verbose_name = _("Product Price Refresh")
+        verbose_name_plural = _("Product Price Refreshes")
+
+
+def _rebuild_products(since):
+    """The products to build, each only once.  Variations are built with
+    their configurable product, so an updated variation rebuilds its parent
+    instead."""
+    if since is None:
+        return Product.objects.active(variations=False)
+    updated = Product.objects.filter(date_updated__gte=since)
+    parents = ProductVariation.objects.filter(product__in=updated).values("parent")
+    return Product.objects.filter(
+        Q(pk__in=updated.filter(productvariation__parent__isnull=True))
+        | Q(pk__in=parents)
+    )
+
+
+def _rebuild_chunk(generation, since, first, last):
+    """Write the lookups of the products with ids from `first` to `last` as
+    `generation`, returning the number of products and of lookups."""
+    products = _rebuild_products(since).filter(pk__gte=first, pk__lte=last)
+    found = []
+    count = 0
+    for product in products:
+        count += 1
+        found.extend(ProductPriceLookup.objects.smart_lookups_for_product(product)[1])
+    for lookup in found:
+        lookup.generation = generation
+    ProductPriceLookup.objects.bulk_create(found, batch_size=BATCH_SIZE)
+    return count, len(found)
+
+
+def _rebuild_chunk_in_process(args):
+    try:
+        return _rebuild_chunk(*args)
+    finally:
+        connections.close_all()
+
+
+def _unshared_connection():
+    """True if other processes cannot see what this connection sees, as its
+    database is in memory or it is inside a transaction."""
+    if connection.in_atomic_block:
+        return True
+    return connection.vendor == "sqlite" and connection.is_in_memory_db()
+
+
+def _map_rebuild(generation, since, chunks, workers):
+    """Yield the results of `_rebuild_chunk` for each chunk as it finishes."""
+    args = [(generation, since, first, last) for first, last in chunks]
+    if workers > 1 and _unshared_connection():
+        log.warning("Building prices in one process, others cannot see the data")
+        workers = 1
+    if workers <= 1:
+        for arg in args:
+            yield _rebuild_chunk(*arg)
+        return
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    # the processes must each open their own connections
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("fork")
+    ) as executor:
+        futures = [executor.submit(_rebuild_chunk_in_process, arg) for arg in args]
+        for future in as_completed(futures):
+            yield future.result()
 
 
 class ProductPriceLookup(models.Model):
@@ -1879,6 +2485,8 @@ class ProductPriceLookup(models.Model):
     active = models.BooleanField(default=False)
     discountable = models.BooleanField(default=False)
     items_in_stock = models.IntegerField()
+    # 0 for the lookups in use, otherwise those of a rebuild in progress
+    generation = models.IntegerField(default=0, db_index=True)
 
     objects = ProductPriceLookupManager()
 
@@ -1959,7 +2567,7 @@ class Price(models.Model):
             return None  # Duplicate Price
 
         super(Price, self).save(*args, **kwargs)
-        ProductPriceLookup.objects.smart_create_for_product(self.product)
+        ProductPriceLookup.objects.refresh_for_product(self.product)
 
     class Meta:
         ordering = ["expires", "-quantity"]
@@ -2060,6 +2668,129 @@ def get_product_quantity_price(product, quantity=1, delta=Decimal("0.00"), paren
         return None
 
 
+def _qty_price_subtype(product):
+    """Return the name of the subtype whose `get_qty_price` prices
+    `product`, or None for the product's own."""
+    models = subtype_models()
+    for name in product.get_subtypes():
+        if hasattr(models.get(name), "get_qty_price"):
+            return name
+    return None
+
+
+def _price_value(price, user):
+    """Return `price.dynamic_price`, also passing `user` to the listeners,
+    without sending the signal when nothing listens."""
+    if signals.satchmo_price_query.has_listeners():
+        signals.satchmo_price_query.send(price, price=price, user=user)
+    val = price.price
+    if not isinstance(val, Decimal):
+        val = Decimal(val)
+    return val
+
+
+def price_many(products, qty=1, user=None, currency=None):
+    """Return a dict of product id -> `product.get_qty_price(qty)` for many
+    products, looking up their quantity prices together.
+
+    The prices of all the products are read in one query, and variations
+    take two more for their parents and option price changes.  Products
+    priced by another subtype, eg. subscriptions, are priced one by one.
+    `user` is passed on to the `satchmo_price_query` listeners, and prices are
+    converted to `currency`, an ISO 4217 code, if given.
+    """
+    prices = {}
+    tiered = []
+    variation_ids = []
+    for product in products:
+        if qty == 1:
+            prices[product.pk] = product.unit_price
+            continue
+
+        subtype = _qty_price_subtype(product)
+        if subtype is None:
+            tiered.append(product)
+        elif subtype == "ProductVariation":
+            tiered.append(product)
+            variation_ids.append(product.pk)
+        else:
+            prices[product.pk] = product.get_qty_price(qty)
+
+    # product id -> [parent product id, option price change]
+    variations = {}
+    if variation_ids:
+        for pk, parent_id in ProductVariation.objects.filter(
+            product__in=variation_ids
+        ).values_list("product_id", "parent__product_id"):
+            variations[pk] = [parent_id, Decimal("0.00")]
+        for pk, change in ProductVariation.options.through.objects.filter(
+            productvariation__in=variation_ids
+        ).values_list("productvariation_id", "option__price_change"):
+            if change and pk in variations:
+                variations[pk][1] += Decimal(change)
+
+    tiers = {}
+    if tiered:
+        ids = set([product.pk for product in tiered])
+        ids.update([parent_id for parent_id, delta in variations.values()])
+        found = Price.objects.filter(product__in=ids, quantity__lte=qty).exclude(
+            expires__isnull=False, expires__lt=datetime.date.today()
+        )
+        # the highest quantity up to `qty`, expiring first
+        found = sorted(
+            found,
+            key=lambda price: (-price.quantity, price.expires or datetime.date.max),
+        )
+        for price in found:
+            tiers.setdefault(price.product_id, price)
+
+    for product in tiered:
+        if product.pk in variations:
+            parent_id, delta = variations[product.pk]
+            price = tiers.get(product.pk) or tiers.get(parent_id)
+            if price is None:
+                prices[product.pk] = None
+            else:
+                prices[product.pk] = _price_value(price, user) + delta
+        elif product.pk in variation_ids:
+            # the subtype is missing, see get_subtype_with_attr
+            prices[product.pk] = product.get_qty_price(qty)
+        else:
+            price = tiers.get(product.pk)
+            val = price and _price_value(price, user)
+            prices[product.pk] = val or product.unit_price
+
+    if currency:
+        code = getattr(currency, "iso_4217_code", currency)
+        for pk, val in prices.items():
+            if val is not None:
+                prices[pk] = convert_to_currency(val, code)
+    return prices
+
+
+def load_main_images(items):
+    """Look up the `main_image` of many Products or Categories, reading the
+    cache in one call and caching any misses together."""
+    items = [item for item in items if not hasattr(item, "_main_image")]
+    keys = dict(
+        (caching.cache_key("%s_get_mainImage" % item.__class__.__name__, item.id), item)
+        for item in items
+    )
+    if not keys:
+        return
+
+    hits, misses = caching.cache_get_many(list(keys.keys()))
+    for key, img in hits.items():
+        keys[key]._main_image = img
+
+    found = {}
+    for key in misses:
+        item = keys[key]
+        item._main_image = found[key] = item._find_main_image()
+    if found:
+        caching.cache_set_many(found)
+
+
 def make_option_unique_id(groupid, value):
     return "%s-%s" % (str(groupid), str(value))
 
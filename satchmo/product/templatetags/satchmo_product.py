@@ -1,6 +1,6 @@
 from django import template
 from satchmo import caching
-from satchmo.product.models import Product
+from satchmo.product.models import CategoryProductCount, Product
 from satchmo.shop.templatetags import get_filter_args
 from satchmo.product.queries import bestsellers
 from satchmo.product.views import display_featured
@@ -33,18 +33,26 @@ def product_count(category, args=""):
     """
     args, kwargs = get_filter_args(args, boolargs=("variations"))
     variations = kwargs.get("variations", False)
-    try:
-        ct = caching.cache_get("product_count", category, variations)
-    except caching.NotCachedError:
-        if not category:
-            ct = Product.objects.active(variations=variations).count()
-        else:
-            ct = category.active_products(
-                include_children=True, variations=variations
-            ).count()
-
-        caching.cache_set("product_count", category, args, value=ct)
-    return ct
+    return product_counts([category], variations=variations)[category]
+
+
+def product_counts(categories, variations=False):
+    """Get a dict of category -> `product_count` for many categories, reading
+    the stored counts in one query."""
+    counts = {}
+    if None in categories:
+        key = caching.cache_key("product_count", None, variations)
+        try:
+            counts[None] = caching.cache_get(key)
+        except caching.NotCachedError:
+            counts[None] = Product.objects.active(variations=variations).count()
+            caching.cache_set(key, value=counts[None])
+
+    categories = [category for category in categories if category]
+    stored = CategoryProductCount.objects.for_categories(categories)
+    for category in categories:
+        counts[category] = stored[category.pk].total(variations=variations)
+    return counts
 
 
 register.filter("product_count", product_count)
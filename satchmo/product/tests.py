@@ -73,21 +73,36 @@ True
 
 import datetime
 from decimal import Decimal
+from io import StringIO
+from unittest import skipIf
 
 
-from django.test import TestCase
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
 
 from satchmo import caching
 from satchmo.product.brand.factories import BrandFactory
-from satchmo.product.factories import ProductFactory
+from satchmo.product.factories import (
+    ConfigurableProductFactory,
+    PriceFactory,
+    ProductFactory,
+)
 from satchmo.product.models import (
+    Category,
+    CategoryProductCount,
     ConfigurableProduct,
     Option,
     OptionGroup,
     Price,
     Product,
+    ProductPriceLookup,
+    ProductPriceRefresh,
     ProductVariation,
+    price_many,
 )
+from satchmo.product.templatetags.satchmo_product import product_counts
 from satchmo.product.utils import serialize_options, productvariation_details
 from satchmo.shop.satchmo_settings import get_satchmo_setting
 
@@ -100,6 +115,132 @@ class CategoryTest(TestCase):
     def tearDown(self):
         caching.cache_delete()
 
+    def test_active_products_cached_as_ids(self):
+        category = Category.objects.create(name="Shirts", slug="shirts")
+        product = ProductFactory()
+        product.category.add(category)
+        self.assertEqual(category.active_products(), [product])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(category.active_products(), [product])
+
+        product.active = False
+        product.save()
+        category.save()
+        self.assertEqual(category.active_products(), [])
+
+    def test_tree_paths(self):
+        clothes = Category.objects.create(name="Clothes", slug="clothes")
+        shirts = Category.objects.create(name="Shirts", slug="shirts", parent=clothes)
+        socks = Category.objects.create(name="Socks", slug="socks", parent=clothes)
+        polos = Category.objects.create(name="Polos", slug="polos", parent=shirts)
+        self.assertEqual(polos.path, "%i/%i/%i/" % (clothes.id, shirts.id, polos.id))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(polos.parents(), [clothes, shirts])
+        with self.assertNumQueries(1):
+            self.assertEqual(clothes.get_all_children(), [shirts, polos, socks])
+        self.assertEqual(shirts.get_all_children(include_self=True), [shirts, polos])
+
+        product = ProductFactory()
+        product.category.add(polos)
+        self.assertEqual(clothes.get_active_children(), [shirts, polos])
+        self.assertEqual(clothes.active_products(include_children=True), [product])
+
+    def test_moving_category_moves_children(self):
+        clothes = Category.objects.create(name="Clothes", slug="clothes")
+        shirts = Category.objects.create(name="Shirts", slug="shirts", parent=clothes)
+        polos = Category.objects.create(name="Polos", slug="polos", parent=shirts)
+        self.assertEqual(clothes.get_all_children(), [shirts, polos])
+
+        shirts.parent = None
+        shirts.save()
+        polos = Category.objects.get(pk=polos.pk)
+        self.assertEqual(polos.path, "%i/%i/" % (shirts.id, polos.id))
+        self.assertEqual(polos.parents(), [shirts])
+        self.assertEqual(clothes.get_all_children(), [])
+
+        clothes.parent = polos
+        clothes.save()
+        shirts.parent = clothes
+        self.assertRaises(ValidationError, shirts.save)
+
+    def test_rebuild_paths(self):
+        clothes = Category.objects.create(name="Clothes", slug="clothes")
+        shirts = Category.objects.create(name="Shirts", slug="shirts", parent=clothes)
+        Category.objects.update(path="")
+
+        self.assertEqual(Category.objects.rebuild_paths(), 2)
+        self.assertEqual(Category.objects.rebuild_paths(), 0)
+        shirts = Category.objects.get(pk=shirts.pk)
+        self.assertEqual(shirts.path, "%i/%i/" % (clothes.id, shirts.id))
+
+    def test_product_counts(self):
+        clothes = Category.objects.create(name="Clothes", slug="clothes")
+        shirts = Category.objects.create(name="Shirts", slug="shirts", parent=clothes)
+        socks = Category.objects.create(name="Socks", slug="socks", parent=clothes)
+        shirt = ProductFactory()
+        shirt.category.add(shirts, socks)
+        sock = ProductFactory()
+        sock.category.add(socks)
+
+        with self.assertNumQueries(1):
+            counts = product_counts([clothes, shirts, socks])
+        self.assertEqual(counts, {clothes: 2, shirts: 1, socks: 2})
+
+        config = ConfigurableProductFactory()
+        ProductVariation.objects.create(product=sock, parent=config)
+        stats = CategoryProductCount.objects.get(category=clothes)
+        self.assertEqual((stats.products, stats.all_products), (0, 2))
+        self.assertEqual(stats.total(variations=False), 1)
+
+        shirt = Product.objects.get(pk=shirt.pk)
+        shirt.active = False
+        shirt.save()
+        self.assertEqual(
+            product_counts([clothes, shirts], variations=True), {clothes: 1, shirts: 0}
+        )
+        self.assertEqual(clothes.get_active_children(), [socks])
+
+        sock.category.remove(socks)
+        shirt.active = True
+        shirt.save()
+        shirt.category.clear()
+        self.assertEqual(product_counts([clothes]), {clothes: 0})
+
+    def test_count_in_one_query(self):
+        clothes = Category.objects.create(name="Clothes", slug="clothes")
+        shirts = Category.objects.create(name="Shirts", slug="shirts", parent=clothes)
+        socks = Category.objects.create(name="Socks", slug="socks", parent=clothes)
+        hats = Category.objects.create(name="Hats", slug="hats")
+        shirt = ProductFactory()
+        shirt.category.add(clothes, shirts, socks)
+        ProductFactory().category.add(socks, hats)
+
+        categories = [clothes, shirts, socks, hats]
+        with self.assertNumQueries(1):
+            counts = CategoryProductCount.objects.count(categories)
+        self.assertEqual(
+            [(counts[c.pk].products, counts[c.pk].all_products) for c in categories],
+            [(1, 2), (1, 1), (2, 2), (1, 1)],
+        )
+
+    def test_product_counts_follow_moves(self):
+        clothes = Category.objects.create(name="Clothes", slug="clothes")
+        shirts = Category.objects.create(name="Shirts", slug="shirts", parent=clothes)
+        ProductFactory().category.add(shirts)
+        self.assertEqual(product_counts([clothes]), {clothes: 1})
+
+        shirts.parent = None
+        shirts.save()
+        self.assertEqual(product_counts([clothes, shirts]), {clothes: 0, shirts: 1})
+
+        CategoryProductCount.objects.update(all_products=5)
+        out = StringIO()
+        call_command("satchmo_rebuild_category_counts", stdout=out)
+        self.assertIn("2 categories", out.getvalue())
+        self.assertEqual(product_counts([clothes, shirts]), {clothes: 0, shirts: 1})
+
 
 #    def test_absolute_url(self):
 #        prefix = get_satchmo_setting('SHOP_BASE')
@@ -266,6 +407,278 @@ class ProductTest(TestCase):
         self.assertEqual(sb.smart_attr("height"), None)
 
 
+class ProductSubtypesTest(TestCase):
+    def tearDown(self):
+        caching.cache_delete()
+
+    def test_kept_up_to_date(self):
+        product = ProductFactory()
+        self.assertEqual(product.subtypes, "")
+        stale = Product.objects.get(pk=product.pk)
+
+        configurable = ConfigurableProduct.objects.create(product=product)
+        self.assertEqual(product.get_subtypes(), ("ConfigurableProduct",))
+
+        # saving a copy loaded before the subtype was added keeps it
+        stale.save()
+        product = Product.objects.get(pk=product.pk)
+        self.assertEqual(product.get_subtypes(), ("ConfigurableProduct",))
+
+        configurable.delete()
+        product = Product.objects.get(pk=product.pk)
+        self.assertEqual(product.get_subtypes(), ())
+
+    def test_save_semantics_kept(self):
+        product = ProductFactory()
+        product.name = "Renamed"
+        product.sku = "renamed"
+        product.save(update_fields=["name"])
+        saved = Product.objects.get(pk=product.pk)
+        self.assertEqual(saved.name, "Renamed")
+        self.assertNotEqual(saved.sku, "renamed")
+
+        # not added by this instance, but without a row it is still inserted
+        pk = product.pk
+        Product.objects.filter(pk=pk).delete()
+        product.save()
+        self.assertEqual(Product.objects.get(pk=pk).subtypes, "")
+
+    def test_no_queries(self):
+        product = ConfigurableProductFactory().product
+        Product.objects.filter(pk=product.pk).update(shipclass="DEFAULT")
+        product = Product.objects.get(pk=product.pk)
+        product.get_subtypes()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(product.get_subtypes(), ("ConfigurableProduct",))
+            self.assertTrue(product.is_shippable)
+            self.assertTrue(product.is_discountable)
+            self.assertFalse(product.is_subscription)
+
+    def test_backfill(self):
+        product = ConfigurableProductFactory().product
+        plain = ProductFactory()
+        Product.objects.update(subtypes=None)
+
+        out = StringIO()
+        call_command("satchmo_update_subtypes", stdout=out)
+        self.assertIn("Updated 2 products", out.getvalue())
+        self.assertEqual(
+            Product.objects.get(pk=product.pk).subtypes, "ConfigurableProduct"
+        )
+        self.assertEqual(Product.objects.get(pk=plain.pk).subtypes, "")
+
+    def test_looked_up_when_missing(self):
+        product = ConfigurableProductFactory().product
+        Product.objects.update(subtypes=None)
+        product = Product.objects.get(pk=product.pk)
+        self.assertEqual(product.get_subtypes(), ("ConfigurableProduct",))
+        self.assertEqual(
+            Product.objects.get(pk=product.pk).subtypes, "ConfigurableProduct"
+        )
+
+
+class ProductPriceLookupTest(TestCase):
+    def tearDown(self):
+        caching.cache_delete()
+
+    def test_rebuild(self):
+        price = PriceFactory()
+        PriceFactory(product=price.product, quantity=10, price=Decimal("4.00"))
+        ProductPriceLookup.objects.all().delete()
+
+        self.assertEqual(ProductPriceLookup.objects.rebuild(), 3)
+        self.assertEqual(
+            sorted(
+                ProductPriceLookup.objects.filter(
+                    productslug=price.product.slug
+                ).values_list("quantity", flat=True)
+            ),
+            [1, 2, 10],
+        )
+        self.assertEqual(ProductPriceLookup.objects.rebuild(), 3)
+        self.assertEqual(ProductPriceLookup._base_manager.count(), 3)
+
+    def test_failed_rebuild_keeps_prices(self):
+        PriceFactory()
+        self.assertEqual(ProductPriceLookup.objects.count(), 2)
+
+        def fail(products, lookups):
+            # the rebuilt prices are not seen yet
+            self.assertEqual(ProductPriceLookup.objects.count(), 2)
+            self.assertEqual(ProductPriceLookup._base_manager.count(), 4)
+            raise ValueError
+
+        self.assertRaises(ValueError, ProductPriceLookup.objects.rebuild, progress=fail)
+        self.assertEqual(ProductPriceLookup._base_manager.count(), 2)
+
+    def test_rebuild_since(self):
+        old = PriceFactory()
+        new = PriceFactory()
+        Product.objects.filter(pk=old.product.pk).update(
+            date_updated=datetime.date(2000, 1, 1)
+        )
+        ProductPriceLookup.objects.update(price=Decimal("1.00"))
+
+        out = StringIO()
+        call_command(
+            "satchmo_rebuild_pricing", since=str(datetime.date.today()), stdout=out
+        )
+        self.assertIn("Added 2 total prices for 1 products", out.getvalue())
+
+        def prices(product):
+            return set(
+                ProductPriceLookup.objects.filter(productslug=product.slug).values_list(
+                    "price", flat=True
+                )
+            )
+
+        self.assertEqual(prices(old.product), set([Decimal("1.00")]))
+        self.assertEqual(prices(new.product), set([Decimal("5.00")]))
+
+    def test_rebuild_since_variations(self):
+        configurable = ConfigurableProductFactory()
+        variation = ProductVariation.objects.create(
+            product=ProductFactory(), parent=configurable
+        )
+        slugs = [configurable.product.slug, variation.product.slug]
+
+        def lookups():
+            return sorted(
+                ProductPriceLookup.objects.filter(productslug__in=slugs).values_list(
+                    "productslug", "quantity"
+                )
+            )
+
+        today = datetime.date.today()
+        self.assertEqual(ProductPriceLookup.objects.rebuild(since=today), 2)
+        self.assertEqual(lookups(), sorted([(slug, 1) for slug in slugs]))
+
+        # only the variation was updated, its parent builds it
+        Product.objects.filter(pk=configurable.product.pk).update(
+            date_updated=datetime.date(2000, 1, 1)
+        )
+        self.assertEqual(ProductPriceLookup.objects.rebuild(since=today), 2)
+        self.assertEqual(lookups(), sorted([(slug, 1) for slug in slugs]))
+
+    def test_rebuild_workers(self):
+        # inside the test's transaction the rebuild stays in this process
+        for ix in range(3):
+            PriceFactory()
+        self.assertEqual(ProductPriceLookup.objects.rebuild(workers=2, chunk_size=1), 6)
+        self.assertEqual(ProductPriceLookup._base_manager.count(), 6)
+
+    def test_stock_only_save(self):
+        product = PriceFactory().product
+        ProductPriceLookup.objects.update(price=Decimal("1.00"))
+
+        product.items_in_stock = 7
+        product.save(refresh_prices=False)
+        for lookup in ProductPriceLookup.objects.filter(productslug=product.slug):
+            self.assertEqual(lookup.items_in_stock, 7)
+            self.assertEqual(lookup.price, Decimal("1.00"))
+
+    @override_settings(PRODUCT_PRICES_QUEUED=True)
+    def test_queued_refresh(self):
+        product = ProductFactory()
+        self.assertEqual(ProductPriceLookup.objects.count(), 0)
+        PriceFactory(product=product)
+        product.save()
+        self.assertEqual(
+            list(ProductPriceRefresh.objects.values_list("product", flat=True)),
+            [product.pk],
+        )
+
+        out = StringIO()
+        call_command("satchmo_refresh_prices", stdout=out)
+        self.assertIn("Refreshed prices of 1 products", out.getvalue())
+        self.assertEqual(ProductPriceLookup.objects.count(), 2)
+        self.assertEqual(ProductPriceRefresh.objects.count(), 0)
+
+
+@skipIf(
+    connection.vendor == "sqlite" and connection.is_in_memory_db(),
+    "other processes cannot see an in-memory database",
+)
+class ProductPriceLookupWorkersTest(TransactionTestCase):
+    def tearDown(self):
+        caching.cache_delete()
+
+    def test_rebuild(self):
+        configurable = ConfigurableProductFactory()
+        ProductVariation.objects.create(product=ProductFactory(), parent=configurable)
+        for ix in range(3):
+            PriceFactory()
+        ProductPriceLookup.objects.all().delete()
+
+        self.assertEqual(ProductPriceLookup.objects.rebuild(workers=2, chunk_size=1), 8)
+        self.assertEqual(ProductPriceLookup.objects.count(), 8)
+        self.assertEqual(ProductPriceLookup._base_manager.count(), 8)
+
+
+class PriceManyTest(TestCase):
+    def tearDown(self):
+        caching.cache_delete()
+
+    def test_quantity_prices(self):
+        tiered = ProductFactory()
+        PriceFactory(product=tiered, quantity=2, price=Decimal("4.00"))
+        PriceFactory(product=tiered, quantity=10, price=Decimal("3.00"))
+        PriceFactory(
+            product=tiered,
+            quantity=3,
+            price=Decimal("1.00"),
+            expires=datetime.date.today() - datetime.timedelta(days=1),
+        )
+        plain = ProductFactory(unit_price=Decimal("7.00"))
+        products = list(Product.objects.filter(pk__in=[tiered.pk, plain.pk]))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                price_many(products),
+                {tiered.pk: Decimal("5.00"), plain.pk: Decimal("7.00")},
+            )
+        with self.assertNumQueries(1):
+            prices = price_many(products, qty=5)
+        self.assertEqual(
+            prices, {tiered.pk: Decimal("4.00"), plain.pk: Decimal("7.00")}
+        )
+        for product in products:
+            self.assertEqual(prices[product.pk], product.get_qty_price(5))
+
+    def test_variations(self):
+        configurable = ConfigurableProductFactory()
+        PriceFactory(product=configurable.product, quantity=2, price=Decimal("8.00"))
+        group = OptionGroup.objects.create(name="Size", sort_order=1)
+        large = Option.objects.create(
+            option_group=group,
+            name="Large",
+            value="L",
+            price_change=Decimal("1.50"),
+            sort_order=1,
+        )
+        variation = ProductVariation.objects.create(
+            product=ProductFactory(), parent=configurable
+        )
+        variation.options.add(large)
+        priced = ProductVariation.objects.create(
+            product=ProductFactory(), parent=configurable
+        )
+        PriceFactory(product=priced.product, quantity=2, price=Decimal("6.00"))
+
+        products = list(
+            Product.objects.filter(pk__in=[variation.product.pk, priced.product.pk])
+        )
+        with self.assertNumQueries(3):
+            prices = price_many(products, qty=2)
+        self.assertEqual(
+            prices,
+            {variation.product.pk: Decimal("9.50"), priced.product.pk: Decimal("6.00")},
+        )
+        for product in products:
+            self.assertEqual(prices[product.pk], product.get_qty_price(2))
+
+
 class ProductStockDueTest(TestCase):
     """Test Product functions"""
 
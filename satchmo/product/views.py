@@ -20,6 +20,7 @@ from satchmo.product.models import (
     ConfigurableProduct,
     IngredientsList,
     Product,
+    load_main_images,
     sorted_tuple,
 )
 from satchmo.product.signals import index_prerender
@@ -87,6 +88,7 @@ def category_view(request, slug, parent_slugs="", template="base_category.html")
         )
 
     child_categories = category.get_all_children()
+    load_main_images(list(products) + list(child_categories))
 
     ctx = {
         "category": category,
@@ -66,6 +66,8 @@ MIDDLEWARE_CLASSES = (
     "django.contrib.admindocs.middleware.XViewMiddleware",
     "django.middleware.http.ConditionalGetMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "satchmo.caching.middleware.RequestCacheMiddleware",
+    "satchmo.configuration.middleware.ConfigProfileMiddleware",
 )
 
 # This is used to add additional config variables to each request
@@ -1,5 +1,9 @@
 from django.utils.translation import ugettext_lazy as _
-from satchmo.configuration.functions import config_register, config_value
+from satchmo.configuration.functions import (
+    config_register,
+    config_register_module,
+    config_value,
+)
 from satchmo.configuration.values import ConfigurationGroup, MultipleStringValue
 from satchmo.shop.satchmo_settings import get_satchmo_setting
 from satchmo.utils import load_module
@@ -32,20 +36,17 @@ SHIPPING_ACTIVE = config_register(
 # need to add it to CUSTOM_SHIPPING_MODULES either.
 _default_modules = ("dummy", "fedex", "flat", "per", "ups", "usps", "royalmailcontract")
 
+# Their configuration is only imported once the SHIPPING group is used.
 for module in _default_modules:
-    try:
-        load_module("satchmo.shipping.modules.%s.config" % module)
-    except ImportError:
-        logger.debug("Could not load default shipping module configuration: %s", module)
+    config_register_module(
+        "SHIPPING", "satchmo.shipping.modules.%s.config" % module, optional=True
+    )
 
 # --- Load any extra shipping modules. ---
 extra_shipping = get_satchmo_setting("CUSTOM_SHIPPING_MODULES")
 
 for extra in extra_shipping:
-    try:
-        load_module("%s.config" % extra)
-    except ImportError:
-        logger.warn("Could not load shipping module configuration: %s" % extra)
+    config_register_module("SHIPPING", "%s.config" % extra)
 
 
 class ShippingModuleNotFound(Exception):
@@ -8,4 +8,6 @@ class TieredWeightZoneConfig(AppConfig):
     verbose_name = "Tiered Weight Zone Shipping"
 
     def ready(self):
-        from . import config
+        from satchmo.configuration.functions import config_register_module
+
+        config_register_module("SHIPPING", "%s.config" % self.name)
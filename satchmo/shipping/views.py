@@ -1,5 +1,4 @@
 import os
-import trml2pdf
 
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.sites.models import Site
@@ -11,6 +10,9 @@ from django.views.decorators.cache import never_cache
 
 from satchmo.configuration.functions import config_value
 from satchmo.shop.models import Config, Order
+from satchmo.utils import LazyImport
+
+trml2pdf = LazyImport("trml2pdf")
 
 
 def displayDoc(request, id, doc):
@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from satchmo import caching
+from satchmo.configuration.functions import ConfigurationSettings
+from satchmo.configuration.models import find_settings
+from satchmo.product.models import Category, Product, load_main_images
+from satchmo.product.templatetags.satchmo_product import product_counts
+from satchmo.shop.models import Config
+
+log = logging.getLogger(__name__)
+
+SECTIONS = ("config", "settings", "categories", "images")
+BATCH_SIZE = 500
+
+
+def _batches(items, size=BATCH_SIZE):
+    for ix in range(0, len(items), size):
+        yield items[ix : ix + size]
+
+
+def _in_thread(func):
+    """Run `func` with its own database connection, closing it afterwards."""
+
+    def inner(*args):
+        try:
+            return func(*args)
+        finally:
+            connections.close_all()
+
+    return inner
+
+
+def _warm_category(category):
+    category.get_all_children()
+    category.get_all_children(include_self=True)
+    category.get_active_children()
+    category.get_active_children(include_self=True)
+
+
+class Command(BaseCommand):
+    help = "Fills the cache with the store configuration, settings, category trees and images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--only",
+            action="append",
+            choices=SECTIONS,
+            dest="sections",
+            help="Only warm this part of the cache, may be given more than once.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of threads used to build category trees and images.",
+        )
+
+    def handle(self, *args, **options):
+        sections = options["sections"] or SECTIONS
+        self.concurrency = max(options["concurrency"], 1)
+
+        started = time.time()
+        for section in SECTIONS:
+            if section in sections:
+                start = time.time()
+                count = getattr(self, "warm_%s" % section)()
+                self.stdout.write(
+                    "Warmed %i %s in %.2fs" % (count, section, time.time() - start)
+                )
+        self.stdout.write("Cache warmed in %.2fs" % (time.time() - started))
+
+    def _map(self, func, items):
+        if self.concurrency == 1:
+            return [func(item) for item in items]
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(_in_thread(func), items))
+
+    def warm_config(self):
+        caching.cache_delete("Config")
+        try:
+            Config.objects.get_current()
+        except Config.DoesNotExist:
+            log.warning("No store configuration to cache")
+            return 0
+        return 1
+
+    def warm_settings(self):
+        count = 0
+        for group in ConfigurationSettings().groups():
+            keys = list(group.keys())
+            find_settings(group.key, keys)
+            count += len(keys)
+        return count
+
+    def warm_categories(self):
+        categories = list(Category.objects.all())
+        self._map(_warm_category, categories)
+        for batch in _batches(categories + [None]):
+            product_counts(batch)
+        return len(categories)
+
+    def warm_images(self):
+        items = list(Category.objects.all())
+        items.extend(Product.objects.active())
+        self._map(load_main_images, list(_batches(items)))
+        return len(items)
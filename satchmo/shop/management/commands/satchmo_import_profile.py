@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a new interpreter, so that nothing is imported yet.
+STARTUP = """
+import django
+django.setup()
+if %(urls)r:
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+for name in %(modules)r:
+    __import__(name)
+"""
+
+
+def profile_imports(urls=True, modules=()):
+    """Start Django in a new interpreter with `python -X importtime`, also
+    importing the URLconf and `modules`.
+
+    Returns a list of (module, self ms, cumulative ms) in import order.
+    """
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            STARTUP % {"urls": urls, "modules": list(modules)},
+        ],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if process.returncode:
+        raise CommandError("Could not start Django:\n%s" % process.stderr[-2000:])
+
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            own, cumulative, name = line[len("import time:") :].split("|")
+            imports.append((name.strip(), int(own) / 1000.0, int(cumulative) / 1000.0))
+        except ValueError:
+            # the header line
+            continue
+    return imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports the modules which take longest to import when starting Django, "
+        "optionally failing if start up takes longer than SATCHMO_STARTUP_BUDGET."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "modules",
+            nargs="*",
+            help="More modules to import after starting, e.g. those a command needs.",
+        )
+        parser.add_argument(
+            "--no-urls",
+            action="store_false",
+            dest="urls",
+            help="Do not import the URLconf, as management commands do not.",
+        )
+        parser.add_argument(
+            "--prefix",
+            default="",
+            help="Only list modules whose names start with this, e.g. satchmo.",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=30, help="Number of modules to list."
+        )
+        parser.add_argument(
+            "--budget",
+            type=float,
+            default=getattr(settings, "SATCHMO_STARTUP_BUDGET", None),
+            help="Fail if importing takes longer than this many milliseconds.",
+        )
+
+    def handle(self, *args, **options):
+        imports = profile_imports(options["urls"], options["modules"])
+        total = sum([own for name, own, cumulative in imports])
+
+        listed = [i for i in imports if i[0].startswith(options["prefix"])]
+        listed.sort(key=lambda i: -i[2])
+        self.stdout.write("%12s %12s  %s" % ("cumulative", "self", "module"))
+        for name, own, cumulative in listed[: options["limit"]]:
+            self.stdout.write("%10.1fms %10.1fms  %s" % (cumulative, own, name))
+        self.stdout.write("Imported %i modules in %.1fms" % (len(imports), total))
+
+        budget = options["budget"]
+        if budget and total > budget:
+            raise CommandError(
+                "Start up took %.1fms, over the budget of %.1fms" % (total, budget)
+            )
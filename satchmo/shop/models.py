@@ -35,7 +35,7 @@ from satchmo.discount.utils import find_discount_for_code
 from satchmo.l10n.models import Country
 from satchmo.payment.fields import PaymentChoiceCharField
 from satchmo.product import signals as product_signals
-from satchmo.product.models import Product, DownloadableProduct
+from satchmo.product.models import Product, DownloadableProduct, price_many
 from satchmo.shipping.fields import ShippingChoiceCharField
 from satchmo.shipping.models import POSTAGE_SPEED_CHOICES, STANDARD
 from satchmo.shop import signals
@@ -114,7 +114,6 @@ class Config(models.Model):
         return self.store_name
 
     def save(self, *args, **kwargs):
-        caching.cache_delete("config")
         # ensure the default country is in shipping countries
         mycountry = self.country
 
@@ -130,7 +129,7 @@ class Config(models.Model):
             log.warning("%s: has no country set", self)
 
         super(Config, self).save(*args, **kwargs)
-        caching.cache_set("Config", value=self)
+        caching.cache_delete("Config")
 
     @property
     def base_url(self):
@@ -326,7 +325,12 @@ class Cart(models.Model):
         return "Shopping Cart (%s)" % self.date_time_created
 
     def __iter__(self):
-        return iter(self.cartitem_set.all())
+        """Iterate over the items, with their prices looked up together."""
+        items = list(
+            self.cartitem_set.select_related("product").prefetch_related("details")
+        )
+        _load_qty_prices(items)
+        return iter(items)
 
     def __len__(self):
         return self.cartitem_set.count()
@@ -440,7 +444,7 @@ class Cart(models.Model):
     @property
     def total(self):
         total = Decimal("0")
-        for item in self.cartitem_set.all():
+        for item in self:
             total += item.line_total
         return total
 
@@ -456,6 +460,21 @@ class NullCartItem(object):
         self.line_total = 0
 
 
+def _load_qty_prices(items):
+    """Look up the quantity prices of many CartItems, with one `price_many`
+    per quantity ordered."""
+    by_qty = {}
+    for item in items:
+        by_qty.setdefault(item.quantity, []).append(item)
+
+    for qty, same in by_qty.items():
+        prices = price_many([item.product for item in same], qty)
+        for item in same:
+            price = prices.get(item.product_id)
+            if price is not None:
+                item._qty_prices = {qty: price}
+
+
 class CartItem(models.Model):
     """
     An individual item in the cart
@@ -505,14 +524,16 @@ class CartItem(models.Model):
     def get_detail_price(self):
         """Get the delta price based on detail modifications"""
         delta = Decimal("0")
-        if self.has_details:
-            for detail in self.details.all():
-                if detail.price_change and detail.value:
-                    delta += detail.price_change
+        for detail in self.details.all():
+            if detail.price_change and detail.value:
+                delta += detail.price_change
         return delta
 
     def get_qty_price(self, qty):
         """Get the price for for each unit before any detail modifications"""
+        prices = getattr(self, "_qty_prices", {})
+        if qty in prices:
+            return prices[qty]
         return self.product.get_qty_price(qty)
 
     def _get_description(self):
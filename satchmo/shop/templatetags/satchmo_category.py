@@ -1,9 +1,9 @@
 import logging
 
-from django.core.cache import cache
 from django.template import Library
 from django.template import Node
 
+from satchmo.caching.models import cache_queryset
 from satchmo.product.models import Category
 from satchmo.shop.templatetags import get_filter_args
 
@@ -36,15 +36,11 @@ def category_tree(id=None):
                 </ul>
         </ul>
     """
-    key = "category_tree_%s" % id
-    if cache.get(key):
-        categories = cache.get(key)
+    if id:
+        categories = Category.objects.filter(parent__id=id)
     else:
-        if id:
-            categories = Category.objects.filter(parent__id=id)
-        else:
-            categories = Category.objects.root_categories()
-        cache.set(key, categories, 86400)
+        categories = Category.objects.root_categories()
+    categories = cache_queryset(categories, ("category_tree", id), length=86400)
     return {"categories": categories}
 
 
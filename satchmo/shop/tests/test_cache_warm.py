@@ -0,0 +1,41 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from satchmo import caching
+from satchmo.product.factories import ProductFactory
+from satchmo.product.models import Category
+from satchmo.shop.factories import ShopConfigFactory
+
+
+class CacheWarmTest(TestCase):
+    def tearDown(self):
+        caching.cache_delete()
+
+    def test_warms_config_and_images(self):
+        ShopConfigFactory()
+        category = Category.objects.create(name="Shirts", active=True)
+        product = ProductFactory()
+        product.category.add(category)
+        caching.cache_delete()
+
+        out = StringIO()
+        call_command("satchmo_cache_warm", stdout=out)
+
+        self.assertIn("Warmed 1 config", out.getvalue())
+        self.assertIn("Warmed 2 images", out.getvalue())
+        self.assertTrue(caching.cache_get("Config", default=None))
+        hits, misses = caching.cache_get_many(
+            [
+                ("Product_get_mainImage", product.id),
+                ("Category_get_mainImage", category.id),
+            ]
+        )
+        self.assertEqual(misses, [])
+
+    def test_only(self):
+        out = StringIO()
+        call_command("satchmo_cache_warm", only=["settings"], stdout=out)
+        self.assertIn("settings", out.getvalue())
+        self.assertNotIn("images", out.getvalue())
@@ -3,9 +3,11 @@ from decimal import Decimal
 from django.test import TestCase
 
 from satchmo.caching import cache_delete
-from satchmo.product.factories import ProductFactory
+from satchmo.currency.factories import EURCurrencyFactory
+from satchmo.product.factories import PriceFactory, ProductFactory
 from satchmo.product.models import Product
 from satchmo.shop.satchmo_settings import get_satchmo_setting
+from satchmo.shop.factories import CartItemFactory
 from satchmo.shop.models import Cart, Config
 
 
@@ -138,3 +140,29 @@ class CartTest(TestCase):
         self.assertEqual(item1.unit_price, Decimal("20.00"))
         self.assertEqual(item2.unit_price, Decimal("23.00"))
         self.assertEqual(cart.total, Decimal("43.00"))
+
+
+class CartPriceTest(TestCase):
+    def setUp(self):
+        EURCurrencyFactory(primary=True)
+
+    def tearDown(self):
+        cache_delete()
+
+    def test_total(self):
+        cart = Cart()
+        cart.save()
+        for ix in range(3):
+            price = PriceFactory(quantity=2, price=Decimal("4.00"))
+            CartItemFactory(cart=cart, product=price.product, quantity=5)
+        CartItemFactory(cart=cart, product=ProductFactory(), quantity=1)
+        expected = sum(
+            item.product.get_qty_price(item.quantity) * item.quantity
+            for item in cart.cartitem_set.all()
+        )
+
+        self.assertEqual(cart.total, expected)
+        # the items, their details and one price lookup for quantity 5
+        with self.assertNumQueries(3):
+            cart.total
+        self.assertEqual(expected, Decimal("4.00") * 15 + ProductFactory.unit_price)
@@ -0,0 +1,100 @@
+from io import StringIO
+from unittest import mock, skipUnless
+import os
+import subprocess
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+
+from satchmo.shop.management.commands import satchmo_import_profile
+from satchmo.shop.management.commands.satchmo_import_profile import profile_imports
+
+# As printed by "python -X importtime", in microseconds.
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       200 |        200 | _io
+import time:      1500 |       1500 |   satchmo.utils
+import time:      3000 |       4500 | satchmo
+import time:     10000 |      10000 | django
+Traceback lines and other output are ignored
+"""
+
+# The budget of the opt in start up check, in milliseconds, from the
+# environment or settings.
+STARTUP_BUDGET = os.environ.get("SATCHMO_STARTUP_BUDGET") or getattr(
+    settings, "SATCHMO_STARTUP_BUDGET", None
+)
+
+
+def _importtime(returncode=0, stderr=IMPORTTIME):
+    return mock.patch.object(
+        satchmo_import_profile.subprocess,
+        "run",
+        return_value=subprocess.CompletedProcess([], returncode, "", stderr),
+    )
+
+
+class ImportProfileTest(SimpleTestCase):
+    def test_parsed(self):
+        with _importtime() as run:
+            imports = profile_imports(modules=["satchmo.shop.views.cart"])
+        self.assertEqual(
+            imports,
+            [
+                ("_io", 0.2, 0.2),
+                ("satchmo.utils", 1.5, 1.5),
+                ("satchmo", 3.0, 4.5),
+                ("django", 10.0, 10.0),
+            ],
+        )
+        args = run.call_args[0][0]
+        self.assertEqual(args[1:3], ["-X", "importtime"])
+        self.assertIn("satchmo.shop.views.cart", args[-1])
+
+    def test_not_started(self):
+        with _importtime(returncode=1, stderr="ImproperlyConfigured: oops"):
+            self.assertRaises(CommandError, profile_imports)
+
+    def test_output(self):
+        out = StringIO()
+        with _importtime():
+            call_command(
+                "satchmo_import_profile", prefix="satchmo", limit=1, stdout=out
+            )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[1].split(), ["4.5ms", "3.0ms", "satchmo"])
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[2], "Imported 4 modules in 14.7ms")
+
+    def test_over_budget(self):
+        with _importtime():
+            call_command("satchmo_import_profile", budget=15, stdout=StringIO())
+            self.assertRaises(
+                CommandError,
+                call_command,
+                "satchmo_import_profile",
+                budget=14,
+                stdout=StringIO(),
+            )
+
+    def test_optional_dependencies_are_lazy(self):
+        imports = profile_imports(
+            modules=[
+                "satchmo.currency.utils",
+                "satchmo.l10n.utils",
+                "satchmo.payment.modules.paypal.views",
+                "satchmo.shipping.views",
+                "satchmo.shop.views.cart",
+            ]
+        )
+        names = set([name.split(".")[0] for name, own, cumulative in imports])
+        self.assertIn("satchmo", names)
+        for name in ("geoip2", "paypalrestsdk", "trml2pdf"):
+            self.assertNotIn(name, names)
+
+    @skipUnless(STARTUP_BUDGET, "SATCHMO_STARTUP_BUDGET is not set")
+    def test_startup_within_budget(self):
+        out = StringIO()
+        call_command("satchmo_import_profile", budget=float(STARTUP_BUDGET), stdout=out)
+        self.assertIn("satchmo.shop.urls", out.getvalue())
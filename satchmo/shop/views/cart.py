@@ -2,7 +2,6 @@ import json
 from decimal import Decimal
 
 from django.conf import settings
-from django.contrib.gis.geoip2 import GeoIP2
 from django.urls import reverse
 from django.http import HttpResponseRedirect, HttpResponse
 from django.shortcuts import render
@@ -10,7 +9,6 @@ from django.utils.datastructures import MultiValueDictKeyError
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext as _
 
-from geoip2.errors import AddressNotFoundError
 from ipware.ip import get_real_ip
 
 from satchmo.configuration.functions import config_value
@@ -30,12 +28,15 @@ from satchmo.shop.signals import (
     satchmo_cart_details_query,
 )
 from satchmo.shop.views.utils import bad_or_missing
-from satchmo.utils import trunc_decimal
+from satchmo.utils import LazyImport, trunc_decimal
 
 import logging
 
 log = logging.getLogger(__name__)
 
+GeoIP2 = LazyImport("django.contrib.gis.geoip2", "GeoIP2")
+geoip2_errors = LazyImport("geoip2.errors")
+
 NOTSET = object()
 
 
@@ -132,7 +133,7 @@ def display(request, cart=None, error_message="", default_view_tax=NOTSET):
             geoip = GeoIP2()
             try:
                 ip_country = geoip.country(ip)
-            except AddressNotFoundError:
+            except geoip2_errors.AddressNotFoundError:
                 pass
             else:
                 try:
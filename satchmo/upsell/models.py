@@ -73,9 +73,8 @@ class Upsell(models.Model, CachedObjectMixin):
 
     def save(self, *args, **kwargs):
         self.create_date = datetime.date.today()
-        self.cache_delete()
         super(Upsell, self).save(*args, **kwargs)
-        self.cache_set()
+        self.cache_delete()
         return self
 
     class Meta:
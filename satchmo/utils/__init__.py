@@ -139,6 +139,43 @@ def load_once(key, module):
     return load_module(module)
 
 
+class LazyImport(object):
+    """Stands in for a module, or for `attr` of it, which is only imported
+    when first used, so that optional and slow to import dependencies do not
+    add to the start up time of every process.
+
+        requests = LazyImport("requests")
+        GeoIP2 = LazyImport("django.contrib.gis.geoip2", "GeoIP2")
+    """
+
+    def __init__(self, module, attr=None):
+        self._lazy_module = module
+        self._lazy_attr = attr
+        self._lazy_target = None
+
+    def _load(self):
+        if self._lazy_target is None:
+            target = load_module(self._lazy_module)
+            if self._lazy_attr:
+                target = getattr(target, self._lazy_attr)
+            self._lazy_target = target
+        return self._lazy_target
+
+    def __getattr__(self, name):
+        if name.startswith("_lazy_"):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        name = self._lazy_module
+        if self._lazy_attr:
+            name = "%s.%s" % (name, self._lazy_attr)
+        return "<LazyImport %s>" % name
+
+
 def normalize_dir(dir_name):
     if not dir_name.startswith("./"):
         dir_name = url_join(".", dir_name)